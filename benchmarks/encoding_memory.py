@@ -0,0 +1,134 @@
+"""Measures the peak memory of rendering and encoding one image.
+
+Each job paints a map like image and encodes it as PNG, in a fresh process so
+the peak RSS (`ru_maxrss`) belongs to that job only. The former encoding
+paths, which copied the pixels up to three times, are compared with the
+current one, which renders in the `render_format` of the job and hands a
+view of the pixels to the encoder:
+
+- `legend-before`: `convertToFormat` and `asstring` copies
+- `render-before`: the pixels shared with the renderer are detached by
+  `setDotsPerMeterX`, converted in place and copied by `asstring`
+- `view`: `encode_image` on an image in its `render_format`
+
+It needs PyQt5 and fpng-py like the worker, but no QGIS and no redis.
+
+    python benchmarks/encoding_memory.py --size 4096
+"""
+
+import argparse
+import random
+import resource
+import subprocess
+import sys
+import time
+
+VARIANTS = ["legend-before", "render-before", "view"]
+
+
+def paint(size: int, image_format):
+    from PyQt5.QtCore import QRectF, Qt
+    from PyQt5.QtGui import QColor, QImage, QPainter
+
+    image = QImage(size, size, image_format)
+    image.fill(Qt.transparent)
+    painter = QPainter(image)
+    painter.setRenderHint(QPainter.Antialiasing, True)
+    shapes = random.Random(0)
+    for _ in range(2000):
+        painter.setBrush(
+            QColor(
+                shapes.randrange(256),
+                shapes.randrange(256),
+                shapes.randrange(256),
+                shapes.randrange(64, 256),
+            )
+        )
+        painter.drawEllipse(
+            QRectF(
+                shapes.uniform(0, size),
+                shapes.uniform(0, size),
+                shapes.uniform(4, size / 8),
+                shapes.uniform(4, size / 8),
+            )
+        )
+    painter.end()
+    return image
+
+
+def job(variant: str, size: int, fmt: str) -> int:
+    """Renders and encodes one image, returns the size of the encoded image."""
+    from fpng_py import CompressionFlags, fpng_encode_image_to_memory
+    from PyQt5.QtGui import QImage
+
+    from qgis_server_light.worker.image_utils import encode_image, render_format
+
+    if variant == "view":
+        image = paint(size, render_format(fmt))
+        return len(encode_image(image, fmt)[1])
+    if variant == "legend-before":
+        image = paint(size, QImage.Format_ARGB32)
+        image = image.convertToFormat(QImage.Format_RGBA8888)
+    else:
+        image = paint(size, QImage.Format_ARGB32_Premultiplied)
+        renderer_image = QImage(image)  # noqa: F841, held by the renderer
+        image.setDotsPerMeterX(3780)
+        image.convertTo(QImage.Format_RGBA8888)
+    return len(
+        fpng_encode_image_to_memory(
+            image.constBits().asstring(image.sizeInBytes()),
+            image.width(),
+            image.height(),
+            0,
+            CompressionFlags.NONE,
+        )
+    )
+
+
+def run_job(args) -> None:
+    from PyQt5.QtGui import QGuiApplication
+
+    app = QGuiApplication([])  # noqa: F841, Qt needs it for the image plugins
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    size = job(args.job, args.size, args.format)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux
+    print(f"{(peak - before) / 1024:.0f} {elapsed * 1e3:.0f} {size}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=4096, help="width and height")
+    parser.add_argument("--format", default="image/png", help="of the view variant")
+    parser.add_argument("--variants", nargs="+", choices=VARIANTS, default=VARIANTS)
+    parser.add_argument("--job", choices=VARIANTS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.job is not None:
+        run_job(args)
+        return
+
+    print(f"{'variant':>14} {'peak RSS':>10} {'time':>8} {'bytes':>10}")
+    for variant in args.variants:
+        output = subprocess.run(
+            [
+                sys.executable,
+                __file__,
+                "--job",
+                variant,
+                "--size",
+                str(args.size),
+                "--format",
+                args.format,
+            ],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        peak, elapsed, size = output.split()
+        print(f"{variant:>14} {peak:>8}MB {elapsed:>6}ms {size:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Compares the image encoders for size and speed on real rendered tiles.
+
+By default the expected render results of the tests are sliced into tiles,
+a directory of PNG tiles (e.g. written by `seed_tiles`) can be passed
+instead. For each format the mean size of an encoded tile and the mean time
+to encode one are reported. It needs PyQt5, fpng-py, simplejpeg and numpy
+like the worker, but no QGIS and no redis.
+
+    python benchmarks/image_encoders.py --tile-size 256 --repeat 5
+"""
+
+import argparse
+import glob
+import os
+import time
+
+from PyQt5.QtCore import QRect
+from PyQt5.QtGui import QGuiApplication, QImage
+
+from qgis_server_light.worker.image_utils import encode_image, render_format
+
+RESOURCES = os.path.join(
+    os.path.dirname(__file__), os.pardir, "tests", "resources", "data"
+)
+
+FORMATS = [
+    "image/png",
+    "image/png; compression=slower",
+    "image/png; compression=smallest",
+    "image/png; mode=8bit",
+    "image/jpeg; quality=75",
+    "image/jpeg; quality=90",
+    "image/webp",
+    "image/webp; quality=100",
+]
+
+
+def load_tiles(directory: str | None, tile_size: int) -> list[QImage]:
+    if directory is not None:
+        paths = glob.glob(os.path.join(directory, "**", "*.png"), recursive=True)
+        return [QImage(path) for path in sorted(paths)]
+    tiles = []
+    for path in sorted(glob.glob(os.path.join(RESOURCES, "*.expected_result.png"))):
+        image = QImage(path).convertToFormat(QImage.Format_ARGB32_Premultiplied)
+        for y in range(0, image.height() - tile_size + 1, tile_size):
+            for x in range(0, image.width() - tile_size + 1, tile_size):
+                tiles.append(image.copy(QRect(x, y, tile_size, tile_size)))
+    return tiles
+
+
+def measure(tiles: list[QImage], fmt: str, repeat: int) -> tuple[float, float]:
+    sizes = []
+    elapsed = 0.0
+    for _ in range(repeat):
+        # rendered like the runners do, the encoders may convert them in place
+        images = [tile.convertToFormat(render_format(fmt)) for tile in tiles]
+        start = time.perf_counter()
+        for image in images:
+            sizes.append(len(encode_image(image, fmt)[1]))
+        elapsed += time.perf_counter() - start
+    return sum(sizes) / len(sizes), elapsed / len(sizes)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tiles", help="directory of PNG tiles to encode")
+    parser.add_argument("--tile-size", type=int, default=256)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--formats", nargs="+", default=FORMATS)
+    args = parser.parse_args()
+
+    app = QGuiApplication([])  # noqa: F841, Qt needs it for the image plugins
+    tiles = load_tiles(args.tiles, args.tile_size)
+    if not tiles:
+        parser.error("no tiles found")
+    print(f"{len(tiles)} tiles")
+    print(f"{'format':>34} {'bytes':>9} {'encode':>10}")
+    for fmt in args.formats:
+        try:
+            size, elapsed = measure(tiles, fmt, args.repeat)
+        except RuntimeError as e:
+            print(f"{fmt:>34} skipped: {e}")
+            continue
+        print(f"{fmt:>34} {size:>9.0f} {elapsed * 1e3:>8.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""Compares the job codecs on realistic job infos.
+
+The xsdata JSON binding (which is used when no codec is named) is compared
+with the `fast` codec, for the time to encode a job info in the dispatcher,
+the time to decode it in the worker and the size of the encoded job. The
+jobs carry layers with compressed and base64 encoded QML styles, like the
+ones the exporter produces. No redis and no QGIS are needed.
+
+    python benchmarks/job_codec.py --layers 1 10 50
+"""
+
+import argparse
+import base64
+import json
+import timeit
+import zlib
+
+from qgis_server_light.interface.common import BBox, Style
+from qgis_server_light.interface.job.codec import (
+    FastJobCodec,
+    JobCodec,
+    XsdataJsonCodec,
+)
+from qgis_server_light.interface.job.common.input import OgcFilter110, QslJobLayer
+from qgis_server_light.interface.job.feature.input import (
+    FeatureQuery,
+    QslJobInfoFeature,
+    QslJobParameterFeature,
+)
+from qgis_server_light.interface.job.render.input import (
+    QslJobInfoRender,
+    QslJobParameterRender,
+)
+
+
+def style_definition(rules: int) -> str:
+    """A rule based QML style, compressed and encoded like an exported one."""
+    rule_xml = "".join(
+        f'<rule key="{{{index:08x}-0000-0000-0000-000000000000}}" '
+        f'filter="&quot;class&quot; = \'{index}\'" symbol="{index}" '
+        f'label="Class {index}"/>'
+        for index in range(rules)
+    )
+    symbol_xml = "".join(
+        f'<symbol name="{index}" type="fill" alpha="1"><layer class="SimpleFill">'
+        f'<Option type="Map"><Option name="color" value="{index % 255},120,40,255" '
+        f'type="QString"/><Option name="outline_width" value="0.26" '
+        f'type="QString"/></Option></layer></symbol>'
+        for index in range(rules)
+    )
+    qml = (
+        '<!DOCTYPE qgis><qgis version="3.40" styleCategories="Symbology">'
+        f'<renderer-v2 type="RuleRenderer"><rules key="root">{rule_xml}</rules>'
+        f"<symbols>{symbol_xml}</symbols></renderer-v2></qgis>"
+    )
+    return base64.urlsafe_b64encode(zlib.compress(qml.encode())).decode()
+
+
+def layers(count: int, rules: int) -> list[QslJobLayer]:
+    definition = style_definition(rules)
+    return [
+        QslJobLayer(
+            id=f"layer_{index}",
+            name=f"Layer {index}",
+            source=json.dumps({"path": f"data_{index}.gpkg", "layerName": "data"}),
+            remote=False,
+            folder_name="project",
+            driver="ogr",
+            style=Style(name="default", definition=definition),
+            filter=(
+                OgcFilter110(definition="<Filter><PropertyIsEqualTo/></Filter>")
+                if index % 5 == 0
+                else None
+            ),
+        )
+        for index in range(count)
+    ]
+
+
+def render_job(count: int, rules: int) -> QslJobInfoRender:
+    return QslJobInfoRender(
+        id="8c0a5c1e-0b7e-4f6b-9d55-9d2f3c8d1a10",
+        type="QslJobParameterRender",
+        job=QslJobParameterRender(
+            layers=layers(count, rules),
+            bbox=BBox(
+                x_min=2600000.0, x_max=2601000.0, y_min=1200000.0, y_max=1201000.0
+            ),
+            crs="EPSG:2056",
+            width=512,
+            height=512,
+            dpi=96,
+        ),
+    )
+
+
+def feature_job(count: int, rules: int) -> QslJobInfoFeature:
+    return QslJobInfoFeature(
+        id="0d3c7a3e-3a53-4c5e-a2b2-2f1a0c4b6e71",
+        type="QslJobParameterFeature",
+        job=QslJobParameterFeature(
+            queries=[FeatureQuery(layers=layers(count, rules), aliases=["a"])],
+            count=100,
+        ),
+    )
+
+
+def measure(codec: JobCodec, job_info, repeat: int) -> tuple[float, float, int]:
+    data = codec.encode(job_info)
+    # the worker reads the job info as decoded string from redis
+    text = data.decode() if isinstance(data, bytes) else data
+    assert codec.decode(text, type(job_info)) == job_info
+    encode = min(timeit.repeat(lambda: codec.encode(job_info), number=repeat, repeat=3))
+    decode = min(
+        timeit.repeat(
+            lambda: codec.decode(text, type(job_info)), number=repeat, repeat=3
+        )
+    )
+    return encode / repeat, decode / repeat, len(data)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--layers", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--rules", type=int, default=20, help="style rules per layer")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    codecs = [XsdataJsonCodec(), FastJobCodec()]
+    print(
+        f"{'job':>8} {'layers':>6} {'codec':>7} {'encode':>10} {'decode':>10} "
+        f"{'bytes':>9}"
+    )
+    for count in args.layers:
+        for name, job_info in (
+            ("render", render_job(count, args.rules)),
+            ("feature", feature_job(count, args.rules)),
+        ):
+            for codec in codecs:
+                encode, decode, size = measure(codec, job_info, args.repeat)
+                print(
+                    f"{name:>8} {count:>6} {codec.name:>7} {encode * 1e6:>8.0f}us "
+                    f"{decode * 1e6:>8.0f}us {size:>9}"
+                )
+
+
+if __name__ == "__main__":
+    main()
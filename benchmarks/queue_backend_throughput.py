@@ -0,0 +1,127 @@
+"""Compares the job throughput of the list + pub/sub queue backend with the
+redis streams backend.
+
+Workers are simulated by threads which claim jobs and answer them with a small
+result right away, so only the queue overhead is measured. No QGIS is needed.
+
+    python benchmarks/queue_backend_throughput.py --redis-url redis://localhost:1234
+
+Be aware that the benchmark flushes the passed redis database.
+"""
+
+import argparse
+import asyncio
+import threading
+import time
+import uuid
+
+from redis import Redis
+
+from qgis_server_light.interface.common import BBox
+from qgis_server_light.interface.dispatcher.common import Status
+from qgis_server_light.interface.dispatcher.envelope import encode_result
+from qgis_server_light.interface.dispatcher.redis_asio import RedisQueue
+from qgis_server_light.interface.dispatcher.redis_stream_asio import RedisStreamQueue
+from qgis_server_light.interface.job.common.output import JobResult
+from qgis_server_light.interface.job.render.input import QslJobParameterRender
+from qgis_server_light.worker.claim import (
+    JobClaimer,
+    RedisJobClaimer,
+    RedisStreamJobClaimer,
+)
+
+
+def simulated_worker(claimer: JobClaimer, stop: threading.Event):
+    pipeline = claimer.client.pipeline()
+    while not stop.is_set():
+        claimed = claimer.claim(1)
+        if claimed is None or claimed.info is None:
+            continue
+        result = JobResult(
+            id=claimed.id,
+            data=b"\x89PNG" * 256,
+            content_type="png",
+            status=Status.SUCCESS.value,
+        )
+        pipeline.hset(
+            f"job:{claimed.id}", RedisQueue.job_status_key, Status.SUCCESS.value
+        )
+        claimer.publish(pipeline, claimed, encode_result(result), Status.SUCCESS.value)
+        claimer.release(pipeline, claimed)
+        pipeline.execute()
+
+
+async def post_jobs(queue: RedisQueue, jobs: int, concurrency: int) -> int:
+    semaphore = asyncio.Semaphore(concurrency)
+    job_parameter = QslJobParameterRender(
+        layers=[],
+        bbox=BBox(x_min=0.0, x_max=1.0, y_min=0.0, y_max=1.0),
+        crs="EPSG:2056",
+        width=256,
+        height=256,
+    )
+
+    async def post():
+        async with semaphore:
+            _, status = await queue.post(job_parameter, to=30.0)
+            return status == Status.SUCCESS.value
+
+    results = await asyncio.gather(*(post() for _ in range(jobs)))
+    return sum(results)
+
+
+def measure(name: str, args, queue_class, create_claimer):
+    client = Redis.from_url(args.redis_url, decode_responses=True)
+    client.flushdb()
+    stop = threading.Event()
+    workers = [
+        threading.Thread(
+            target=simulated_worker,
+            args=(create_claimer(client, str(uuid.uuid4())), stop),
+        )
+        for _ in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+
+    async def run():
+        queue = queue_class.create(args.redis_url)
+        start = time.perf_counter()
+        succeeded = await post_jobs(queue, args.jobs, args.concurrency)
+        elapsed = time.perf_counter() - start
+        await queue.close()
+        return succeeded, elapsed
+
+    succeeded, elapsed = asyncio.run(run())
+    stop.set()
+    for worker in workers:
+        worker.join()
+    client.flushdb()
+    print(
+        f"{name:>7}: {succeeded}/{args.jobs} jobs succeeded in {elapsed:.2f}s, "
+        f"{args.jobs / elapsed:.0f} jobs/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--redis-url", type=str, default="redis://localhost:1234")
+    parser.add_argument("--jobs", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=4)
+    args = parser.parse_args()
+
+    measure("list", args, RedisQueue, RedisJobClaimer)
+    measure(
+        "stream",
+        args,
+        RedisStreamQueue,
+        lambda client, worker_id: RedisStreamJobClaimer(
+            client, worker_id, batch_size=args.batch_size
+        ),
+    )
+
+
+if __name__ == "__main__":
+    main()
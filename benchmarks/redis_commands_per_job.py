@@ -0,0 +1,138 @@
+"""Counts the redis round trips a worker needs to claim and finish one job.
+
+It compares the former `BLPOP` based path of `RedisEngine.run` with the
+`RedisJobClaimer`. No QGIS is needed, the actual job processing is skipped.
+
+    python benchmarks/redis_commands_per_job.py --redis-url redis://localhost:1234
+
+Be aware that the benchmark flushes the passed redis database.
+"""
+
+import argparse
+import datetime
+import time
+import uuid
+
+from redis import Redis
+from redis.client import Pipeline
+
+from qgis_server_light.interface.dispatcher.common import Status
+from qgis_server_light.interface.dispatcher.redis_asio import RedisQueue
+from qgis_server_light.worker.claim import RedisJobClaimer
+
+
+class Counter:
+    def __init__(self):
+        self.round_trips = 0
+        self.commands = 0
+
+
+class CountingPipeline(Pipeline):
+    counter: Counter
+
+    def execute(self, raise_on_error=True):
+        if self.command_stack:
+            self.counter.round_trips += 1
+            self.counter.commands += len(self.command_stack)
+        return super().execute(raise_on_error)
+
+
+class CountingRedis(Redis):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.counter = Counter()
+
+    def execute_command(self, *args, **options):
+        self.counter.round_trips += 1
+        self.counter.commands += 1
+        return super().execute_command(*args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        pipeline = CountingPipeline(
+            self.connection_pool, self.response_callbacks, transaction, shard_hint
+        )
+        pipeline.counter = self.counter
+        return pipeline
+
+
+def queue_jobs(client: Redis, count: int):
+    with client.pipeline() as p:
+        for _ in range(count):
+            job_id = str(uuid.uuid4())
+            p.hset(f"job:{job_id}", RedisQueue.job_info_key, "{}" * 512)
+            p.hset(f"job:{job_id}", RedisQueue.job_info_type_key, "QslJobInfoRender")
+            p.rpush(RedisQueue.job_queue_name, job_id)
+        p.execute()
+
+
+def queue_status(pipeline: Pipeline, job_id: str, status: str):
+    ts = datetime.datetime.now().isoformat()
+    pipeline.hset(f"job:{job_id}", RedisQueue.job_status_key, status)
+    pipeline.hset(f"job:{job_id}", f"{RedisQueue.job_timestamp_key}.{status}", ts)
+    pipeline.hset(f"job:{job_id}", RedisQueue.job_last_update_key, ts)
+    pipeline.hset(f"job:{job_id}", RedisQueue.job_duration_key, "0.0")
+
+
+def legacy_job(client: Redis, pipeline: Pipeline):
+    _, job_id = client.blpop([RedisQueue.job_queue_name], 1)
+    queue_status(pipeline, job_id, Status.RUNNING.value)
+    pipeline.execute()
+    client.hget(f"job:{job_id}", RedisQueue.job_info_key)
+    client.hget(f"job:{job_id}", RedisQueue.job_info_type_key)
+    started = client.counter.round_trips
+    queue_status(pipeline, job_id, Status.SUCCESS.value)
+    pipeline.execute()
+    pipeline.publish(f"{RedisQueue.job_channel_name}:{job_id}", b"result")
+    pipeline.execute()
+    return started
+
+
+def claimer_job(client: Redis, pipeline: Pipeline, claimer: RedisJobClaimer):
+    claimed = claimer.claim(1)
+    started = client.counter.round_trips
+    queue_status(pipeline, claimed.id, Status.SUCCESS.value)
+    claimer.publish(pipeline, claimed, b"result", Status.SUCCESS.value)
+    claimer.release(pipeline, claimed)
+    pipeline.execute()
+    return started
+
+
+def measure(name: str, client: CountingRedis, jobs: int, process_job):
+    client.flushdb()
+    queue_jobs(client, jobs)
+    client.counter = Counter()
+    pipeline = client.pipeline()
+    before_work = 0
+    start = time.perf_counter()
+    for _ in range(jobs):
+        round_trips = client.counter.round_trips
+        before_work += process_job(client, pipeline) - round_trips
+    elapsed = time.perf_counter() - start
+    print(
+        f"{name:>8}: {before_work / jobs:.2f} round trips before work starts, "
+        f"{client.counter.round_trips / jobs:.2f} round trips and "
+        f"{client.counter.commands / jobs:.2f} commands per job, "
+        f"{jobs / elapsed:.0f} jobs/s"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--redis-url", type=str, default="redis://localhost:1234")
+    parser.add_argument("--jobs", type=int, default=1000)
+    args = parser.parse_args()
+
+    client = CountingRedis.from_url(args.redis_url, decode_responses=True)
+    measure("legacy", client, args.jobs, legacy_job)
+    claimer = RedisJobClaimer(client, str(uuid.uuid4()))
+    measure(
+        "claimer",
+        client,
+        args.jobs,
+        lambda c, p: claimer_job(c, p, claimer),
+    )
+    client.flushdb()
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,9 @@ with open(os.path.join(here, "requirements.interface.txt")) as f:
     install_requires = f.read().splitlines()
 
 tests_require = ["pytest", "pytest-cov"]  # includes virtualenv
+interface_scripts = [
+    "queue_telemetry=qgis_server_light.interface.dispatcher.telemetry:main",
+]
 worker_files = {}
 worker_modules = []
 worker_packages = []
@@ -21,14 +24,27 @@ if os.environ.get("WITH_WORKER", False):
 
     worker_files = {"qgis_server_light.worker": ["**/*.py"]}
     worker_modules = [
+        "qgis_server_light/worker/claim",
+        "qgis_server_light/worker/definitions",
         "qgis_server_light/worker/engine",
+        "qgis_server_light/worker/heartbeat",
         "qgis_server_light/worker/image_utils",
+        "qgis_server_light/worker/invalidation",
+        "qgis_server_light/worker/layer_cache",
+        "qgis_server_light/worker/metrics",
+        "qgis_server_light/worker/prefork",
         "qgis_server_light/worker/qgis",
         "qgis_server_light/worker/redis",
         "qgis_server_light/worker/runner",
+        "qgis_server_light/worker/seed",
+        "qgis_server_light/worker/tile_store",
+        "qgis_server_light/worker/timing",
     ]
     worker_packages = ["qgis_server_light.worker"]
-    worker_scripts = ["redis_worker=qgis_server_light.worker.redis:main"]
+    worker_scripts = [
+        "redis_worker=qgis_server_light.worker.redis:main",
+        "seed_tiles=qgis_server_light.worker.seed:main",
+    ]
 
 package_data = {"qgis_server_light.interface": ["**/*.py"]}
 package_data.update(worker_files)
@@ -70,5 +86,5 @@ setup(
         "Issue Tracker": "https://github.com/opengisch/qgis-server-light/issues",
     },
     install_requires=install_requires,
-    entry_points={"console_scripts": [] + worker_scripts},
+    entry_points={"console_scripts": interface_scripts + worker_scripts},
 )
@@ -0,0 +1,272 @@
+"""A result cache for render, tile and legend jobs which is shared by all
+dispatchers through redis.
+
+Jobs are addressed by their content: the canonical hash of a job parameter
+only depends on what is rendered (layers, styles, filters, extent, size, crs,
+format), never on the job id. Identical requests therefore hit the same entry
+and the hash can be handed out as an ETag.
+
+Each entry is indexed by the ids of its layers and the hashes of its styles,
+so all entries depending on changed data or a new export can be dropped at
+once.
+"""
+
+import dataclasses
+import hashlib
+import json
+import time
+from xml.etree import ElementTree
+
+from redis import asyncio as redis_aio
+
+from qgis_server_light.interface.common import Style
+from qgis_server_light.interface.dispatcher.envelope import (
+    decode_result,
+    encode_result,
+)
+from qgis_server_light.interface.job.common.input import (
+    AbstractFilter,
+    QslJobParameter,
+)
+from qgis_server_light.interface.job.common.output import JobResult
+from qgis_server_light.interface.job.legend.input import QslJobParameterLegend
+from qgis_server_light.interface.job.render.input import QslJobParameterRender
+from qgis_server_light.interface.job.tile.input import QslJobParameterTile
+
+DEFAULT_MAX_ENTRY_SIZE = 2 * 1024 * 1024
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+# Deletes all entries listed in the index set KEYS[1] and the index itself.
+INVALIDATE_SCRIPT = """
+local entries = redis.call("SMEMBERS", KEYS[1])
+for i = 1, #entries, 1000 do
+    redis.call("DEL", unpack(entries, i, math.min(i + 999, #entries)))
+end
+redis.call("DEL", KEYS[1])
+return #entries
+"""
+
+# Stores the entry KEYS[1] with the data ARGV[1] for ARGV[2] seconds. All
+# entries are listed in the sorted set KEYS[2] by the time they expire, their
+# sizes in the hash KEYS[3] and the sum of them in KEYS[4]. Entries which are
+# about to expire are dropped until all together take at most ARGV[4] bytes
+# (0 for no limit). ARGV[3] is the current time.
+STORE_SCRIPT = """
+local now = tonumber(ARGV[3])
+local max_size = tonumber(ARGV[4])
+local function forget(entry)
+    local size = redis.call("HGET", KEYS[3], entry)
+    redis.call("ZREM", KEYS[2], entry)
+    redis.call("HDEL", KEYS[3], entry)
+    if size then
+        redis.call("DECRBY", KEYS[4], size)
+    end
+end
+forget(KEYS[1])
+-- expired entries are gone already, only their sizes are left
+for _, entry in ipairs(redis.call("ZRANGEBYSCORE", KEYS[2], "-inf", now)) do
+    forget(entry)
+end
+redis.call("SET", KEYS[1], ARGV[1], "EX", ARGV[2])
+redis.call("ZADD", KEYS[2], now + tonumber(ARGV[2]), KEYS[1])
+redis.call("HSET", KEYS[3], KEYS[1], #ARGV[1])
+local size = redis.call("INCRBY", KEYS[4], #ARGV[1])
+local dropped = 0
+while max_size > 0 and size > max_size do
+    local first = redis.call("ZRANGE", KEYS[2], 0, 1)
+    local oldest = first[1]
+    if oldest == KEYS[1] then
+        oldest = first[2]
+    end
+    if oldest == nil then
+        break
+    end
+    forget(oldest)
+    redis.call("DEL", oldest)
+    size = tonumber(redis.call("GET", KEYS[4]))
+    dropped = dropped + 1
+end
+return dropped
+"""
+
+
+def canonical_job_hash(job_parameter: QslJobParameter) -> str:
+    """Computes a hash which is equal for all job parameters describing the
+    same output.
+
+    Args:
+        job_parameter: The parameter of the job.
+
+    Returns:
+        The hex encoded sha256 of the canonical representation.
+    """
+    canonical = json.dumps(
+        [job_parameter.__class__.__name__, dataclasses.asdict(job_parameter)],
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def job_etag(job_parameter: QslJobParameter) -> str:
+    """The strong HTTP ETag of the output of a job."""
+    return f'"{canonical_job_hash(job_parameter)}"'
+
+
+def style_hash(style: Style) -> str:
+    """The hash of a style definition, used to invalidate entries rendered
+    with it.
+    """
+    return hashlib.sha256(style.definition.encode()).hexdigest()
+
+
+def filter_hash(layer_filter: AbstractFilter) -> str:
+    """The hash of a filter which is equal for filters only differing in
+    their XML formatting (whitespace between elements and around texts,
+    attribute order or namespace prefixes).
+    """
+    try:
+        definition = ElementTree.canonicalize(
+            layer_filter.definition, strip_text=True, rewrite_prefixes=True
+        )
+    except ElementTree.ParseError:
+        definition = layer_filter.definition
+    canonical = f"{layer_filter.__class__.__name__}:{definition}"
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class RenderResultCache:
+    """Caches the results of render, tile and legend jobs in redis.
+
+    Workers rendering a metatile store the other tiles of it in here as
+    well, with the same keys and `STORE_SCRIPT`, so all entries share one
+    size budget.
+
+    Attributes:
+        client: The redis client.
+        ttl: Seconds an entry is kept.
+        max_entry_size: Serialized results bigger than this (in bytes) are
+            not cached, so a few huge images can't push everything else out.
+        max_size: The entries expiring first are dropped when all together
+            take more than this (in bytes), 0 for no limit.
+    """
+
+    cacheable_types: tuple[type, ...] = (
+        QslJobParameterRender,
+        QslJobParameterTile,
+        QslJobParameterLegend,
+    )
+    entry_name: str = "render_cache"
+    layer_index_name: str = "render_cache:layer"
+    style_index_name: str = "render_cache:style"
+    expiry_index_name: str = "render_cache:expiry"
+    sizes_name: str = "render_cache:sizes"
+    size_name: str = "render_cache:size"
+
+    def __init__(
+        self,
+        client: redis_aio.Redis,
+        ttl: int = 300,
+        max_entry_size: int = DEFAULT_MAX_ENTRY_SIZE,
+        max_size: int = DEFAULT_MAX_SIZE,
+    ) -> None:
+        self.client = client
+        self.ttl = ttl
+        self.max_entry_size = max_entry_size
+        self.max_size = max_size
+        self._invalidate_script = client.register_script(INVALIDATE_SCRIPT)
+        self._store_script = client.register_script(STORE_SCRIPT)
+
+    def job_hash(self, job_parameter: QslJobParameter) -> str | None:
+        """The cache key part of a job or `None` if its result must not be
+        cached.
+        """
+        if not isinstance(job_parameter, self.cacheable_types):
+            return None
+        return canonical_job_hash(job_parameter)
+
+    @classmethod
+    def entry_key(cls, job_hash: str) -> str:
+        return f"{cls.entry_name}:{job_hash}"
+
+    @classmethod
+    def index_keys(cls, job_parameter: QslJobParameter) -> list[str]:
+        keys = []
+        for layer in job_parameter.layers:
+            keys.append(f"{cls.layer_index_name}:{layer.id}")
+            if layer.style is not None:
+                keys.append(f"{cls.style_index_name}:{style_hash(layer.style)}")
+        return keys
+
+    @classmethod
+    def store_keys(cls, key: str) -> list[str]:
+        """The keys `STORE_SCRIPT` is run with to store the entry `key`."""
+        return [key, cls.expiry_index_name, cls.sizes_name, cls.size_name]
+
+    @staticmethod
+    def store_args(data: bytes, ttl: int, max_size: int) -> list:
+        """The arguments `STORE_SCRIPT` is run with to store `data`."""
+        return [data, ttl, time.time(), max_size]
+
+    async def get(self, job_hash: str) -> JobResult | None:
+        """Returns the cached result or `None` on a miss."""
+        data = await self.client.get(self.entry_key(job_hash))
+        if data is None:
+            return None
+        return decode_result(data)
+
+    async def exists(self, job_hash: str) -> bool:
+        """Checks if a result is cached without transferring it. This way a
+        front-end can answer a conditional request with the ETag only.
+        """
+        return bool(await self.client.exists(self.entry_key(job_hash)))
+
+    async def put(
+        self, job_hash: str, job_parameter: QslJobParameter, result: JobResult
+    ) -> bool:
+        """Stores a result and indexes it by the layers and styles it depends
+        on.
+
+        Returns:
+            If the result was stored. Too big results are skipped.
+        """
+        data = encode_result(result)
+        if len(data) > self.max_entry_size:
+            return False
+        key = self.entry_key(job_hash)
+        async with self.client.pipeline(transaction=False) as p:
+            await self._store_script(
+                keys=self.store_keys(key),
+                args=self.store_args(data, self.ttl, self.max_size),
+                client=p,
+            )
+            for index_key in self.index_keys(job_parameter):
+                await p.sadd(index_key, key)
+                # an index never has to outlive the entries it lists
+                await p.expire(index_key, self.ttl)
+            await p.execute()
+        return True
+
+    async def invalidate_layer(self, layer_id: str) -> int:
+        """Drops all entries which were rendered with the layer.
+
+        Returns:
+            The number of dropped entries.
+        """
+        return await self._invalidate_script(
+            keys=[f"{self.layer_index_name}:{layer_id}"]
+        )
+
+    async def invalidate_style(self, style: Style | str) -> int:
+        """Drops all entries which were rendered with the style.
+
+        Args:
+            style: The style or its hash.
+
+        Returns:
+            The number of dropped entries.
+        """
+        if isinstance(style, Style):
+            style = style_hash(style)
+        return await self._invalidate_script(keys=[f"{self.style_index_name}:{style}"])
@@ -1,3 +1,4 @@
+from dataclasses import dataclass, field
 from enum import Enum
 
 
@@ -6,3 +7,44 @@ class Status(Enum):
     FAILURE = "failed"
     RUNNING = "running"
     QUEUED = "queued"
+    # the dispatcher stopped waiting for the job
+    CANCELLED = "cancelled"
+    # the deadline of the job passed before a worker claimed it
+    EXPIRED = "expired"
+
+
+@dataclass
+class ResultReference:
+    """Is published instead of the result itself when the result is too big
+    to be sent over pub/sub. The actual result is stored once under `key`
+    and expires if nobody fetches it.
+
+    Attributes:
+        id: The id of the job the result belongs to.
+        status: The status the job finished with.
+        key: The redis key the serialized result is stored under.
+        size: The size of the serialized result in bytes.
+        shared: The result is read by the waiters of a coalesced job as well,
+            so it must not be removed by the first reader.
+    """
+
+    id: str = field(metadata={"type": "Element"})
+    status: str = field(metadata={"type": "Element"})
+    key: str = field(metadata={"type": "Element"})
+    size: int = field(metadata={"type": "Element"})
+    shared: bool = field(default=False, metadata={"type": "Element"})
+
+
+@dataclass
+class LayerInvalidation:
+    """Is published to all workers when data changed, so they reload the
+    affected layers from their layer cache.
+
+    Attributes:
+        layers: The ids of the layers to reload.
+        paths: Files or directories whose layers are reloaded. Relative paths
+            are relative to the data root of the workers.
+    """
+
+    layers: list[str] = field(default_factory=list, metadata={"type": "Element"})
+    paths: list[str] = field(default_factory=list, metadata={"type": "Element"})
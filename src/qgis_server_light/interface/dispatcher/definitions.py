@@ -0,0 +1,155 @@
+"""Sends the sources and style definitions of job layers by reference.
+
+The source and the (compressed and encoded) QML of a layer are the biggest
+part of most jobs and they are the same for every request of a project. A
+dispatcher using a `DefinitionRegistry` stores each of them once in redis,
+under `definitions:source:{sha256}` or `definitions:style:{sha256}`, and
+only sends the hash with the job (`QslJobLayer.source_ref` and `style_ref`).
+Workers resolve the hashes from a memory cache and fall back to redis. Jobs
+with inline definitions are still understood.
+
+The definitions expire, so the ones of styles which are not used anymore do
+not pile up in redis. Dispatchers write the definitions in use again from
+time to time, which refreshes their expiry.
+"""
+
+import dataclasses
+import hashlib
+import math
+import time
+from collections import OrderedDict
+from typing import Any, Callable, TypeVar
+
+from redis.client import Pipeline
+
+from qgis_server_light.interface.common import Style
+from qgis_server_light.interface.dispatcher.cache import style_hash
+from qgis_server_light.interface.job.common.input import QslJobLayer
+
+T = TypeVar("T")
+
+SOURCE = "source"
+STYLE = "style"
+DEFINITIONS_NAME = "definitions"
+
+
+def definition_key(kind: str, ref: str) -> str:
+    """The redis key a definition of a kind (`source` or `style`) is stored
+    under.
+    """
+    return f"{DEFINITIONS_NAME}:{kind}:{ref}"
+
+
+def source_hash(source: str) -> str:
+    """The hash a layer source is referenced by."""
+    return hashlib.sha256(source.encode()).hexdigest()
+
+
+def map_job_layers(value: T, convert: Callable[[QslJobLayer], QslJobLayer]) -> T:
+    """Replaces every job layer within a job info (or any part of it) by its
+    converted version. Only what contains a changed layer is copied, the
+    passed value is never modified.
+    """
+    if isinstance(value, QslJobLayer):
+        return convert(value)
+    if isinstance(value, list):
+        items = [map_job_layers(item, convert) for item in value]
+        if any(mapped is not item for mapped, item in zip(items, value)):
+            return items
+        return value
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        changes: dict[str, Any] = {}
+        for f in dataclasses.fields(value):
+            item = getattr(value, f.name)
+            mapped = map_job_layers(item, convert)
+            if mapped is not item:
+                changes[f.name] = mapped
+        if changes:
+            return dataclasses.replace(value, **changes)
+    return value
+
+
+class DefinitionRegistry:
+    """Replaces the inline definitions of the job layers by references and
+    registers the definitions in redis.
+
+    Attributes:
+        refresh_interval: Seconds after which a definition which is used is
+            written again, which refreshes its expiry and restores it in case
+            redis lost it meanwhile.
+        ttl: Seconds after which a definition which was not written again
+            expires in redis. It must exceed the refresh interval and the
+            time a job may wait in the queue.
+        max_entries: The number of definitions this dispatcher remembers as
+            registered. Forgotten ones are written again on their next use.
+    """
+
+    def __init__(
+        self,
+        refresh_interval: float = 60.0,
+        ttl: int = 86400,
+        max_entries: int = 4096,
+    ) -> None:
+        if ttl <= refresh_interval:
+            raise ValueError("The ttl must exceed the refresh interval")
+        self.refresh_interval = refresh_interval
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # when each definition was written last, by kind and hash, least
+        # recently used first
+        self._registered: OrderedDict[tuple[str, str], float] = OrderedDict()
+
+    async def externalize(
+        self, pipeline: Pipeline, job_info: T
+    ) -> tuple[T, list[tuple[str, str]]]:
+        """Replaces the sources and style definitions of a job by their
+        hashes. The definitions this dispatcher did not write recently are
+        queued on the pipeline, which also queues the job. Once the pipeline
+        was executed, they have to be passed to `registered`.
+
+        Args:
+            pipeline: The pipeline the job is queued with.
+            job_info: The job info, it is not modified.
+
+        Returns:
+            A copy of the job info which carries references only and the
+            kinds and hashes of the definitions queued on the pipeline.
+        """
+        pending: dict[tuple[str, str], str] = {}
+
+        def convert(layer: QslJobLayer) -> QslJobLayer:
+            changes: dict[str, Any] = {}
+            if layer.source and layer.source_ref is None:
+                ref = source_hash(layer.source)
+                pending[(SOURCE, ref)] = layer.source
+                changes.update(source="", source_ref=ref)
+            if layer.style is not None and layer.style_ref is None:
+                ref = style_hash(layer.style)
+                pending[(STYLE, ref)] = layer.style.definition
+                changes.update(
+                    style=Style(name=layer.style.name, definition=""), style_ref=ref
+                )
+            return dataclasses.replace(layer, **changes) if changes else layer
+
+        job_info = map_job_layers(job_info, convert)
+        now = time.monotonic()
+        written = []
+        for key, definition in pending.items():
+            if now - self._registered.get(key, -math.inf) < self.refresh_interval:
+                self._registered.move_to_end(key)
+                continue
+            await pipeline.set(definition_key(*key), definition, ex=self.ttl)
+            written.append(key)
+        return job_info, written
+
+    def registered(self, written: list[tuple[str, str]]) -> None:
+        """Records the definitions which were written by an executed
+        pipeline. Definitions of a pipeline which failed are written again
+        with the next job which uses them.
+        """
+        now = time.monotonic()
+        for key in written:
+            self._registered[key] = now
+            self._registered.move_to_end(key)
+        while len(self._registered) > self.max_entries:
+            self._registered.popitem(last=False)
@@ -0,0 +1,189 @@
+"""The binary envelope results are published and stored in.
+
+An envelope is a fixed header followed by the variable length fields and
+the raw payload:
+
+    magic (4s) | version (B) | flags (B) | length of id (H) | length of
+    status (H) | length of content type (H) | length of worker id (H) |
+    length of metadata (I) | length of payload (Q)
+
+The strings are UTF-8 encoded, the metadata is a small JSON object with the
+remaining fields (host name and timings of a result or the key of a stored
+result). The payload is the encoded image, document or error message as is.
+
+Unlike a pickle the envelope does not depend on the class layout of the
+other side, and the payload is neither wrapped nor copied on decoding: the
+decoded result refers to the received buffer with a `memoryview`.
+"""
+
+import dataclasses
+import json
+import pickle
+import struct
+
+from qgis_server_light.interface.dispatcher.common import ResultReference
+from qgis_server_light.interface.job.common.output import JobResult, PhaseTiming
+
+MAGIC = b"QSLR"
+VERSION = 1
+HEADER = struct.Struct("!4sBBHHHHIQ")
+# the payload is an UTF-8 encoded string
+FLAG_TEXT = 0x01
+# the envelope carries a `ResultReference` instead of a result
+FLAG_REFERENCE = 0x02
+
+# Enables unpickling the results of workers older than the envelope, only
+# for the rolling upgrade of a deployment: a pickle runs arbitrary code of
+# whoever can write to redis. Will be removed in the next release.
+ACCEPT_PICKLED_RESULTS = False
+
+
+def _payload_view(data) -> tuple[memoryview, int]:
+    """A view on the payload of a result and the flags describing it."""
+    if isinstance(data, str):
+        return memoryview(data.encode()), FLAG_TEXT
+    try:
+        return memoryview(data).cast("B"), 0
+    except TypeError:
+        # e.g. a QByteArray, which does not expose its buffer
+        return memoryview(bytes(data)), 0
+
+
+def _pack(
+    flags: int,
+    job_id: str,
+    status: str | None,
+    content_type: str | None,
+    worker_id: str | None,
+    metadata: dict,
+    payload: memoryview,
+) -> memoryview:
+    fields = [
+        (value or "").encode() for value in (job_id, status, content_type, worker_id)
+    ]
+    meta = json.dumps(metadata, separators=(",", ":")).encode() if metadata else b""
+    envelope = bytearray(
+        HEADER.size + sum(map(len, fields)) + len(meta) + payload.nbytes
+    )
+    HEADER.pack_into(
+        envelope,
+        0,
+        MAGIC,
+        VERSION,
+        flags,
+        *map(len, fields),
+        len(meta),
+        payload.nbytes,
+    )
+    view = memoryview(envelope)
+    offset = HEADER.size
+    for part in (*fields, meta, payload):
+        view[offset : offset + len(part)] = part
+        offset += len(part)
+    return view
+
+
+def encode_result(result: JobResult) -> memoryview:
+    """Packs a result into an envelope. The payload is copied once, into the
+    envelope, and the returned view can be passed to redis as is.
+
+    Args:
+        result: The result, its data is a bytes-like object or a string.
+
+    Returns:
+        The envelope.
+    """
+    payload, flags = _payload_view(result.data)
+    metadata = {}
+    if result.worker_host_name is not None:
+        metadata["worker_host_name"] = result.worker_host_name
+    if result.timings is not None:
+        metadata["timings"] = [dataclasses.asdict(t) for t in result.timings]
+    return _pack(
+        flags,
+        result.id,
+        result.status,
+        result.content_type,
+        result.worker_id,
+        metadata,
+        payload,
+    )
+
+
+def encode_reference(reference: ResultReference) -> memoryview:
+    """Packs the reference to a stored result into an envelope."""
+    return _pack(
+        FLAG_REFERENCE,
+        reference.id,
+        reference.status,
+        None,
+        None,
+        {"key": reference.key, "size": reference.size, "shared": reference.shared},
+        memoryview(b""),
+    )
+
+
+def decode_result(data: bytes | memoryview) -> JobResult | ResultReference:
+    """Unpacks an envelope. The data of the result is a view on the passed
+    buffer (or a string for text payloads), nothing is copied.
+
+    Results which were pickled by workers older than the envelope are only
+    understood with `ACCEPT_PICKLED_RESULTS`.
+
+    Raises:
+        ValueError: When the envelope has an unsupported version or the data
+            is no envelope at all.
+    """
+    view = memoryview(data)
+    if view[: len(MAGIC)] != MAGIC:
+        if view[:1] == b"\x80":
+            if ACCEPT_PICKLED_RESULTS:
+                return pickle.loads(view)
+            raise ValueError(
+                "Result was pickled by an outdated worker, update the workers "
+                "or set envelope.ACCEPT_PICKLED_RESULTS during the upgrade"
+            )
+        raise ValueError("Data is not a result envelope")
+    (
+        _,
+        version,
+        flags,
+        id_length,
+        status_length,
+        content_type_length,
+        worker_id_length,
+        meta_length,
+        payload_length,
+    ) = HEADER.unpack_from(view)
+    if version != VERSION:
+        raise ValueError(f"Unsupported result envelope version {version}")
+    offset = HEADER.size
+    fields = []
+    for length in (
+        id_length,
+        status_length,
+        content_type_length,
+        worker_id_length,
+        meta_length,
+    ):
+        fields.append(str(view[offset : offset + length], "utf-8"))
+        offset += length
+    job_id, status, content_type, worker_id, meta = fields
+    metadata = json.loads(meta) if meta else {}
+    if flags & FLAG_REFERENCE:
+        return ResultReference(id=job_id, status=status, **metadata)
+    payload = view[offset : offset + payload_length]
+    timings = metadata.get("timings")
+    return JobResult(
+        id=job_id,
+        data=str(payload, "utf-8") if flags & FLAG_TEXT else payload,
+        content_type=content_type,
+        worker_id=worker_id or None,
+        worker_host_name=metadata.get("worker_host_name"),
+        status=status or None,
+        timings=(
+            [PhaseTiming(**timing) for timing in timings]
+            if timings is not None
+            else None
+        ),
+    )
@@ -4,18 +4,40 @@ is passed around a redis queue.
 """
 
 import asyncio
+import dataclasses
 import datetime
 import logging
-import pickle
 import time
 from asyncio import timeout
+from collections import OrderedDict
+from collections.abc import AsyncIterator
+from contextlib import aclosing
+from typing import Any
 from uuid import uuid4
 
 from redis import asyncio as redis_aio
 from redis.client import Pipeline
 from xsdata.formats.dataclass.serializers import JsonSerializer
 
-from qgis_server_light.interface.dispatcher.common import Status
+from qgis_server_light.interface.dispatcher.cache import (
+    DEFAULT_MAX_SIZE,
+    RenderResultCache,
+    canonical_job_hash,
+)
+from qgis_server_light.interface.dispatcher.common import (
+    LayerInvalidation,
+    ResultReference,
+    Status,
+)
+from qgis_server_light.interface.dispatcher.definitions import DefinitionRegistry
+from qgis_server_light.interface.dispatcher.envelope import decode_result
+from qgis_server_light.interface.job.codec import (
+    DEFAULT_CODEC,
+    JobCodec,
+    codec_by_name,
+    codec_info_type,
+)
+from qgis_server_light.interface.job.common.input import QslJobInfoParameter
 from qgis_server_light.interface.job.common.output import JobResult
 from qgis_server_light.interface.job.feature.input import (
     QslJobInfoFeature,
@@ -33,169 +55,824 @@ from qgis_server_light.interface.job.render.input import (
     QslJobInfoRender,
     QslJobParameterRender,
 )
+from qgis_server_light.interface.job.tile.input import (
+    QslJobInfoTile,
+    QslJobParameterTile,
+)
+
+# Takes the lease of a job hash (KEYS[1]) for the job ARGV[1] or, when another
+# job holds it already, adds the reply channel ARGV[4] to the waiters of that
+# job. Returns the id of the job which holds the lease.
+JOIN_SCRIPT = """
+if redis.call("SET", KEYS[1], ARGV[1], "NX", "PX", ARGV[2]) then
+    return ARGV[1]
+end
+local leader = redis.call("GET", KEYS[1])
+local waiters = ARGV[3] .. ":" .. leader
+redis.call("SADD", waiters, ARGV[4])
+redis.call("PEXPIRE", waiters, ARGV[2])
+return leader
+"""
 
 
 class RedisQueue:
     job_queue_name: str = "jobs"
+    job_processing_list_name: str = "processing"
+    worker_set_name: str = "workers"
     job_info_key: str = "info"
     job_info_type_key: str = "info_type"
+    job_reply_to_key: str = "reply_to"
+    job_lease_key: str = "lease"
+    job_deadline_key: str = "deadline"
+    job_enqueued_key: str = "enqueued"
+    job_lease_name: str = "inflight"
+    job_waiters_name: str = "waiters"
     job_channel_name: str = "notifications"
+    # workers reload the layers published here from their layer cache
+    layer_invalidation_channel_name: str = "layer_invalidation"
+    job_result_name: str = "result"
     job_status_key: str = "status"
     job_duration_key: str = "duration"
     job_timestamp_key: str = "timestamp"
     job_last_update_key: str = f"{job_timestamp_key}.last_update"
+    # prefix of the per phase timings a worker writes, see `PhaseTiming`
+    job_timing_key: str = "timing"
+    # identical jobs of these types share one render when coalescing is on
+    coalescable_types: tuple[type, ...] = (
+        QslJobParameterRender,
+        QslJobParameterTile,
+        QslJobParameterLegend,
+    )
+    # seconds the hash of a cancelled job is kept, so workers still see it
+    cancelled_job_expire: int = 60
+    # results nobody waits for (yet) which are kept for a follower
+    unclaimed_results_limit: int = 64
 
-    def __init__(self, redis_client: redis_aio.Redis) -> None:
+    def __init__(
+        self,
+        redis_client: redis_aio.Redis,
+        result_cache: RenderResultCache | None = None,
+        coalesce: bool = False,
+        codec: JobCodec | None = None,
+        definitions: DefinitionRegistry | None = None,
+    ) -> None:
         # we use this to hold connections to redis in a pool, this way we are
         # event loop safe and when creating the redis client for every call of
         # post, we only instantiate a minimal wrapper object which is cheap.
 
         self.client = redis_client
+        # render and legend results are looked up here before they are queued
+        self.result_cache = result_cache
+        # identical jobs in flight are only rendered once, across all
+        # dispatchers
+        self.coalesce = coalesce
+        # job infos are encoded with this codec, its name is passed to the
+        # workers with the info type
+        self.codec = codec or DEFAULT_CODEC
+        # sources and styles are sent by reference when set, see
+        # `DefinitionRegistry`
+        self.definitions = definitions
+        # all results for jobs posted through this queue are published on
+        # one channel, which is read by one listener task
+        self.id = str(uuid4())
+        self.result_channel = f"{self.job_channel_name}:{self.id}"
+        self.reply_to = self.result_channel
+        self._pending: dict[str, asyncio.Future] = {}
+        self._waiter_counts: dict[str, int] = {}
+        self._unclaimed: OrderedDict[str, Any] = OrderedDict()
+        self._cancelled: set[str] = set()
+        self._listener: asyncio.Task | None = None
+        self._listener_ready: asyncio.Future | None = None
+        self._listener_loop: asyncio.AbstractEventLoop | None = None
+        self._join_script = None
 
     @classmethod
-    def create(cls, url: str):
+    def create(
+        cls,
+        url: str,
+        result_cache_ttl: int | None = None,
+        coalesce: bool = False,
+        codec: str | None = None,
+        by_reference: bool = False,
+        result_cache_max_size: int = DEFAULT_MAX_SIZE,
+    ):
+        """Creates a queue connected to the redis at `url`.
+
+        Args:
+            url: The redis url.
+            result_cache_ttl: Enables the shared result cache with this ttl
+                (in seconds) when passed.
+            coalesce: Enables the coalescing of identical jobs in flight.
+            codec: The name of the codec job infos are encoded with, e.g.
+                `fast`. Defaults to the xsdata JSON all workers understand.
+            by_reference: Sends the sources and styles of the layers by
+                reference instead of inline in every job.
+            result_cache_max_size: Bytes all entries of the result cache may
+                take together, has to match `--tile-cache-max-size` of the
+                workers.
+        """
         redis_client = redis_aio.Redis.from_url(url)
-        return cls(redis_client)
+        result_cache = None
+        if result_cache_ttl is not None:
+            result_cache = RenderResultCache(
+                redis_client, ttl=result_cache_ttl, max_size=result_cache_max_size
+            )
+        return cls(
+            redis_client,
+            result_cache,
+            coalesce,
+            codec_by_name(codec) if codec is not None else None,
+            DefinitionRegistry() if by_reference else None,
+        )
 
-    async def set_job_runtime_status(
+    async def queue_job_runtime_status(
         self,
         job_id,
         pipeline: Pipeline,
         status: str,
         start_time: float,
     ):
+        """Queues the status update on the pipeline without executing it."""
         duration = time.time() - start_time
         ts = datetime.datetime.now().isoformat()
-        await pipeline.hset(f"job:{job_id}", self.job_status_key, status)
         await pipeline.hset(
             f"job:{job_id}",
-            f"{self.job_timestamp_key}.{status}",
-            ts,
+            mapping={
+                self.job_status_key: status,
+                f"{self.job_timestamp_key}.{status}": ts,
+                self.job_last_update_key: ts,
+                self.job_duration_key: str(duration),
+            },
         )
-        await pipeline.hset(f"job:{job_id}", self.job_last_update_key, ts)
-        await pipeline.hset(f"job:{job_id}", self.job_duration_key, str(duration))
-        await pipeline.execute()
 
-    async def post(
+    async def set_job_runtime_status(
         self,
+        job_id,
+        pipeline: Pipeline,
+        status: str,
+        start_time: float,
+    ):
+        await self.queue_job_runtime_status(job_id, pipeline, status, start_time)
+        await pipeline.execute()
+
+    async def load_result(self, data: bytes) -> JobResult:
+        """Unpacks a published result envelope. Big results are only
+        referenced in the published message, they are fetched (and removed)
+        with one `GETDEL`. The data of the result is a view on the received
+        buffer, it is not copied.
+
+        Args:
+            data: The published message.
+
+        Returns:
+            The result of the job.
+        """
+        return await self.resolve_result(decode_result(data))
+
+    async def resolve_result(self, published: JobResult | ResultReference) -> JobResult:
+        """Fetches the actual result if only a reference was published. A
+        shared result is read by several dispatchers, it is left to expire.
+        """
+        if isinstance(published, ResultReference):
+            if published.shared:
+                stored = await self.client.get(published.key)
+            else:
+                stored = await self.client.getdel(published.key)
+            if stored is None:
+                raise LookupError(f"Result {published.key} expired before it was read")
+            return decode_result(stored)
+        return published
+
+    async def _ensure_listener(self):
+        """Starts the listener task if it is not running (in this event loop)
+        yet and waits until it is ready to receive results.
+        """
+        loop = asyncio.get_running_loop()
+        if (
+            self._listener is None
+            or self._listener.done()
+            or self._listener_loop is not loop
+        ):
+            self._listener_loop = loop
+            self._listener_ready = loop.create_future()
+            self._listener = loop.create_task(self._listen())
+        await asyncio.shield(self._listener_ready)
+
+    def _set_listener_ready(self):
+        if not self._listener_ready.done():
+            self._listener_ready.set_result(None)
+
+    def _deliver(self, job_id: str, value):
+        # the entry is removed by the waiting job itself
+        future = self._pending.get(job_id)
+        if future is None:
+            # a follower might register for this job just now
+            self._unclaimed[job_id] = value
+            if len(self._unclaimed) > self.unclaimed_results_limit:
+                self._unclaimed.popitem(last=False)
+        elif not future.done():
+            future.set_result(value)
+
+    def _fail_pending(self, e: Exception):
+        futures = [self._listener_ready, *self._pending.values()]
+        for future in futures:
+            if future is not None and not future.done():
+                future.set_exception(e)
+                # nobody might wait for it anymore, which would be logged as
+                # an exception that was never retrieved
+                future.exception()
+
+    async def _listen(self):
+        """Receives the results of all jobs of this queue on its channel and
+        hands each one to the job waiting for it.
+        """
+        pubsub = self.client.pubsub()
+        try:
+            await pubsub.subscribe(self.result_channel)
+            async for message in pubsub.listen():
+                if message["type"] == "subscribe":
+                    # from now on no result can be missed anymore
+                    self._set_listener_ready()
+                elif message["type"] == "message":
+                    published = decode_result(message["data"])
+                    self._deliver(published.id, published)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error("Listening for results failed", exc_info=True)
+            self._fail_pending(e)
+        finally:
+            await pubsub.aclose()
+
+    async def expect_result(self, job_id: str):
+        """Registers a job whose result will be waited for. This has to happen
+        before the job is queued, so its result can't be missed.
+        """
+        await self._ensure_listener()
+        if job_id in self._pending:
+            # coalesced jobs of this process share one future
+            self._waiter_counts[job_id] += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        if job_id in self._unclaimed:
+            future.set_result(self._unclaimed.pop(job_id))
+        self._pending[job_id] = future
+        self._waiter_counts[job_id] = 1
+
+    def release_result(self, job_id: str):
+        """Unregisters a job which does not wait for its result anymore."""
+        self._waiter_counts[job_id] = self._waiter_counts.get(job_id, 1) - 1
+        if self._waiter_counts[job_id] <= 0:
+            self._waiter_counts.pop(job_id, None)
+            self._pending.pop(job_id, None)
+
+    async def close(self):
+        """Stops listening for results. Jobs still waiting for a result fail."""
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        self._fail_pending(RuntimeError("Queue was closed"))
+
+    @staticmethod
+    def create_job_info(
+        job_id: str,
         job_parameter: (
             QslJobParameterRender
+            | QslJobParameterTile
             | QslJobParameterFeatureInfo
             | QslJobParameterLegend
             | QslJobParameterFeature
         ),
-        to: float = 10.0,
-    ) -> tuple[JobResult, str]:
-        """
-        Posts a new `runner` to the runner queue and waits maximum `timeout` seconds to complete.
-        Will return a JobResult if successful or raise an error.
+    ) -> QslJobInfoParameter | None:
+        """Wraps the job parameter into its job info.
 
-        Args:
-            job_parameter: The parameter for the job which should be executed.
-            to: The timeout a job is expected to be waited for before canceling
-                job execution.
+        Returns:
+            The job info or `None` if the type of the job parameter is not
+            supported.
         """
-        job_id = str(uuid4())
-        start_time = time.time()
         if isinstance(job_parameter, QslJobParameterRender):
-            job_info = QslJobInfoRender(
+            return QslJobInfoRender(
                 id=job_id, type=QslJobInfoRender.__name__, job=job_parameter
             )
+        elif isinstance(job_parameter, QslJobParameterTile):
+            return QslJobInfoTile(
+                id=job_id, type=QslJobInfoTile.__name__, job=job_parameter
+            )
         elif isinstance(job_parameter, QslJobParameterFeatureInfo):
-            job_info = QslJobInfoFeatureInfo(
+            return QslJobInfoFeatureInfo(
                 id=job_id, type=QslJobInfoFeatureInfo.__name__, job=job_parameter
             )
         elif isinstance(job_parameter, QslJobParameterLegend):
-            job_info = QslJobInfoLegend(
+            return QslJobInfoLegend(
                 id=job_id, type=QslJobInfoLegend.__name__, job=job_parameter
             )
         elif isinstance(job_parameter, QslJobParameterFeature):
-            job_info = QslJobInfoFeature(
+            return QslJobInfoFeature(
                 id=job_id, type=QslJobInfoFeature.__name__, job=job_parameter
             )
-        else:
+        return None
+
+    def job_mapping(
+        self, job_info: QslJobInfoParameter, deadline: float | None = None
+    ) -> dict[str, str]:
+        """The fields of the `job:{id}` hash which describe the job.
+
+        Args:
+            job_info: The job info.
+            deadline: The absolute time (unix timestamp) after which nobody
+                waits for the result anymore.
+        """
+        mapping = {
+            self.job_info_key: self.codec.encode(job_info),
+            self.job_info_type_key: codec_info_type(job_info, self.codec),
+            self.job_reply_to_key: self.result_channel,
+            # used by the workers to measure the time jobs spend in the queue
+            self.job_enqueued_key: repr(time.time()),
+        }
+        if deadline is not None:
+            mapping[self.job_deadline_key] = repr(deadline)
+        return mapping
+
+    async def push_jobs(self, pipeline: Pipeline, job_ids: list[str]):
+        """Queues the ids of the jobs, all with one command."""
+        await pipeline.rpush(self.job_queue_name, *job_ids)
+
+    async def enqueue_many(
+        self,
+        pipeline: Pipeline,
+        jobs: list[tuple[str, QslJobInfoParameter]],
+        deadline: float | None = None,
+    ):
+        """Stores the job infos and puts all jobs onto the queue with one
+        round trip.
+
+        Args:
+            pipeline: The pipeline which is executed once everything is
+                queued on it.
+            jobs: The job ids together with their job infos.
+            deadline: The absolute time (unix timestamp) after which the jobs
+                are skipped by the workers.
+        """
+        # Putting job info into redis
+        written = []
+        for job_id, job_info in jobs:
+            if self.definitions is not None:
+                job_info, definitions = await self.definitions.externalize(
+                    pipeline, job_info
+                )
+                written.extend(definitions)
+            await pipeline.hset(
+                f"job:{job_id}", mapping=self.job_mapping(job_info, deadline)
+            )
+        # Queuing the jobs onto the list/queue
+        await self.push_jobs(pipeline, [job_id for job_id, _ in jobs])
+        await pipeline.execute()
+        if self.definitions is not None:
+            self.definitions.registered(written)
+
+    async def enqueue(
+        self,
+        pipeline: Pipeline,
+        job_id: str,
+        job_info: QslJobInfoParameter,
+        deadline: float | None = None,
+    ):
+        """Stores the job info and puts the job onto the queue."""
+        await self.enqueue_many(pipeline, [(job_id, job_info)], deadline)
+
+    async def cancel(self, job_id: str):
+        """Marks a job nobody waits for anymore as cancelled. Its hash is kept
+        for a while, so a worker which claims the job later skips it.
+        """
+        self._cancelled.add(job_id)
+        ts = datetime.datetime.now().isoformat()
+        try:
+            async with self.client.pipeline() as p:
+                await p.hset(
+                    f"job:{job_id}",
+                    mapping={
+                        self.job_status_key: Status.CANCELLED.value,
+                        f"{self.job_timestamp_key}.{Status.CANCELLED.value}": ts,
+                        self.job_last_update_key: ts,
+                    },
+                )
+                await p.expire(f"job:{job_id}", self.cancelled_job_expire)
+                await p.execute()
+        except Exception:
+            logging.warning(f"Cancelling {job_id} failed", exc_info=True)
+
+    async def wait_for_result(self, job_id: str, to: float) -> tuple[JobResult, str]:
+        """Waits maximum `to` seconds for the result of a queued job.
+
+        Raises:
+            asyncio.TimeoutError: When the job did not finish in time.
+        """
+        try:
+            async with timeout(to):
+                # the future is shared by coalesced jobs of this process
+                published = await asyncio.shield(self._pending[job_id])
+        finally:
+            self.release_result(job_id)
+        result = await self.resolve_result(published)
+        return result, result.status
+
+    @staticmethod
+    def unsupported_result(job_id: str, job_parameter) -> tuple[JobResult, str]:
+        return (
+            JobResult(
+                id=job_id,
+                data=f"Unsupported runner type: {type(job_parameter)}",
+                content_type="application/text",
+            ),
+            Status.FAILURE.value,
+        )
+
+    async def collect_result(
+        self, job_id: str, start_time: float, to: float, cancel: bool = True
+    ) -> tuple[JobResult, str]:
+        """Waits for the result of a queued job. Any error while waiting is
+        reported as a failed result.
+
+        Args:
+            job_id: The id of the job.
+            start_time: When the job was posted.
+            to: Seconds to wait for the result.
+            cancel: Marks the job as cancelled when it did not finish in time.
+        """
+        try:
+            try:
+                result, status = await self.wait_for_result(job_id, to)
+            except asyncio.TimeoutError:
+                logging.info(f"{job_id} timeout")
+                if cancel:
+                    await self.cancel(job_id)
+                raise
+            except asyncio.exceptions.CancelledError:
+                logging.info(f"{job_id} timeout")
+                raise
+            duration = time.time() - start_time
+            if status == Status.SUCCESS.value:
+                logging.info(
+                    f"Job id: {job_id}, status: {status}, duration: {duration}"
+                )
+            elif status == Status.FAILURE.value:
+                logging.info(
+                    f"Job id: {job_id}, status: {status}, "
+                    f"duration: {duration}, error: {result.data}"
+                )
+            return result, status
+        except Exception as e:
+            duration = time.time() - start_time
+            logging.info(
+                f"Job id: {job_id}, status: {Status.FAILURE.value}, duration: "
+                f"{duration}",
+                exc_info=True,
+            )
             return (
                 JobResult(
                     id=job_id,
-                    data=f"Unsupported runner type: {type(job_parameter)}",
+                    data=str(e),
                     content_type="application/text",
                 ),
                 Status.FAILURE.value,
             )
-        async with self.client.pipeline() as p:
-            # Putting job info into redis
-            await p.hset(
-                f"job:{job_id}", self.job_info_key, JsonSerializer().render(job_info)
+
+    async def cached_result(
+        self, job_id: str, job_parameter
+    ) -> tuple[str | None, JobResult | None]:
+        """Looks up the result of a job in the result cache.
+
+        Returns:
+            The hash of the job (`None` if it is not cacheable) and the cached
+            result (`None` on a miss).
+        """
+        if self.result_cache is None:
+            return None, None
+        job_hash = self.result_cache.job_hash(job_parameter)
+        if job_hash is None:
+            return None, None
+        try:
+            cached = await self.result_cache.get(job_hash)
+        except Exception:
+            logging.warning(f"Result cache lookup failed for {job_id}", exc_info=True)
+            return job_hash, None
+        if cached is None:
+            return job_hash, None
+        logging.info(f"Job id: {job_id}, served from result cache")
+        return job_hash, dataclasses.replace(cached, id=job_id)
+
+    async def cache_result(
+        self, job_hash: str | None, job_parameter, result: JobResult, status: str
+    ):
+        if job_hash is None or status != Status.SUCCESS.value:
+            return
+        try:
+            await self.result_cache.put(job_hash, job_parameter, result)
+        except Exception:
+            logging.warning(
+                f"Result cache update failed for {result.id}", exc_info=True
             )
-            await p.hset(
-                f"job:{job_id}", self.job_info_type_key, job_info.__class__.__name__
+
+    def coalesced_job(self, job_parameter):
+        """The job whose render is shared by coalesced jobs. All tiles of a
+        metatile share the render of its top left tile, their own tiles are
+        read from the result cache afterwards, so this needs the cache.
+        """
+        if (
+            isinstance(job_parameter, QslJobParameterTile)
+            and self.result_cache is not None
+        ):
+            return job_parameter.metatile_origin()
+        return job_parameter
+
+    async def join_in_flight(
+        self, job_id: str, job_parameter, job_hash: str | None, to: float
+    ) -> tuple[str, str | None]:
+        """Looks for an identical job in flight. If there is none, this job
+        takes the lease and becomes the leader, which is rendered for all.
+        Otherwise this queue is added to the waiters of the leader. Tiles are
+        identical when they belong to the same metatile, see
+        `coalesced_job`.
+
+        Args:
+            job_id: The id of the job.
+            job_parameter: The parameter of the job.
+            job_hash: The canonical hash of the job, if it is known already.
+            to: The time the job is waited for. The lease is held as long.
+
+        Returns:
+            The id of the leader job (which is `job_id` when this job leads)
+            and the key of the lease (`None` when not coalescing).
+        """
+        if not self.coalesce or not isinstance(job_parameter, self.coalescable_types):
+            return job_id, None
+        if self._join_script is None:
+            self._join_script = self.client.register_script(JOIN_SCRIPT)
+        coalesced = self.coalesced_job(job_parameter)
+        if coalesced is not job_parameter:
+            job_hash = canonical_job_hash(coalesced)
+        lease_key = (
+            f"{self.job_lease_name}:{job_hash or canonical_job_hash(job_parameter)}"
+        )
+        # the result of the leader can arrive as soon as we joined
+        await self._ensure_listener()
+        leader_id = await self._join_script(
+            keys=[lease_key],
+            args=[job_id, int(to * 1000), self.job_waiters_name, self.reply_to],
+        )
+        if isinstance(leader_id, bytes):
+            leader_id = leader_id.decode()
+        return leader_id, lease_key
+
+    async def follow(
+        self, job_id: str, job_parameter, leader_id: str, start_time: float, to: float
+    ) -> tuple[JobResult | None, str]:
+        """Waits for the result of the leader of a coalesced job.
+
+        Returns:
+            The result and status of the job. The result is `None` when the
+            job has to be rendered by itself: the leader was skipped or
+            cancelled, or it is a tile which is missing in the result cache
+            after the leader rendered its metatile.
+        """
+        logging.info(f"Job id: {job_id}, coalesced with {leader_id}")
+        await self.expect_result(leader_id)
+        # the job belongs to the leader, it is not cancelled from here
+        result, status = await self.collect_result(
+            leader_id, start_time, to, cancel=False
+        )
+        if status in (Status.CANCELLED.value, Status.EXPIRED.value):
+            return None, status
+        if (
+            self.coalesced_job(job_parameter) is not job_parameter
+            and status == Status.SUCCESS.value
+        ):
+            # the leader might have rendered another tile of the metatile,
+            # the worker cached all of them before publishing its result
+            _, result = await self.cached_result(job_id, job_parameter)
+            return result, status
+        return dataclasses.replace(result, id=job_id), status
+
+    async def cleanup(self, *job_ids: str):
+        """Removes the hashes of finished jobs. Cancelled jobs are left to
+        expire.
+        """
+        cancelled = self._cancelled.intersection(job_ids)
+        self._cancelled.difference_update(cancelled)
+        job_ids = [job_id for job_id in job_ids if job_id not in cancelled]
+        if not job_ids:
+            return
+        try:
+            await self.client.delete(*(f"job:{job_id}" for job_id in job_ids))
+        except Exception:
+            logging.warning(
+                f"Cleanup failed for {', '.join(job_ids)}",
+                exc_info=True,
             )
-            # Queuing the job onto the list/queue
-            await p.rpush(self.job_queue_name, job_id)
-            await p.execute()
 
-            logging.info(f"{job_id} queued")
+    async def invalidate_layers(
+        self, layers: list[str] | None = None, paths: list[str] | None = None
+    ) -> int:
+        """Makes all workers reload layers after their data changed. Cached
+        results rendered with the layers are dropped as well.
+
+        Args:
+            layers: The ids of the layers.
+            paths: Files or directories (relative to the data root of the
+                workers) whose layers are reloaded. Cached results can only be
+                dropped by layer id, not by path.
+
+        Returns:
+            The number of workers which received the invalidation.
+        """
+        invalidation = LayerInvalidation(
+            layers=list(layers or []), paths=list(paths or [])
+        )
+        receivers = await self.client.publish(
+            self.layer_invalidation_channel_name,
+            JsonSerializer().render(invalidation),
+        )
+        if self.result_cache is not None:
+            for layer_id in invalidation.layers:
+                await self.result_cache.invalidate_layer(layer_id)
+        return receivers
 
-            # we inform, that the job was queued
-            await self.set_job_runtime_status(
-                job_id, p, Status.QUEUED.value, start_time
+    async def post(
+        self,
+        job_parameter: (
+            QslJobParameterRender
+            | QslJobParameterTile
+            | QslJobParameterFeatureInfo
+            | QslJobParameterLegend
+            | QslJobParameterFeature
+        ),
+        to: float = 10.0,
+    ) -> tuple[JobResult, str]:
+        """
+        Posts a new `runner` to the runner queue and waits maximum `timeout` seconds to complete.
+        Will return a JobResult if successful or raise an error.
+
+        Args:
+            job_parameter: The parameter for the job which should be executed.
+            to: The timeout a job is expected to be waited for before canceling
+                job execution.
+        """
+        job_id = str(uuid4())
+        start_time = time.time()
+        job_info = self.create_job_info(job_id, job_parameter)
+        if job_info is None:
+            return self.unsupported_result(job_id, job_parameter)
+        job_hash, cached = await self.cached_result(job_id, job_parameter)
+        if cached is not None:
+            return cached, Status.SUCCESS.value
+        leader_id, lease_key = await self.join_in_flight(
+            job_id, job_parameter, job_hash, to
+        )
+        if leader_id != job_id:
+            result, status = await self.follow(
+                job_id, job_parameter, leader_id, start_time, to
             )
+            if result is not None:
+                return result, status
+            logging.info(f"Job id: {job_id}, leader gave no result, rendering it")
+            lease_key = None
+            to = max(start_time + to - time.time(), 0.0)
+            start_time = time.time()
+        async with self.client.pipeline() as p:
+            await self.expect_result(job_id)
             try:
-                async with self.client.pubsub() as ps:
-                    # we tell redis to let us know if a message is published
-                    # for this channel `notifications:{job_id}`.
-                    await ps.subscribe(f"{self.job_channel_name}:{job_id}")
-                    try:
-                        # this puts a timeout trigger on the subscription, after timeout
-                        # an asyncio.TimeoutError or asyncio.exceptions.CancelledError
-                        # is raised. See except block below.
-                        async with timeout(to):
-                            while True:
-                                message = await ps.get_message(
-                                    timeout=to, ignore_subscribe_messages=True
-                                )
-                                if not message:
-                                    continue  # https://github.com/redis/redis-py/issues/733
-                                status_binary = await self.client.hget(
-                                    f"job:{job_id}", "status"
-                                )
-                                status = status_binary.decode()
-                                result: JobResult = pickle.loads(message["data"])
-                                duration = time.time() - start_time
-                                if status == Status.SUCCESS.value:
-                                    logging.info(
-                                        f"Job id: {job_id}, status: {status}, "
-                                        f"duration: {duration}"
-                                    )
-                                elif status == Status.FAILURE.value:
-                                    logging.info(
-                                        f"Job id: {job_id}, status: {status}, "
-                                        f"duration: {duration}, error: {result.data}"
-                                    )
-                                return result, status
-                    except (asyncio.TimeoutError, asyncio.exceptions.CancelledError):
-                        logging.info(f"{job_id} timeout")
-                        raise
-            except Exception as e:
-                duration = time.time() - start_time
-                logging.info(
-                    f"Job id: {job_id}, status: {Status.FAILURE.value}, duration: "
-                    f"{duration}",
-                    exc_info=True,
+                if lease_key is not None:
+                    # the worker releases the lease when it publishes the result
+                    await p.hset(f"job:{job_id}", self.job_lease_key, lease_key)
+                # the status is written in the same round trip as the job, a
+                # worker can't mark it running before
+                await self.queue_job_runtime_status(
+                    job_id, p, Status.QUEUED.value, start_time
                 )
-                return (
-                    JobResult(
-                        id=job_id,
-                        data=str(e),
-                        content_type="application/text",
-                    ),
-                    Status.FAILURE.value,
+                await self.enqueue(p, job_id, job_info, start_time + to)
+            except Exception:
+                self.release_result(job_id)
+                if lease_key is not None:
+                    await self.client.delete(lease_key)
+                raise
+
+            logging.info(f"{job_id} queued")
+            try:
+                # a coalesced job might still be waited for by others
+                result, status = await self.collect_result(
+                    job_id, start_time, to, cancel=lease_key is None
                 )
+                await self.cache_result(job_hash, job_parameter, result, status)
+                return result, status
             finally:
-                try:
-                    await self.client.delete(f"job:{job_id}")
-                except Exception:
-                    logging.warning(
-                        f"Cleanup failed for {job_id}",
-                        exc_info=True,
+                await self.cleanup(job_id)
+
+    async def post_many_as_completed(
+        self,
+        job_parameters: list[
+            QslJobParameterRender
+            | QslJobParameterTile
+            | QslJobParameterFeatureInfo
+            | QslJobParameterLegend
+            | QslJobParameterFeature
+        ],
+        to: float = 10.0,
+    ) -> AsyncIterator[tuple[int, JobResult, str]]:
+        """Posts a batch of jobs with one round trip and yields their results
+        in the order they finish.
+
+        All jobs are queued in one pipeline (with one `RPUSH`) and their
+        results arrive through the one listener of this queue. A job which
+        fails or does not finish within `to` seconds is reported as a failed
+        result, the other jobs are not affected by it.
+
+        When the iteration is stopped early, use `contextlib.aclosing` so the
+        remaining jobs are cleaned up right away.
+
+        Args:
+            job_parameters: The parameters of the jobs which should be executed.
+            to: The timeout each job is waited for.
+
+        Yields:
+            The index of the job in `job_parameters`, its result and status.
+        """
+        start_time = time.time()
+        jobs: dict[str, tuple[int, QslJobInfoParameter]] = {}
+        job_hashes: dict[str, str | None] = {}
+        for index, job_parameter in enumerate(job_parameters):
+            job_id = str(uuid4())
+            job_info = self.create_job_info(job_id, job_parameter)
+            if job_info is None:
+                yield index, *self.unsupported_result(job_id, job_parameter)
+                continue
+            job_hash, cached = await self.cached_result(job_id, job_parameter)
+            if cached is not None:
+                yield index, cached, Status.SUCCESS.value
+                continue
+            jobs[job_id] = (index, job_info)
+            job_hashes[job_id] = job_hash
+        if not jobs:
+            return
+        for job_id in jobs:
+            await self.expect_result(job_id)
+        try:
+            async with self.client.pipeline() as p:
+                # the status is written in the same round trip as the jobs
+                for job_id in jobs:
+                    await self.queue_job_runtime_status(
+                        job_id, p, Status.QUEUED.value, start_time
                     )
+                await self.enqueue_many(
+                    p,
+                    [(job_id, job_info) for job_id, (_, job_info) in jobs.items()],
+                    start_time + to,
+                )
+        except Exception:
+            for job_id in jobs:
+                self.release_result(job_id)
+            raise
+        logging.info(f"{len(jobs)} jobs queued")
+
+        async def collect(job_id: str) -> tuple[int, JobResult, str]:
+            index, job_info = jobs[job_id]
+            result, status = await self.collect_result(job_id, start_time, to)
+            await self.cache_result(job_hashes[job_id], job_info.job, result, status)
+            return index, result, status
+
+        tasks = [asyncio.ensure_future(collect(job_id)) for job_id in jobs]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                yield await next_result
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self.cleanup(*jobs)
+
+    async def post_many(
+        self,
+        job_parameters: list[
+            QslJobParameterRender
+            | QslJobParameterTile
+            | QslJobParameterFeatureInfo
+            | QslJobParameterLegend
+            | QslJobParameterFeature
+        ],
+        to: float = 10.0,
+    ) -> list[tuple[JobResult, str]]:
+        """Posts a batch of jobs and waits for all of them, see
+        `post_many_as_completed`.
+
+        Returns:
+            The result and status of each job, in the order of `job_parameters`.
+            Failed jobs are part of it with the `failed` status.
+        """
+        results: list[tuple[JobResult, str] | None] = [None] * len(job_parameters)
+        async with aclosing(self.post_many_as_completed(job_parameters, to)) as batch:
+            async for index, result, status in batch:
+                results[index] = (result, status)
+        return results
@@ -0,0 +1,125 @@
+"""An alternative to the list + pub/sub based `RedisQueue` which uses redis
+streams.
+
+Jobs are added to one stream which is consumed by all workers through a
+consumer group. Each dispatcher process reads the results of its jobs from its
+own results stream, so there is only one blocking read per process instead of
+one subscription per job.
+
+Results are deleted from the results stream as soon as they were read. The
+workers refresh the expiry of a results stream with every result, so the
+stream of a dispatcher which died without closing it is removed by redis.
+"""
+
+import asyncio
+import logging
+from asyncio import timeout
+
+from redis import asyncio as redis_aio
+from redis.client import Pipeline
+
+from qgis_server_light.interface.dispatcher.cache import RenderResultCache
+from qgis_server_light.interface.dispatcher.definitions import DefinitionRegistry
+from qgis_server_light.interface.dispatcher.redis_asio import RedisQueue
+from qgis_server_light.interface.job.codec import JobCodec
+from qgis_server_light.interface.job.common.input import QslJobInfoParameter
+from qgis_server_light.interface.job.common.output import JobResult
+
+
+class RedisStreamQueue(RedisQueue):
+    job_stream_name: str = "job_stream"
+    job_group_name: str = "workers"
+    result_stream_name: str = "results"
+    # both streams are trimmed (approximately) to these lengths
+    job_stream_max_length: int = 100000
+    result_stream_max_length: int = 10000
+    # seconds a results stream is kept after the last result was added
+    result_stream_expire: int = 600
+    # how long one blocking read on the results stream waits (milliseconds)
+    result_read_block: int = 5000
+
+    def __init__(
+        self,
+        redis_client: redis_aio.Redis,
+        result_cache: RenderResultCache | None = None,
+        coalesce: bool = False,
+        codec: JobCodec | None = None,
+        definitions: DefinitionRegistry | None = None,
+    ) -> None:
+        pool = getattr(redis_client, "connection_pool", None)
+        if pool is not None and pool.connection_kwargs.get("decode_responses"):
+            raise ValueError(
+                "Results are binary, the redis client must not decode responses"
+            )
+        super().__init__(redis_client, result_cache, coalesce, codec, definitions)
+        self.result_stream = f"{self.result_stream_name}:{self.id}"
+        self.reply_to = self.result_stream
+        self._last_result_id = "0-0"
+
+    async def _listen(self):
+        """Reads the results stream of this dispatcher and hands each result
+        to the job waiting for it.
+        """
+        # the stream keeps all results, even those added before we read
+        self._set_listener_ready()
+        try:
+            while True:
+                response = await self.client.xread(
+                    {self.result_stream: self._last_result_id},
+                    block=self.result_read_block,
+                )
+                for _, entries in response or []:
+                    for entry_id, entry in entries:
+                        self._last_result_id = entry_id
+                        self._deliver(
+                            entry[b"id"].decode(),
+                            (entry[b"data"], entry[b"status"].decode()),
+                        )
+                    # the results are in memory now, nobody reads them again
+                    await self.client.xdel(
+                        self.result_stream, *(entry_id for entry_id, _ in entries)
+                    )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error("Reading results stream failed", exc_info=True)
+            self._fail_pending(e)
+
+    def job_mapping(
+        self, job_info: QslJobInfoParameter, deadline: float | None = None
+    ) -> dict[str, str]:
+        mapping = super().job_mapping(job_info, deadline)
+        # the results stream is passed with the stream entry
+        del mapping[self.job_reply_to_key]
+        return mapping
+
+    async def push_jobs(self, pipeline: Pipeline, job_ids: list[str]):
+        """Adds the jobs to the job stream."""
+        for job_id in job_ids:
+            await pipeline.xadd(
+                self.job_stream_name,
+                {"id": job_id, "reply_to": self.result_stream},
+                maxlen=self.job_stream_max_length,
+                approximate=True,
+            )
+
+    async def wait_for_result(self, job_id: str, to: float) -> tuple[JobResult, str]:
+        """Waits maximum `to` seconds for the result of a queued job.
+
+        Raises:
+            asyncio.TimeoutError: When the job did not finish in time.
+        """
+        try:
+            async with timeout(to):
+                data, status = await asyncio.shield(self._pending[job_id])
+        finally:
+            self.release_result(job_id)
+        result = await self.load_result(data)
+        return result, status
+
+    async def close(self):
+        """Stops reading results and removes the results stream of this
+        dispatcher.
+        """
+        await super().close()
+        await self.client.delete(self.result_stream)
@@ -0,0 +1,231 @@
+"""Queue level latency telemetry, meant to be polled by an autoscaler.
+
+Workers add one sample of the time a job waited in the queue and one of the
+time it took to serve it to capped lists per job type, with the pipeline
+which publishes the result. `QueueTelemetry` turns the samples of a rolling
+window into percentiles and adds the queue depth and the number of (busy)
+workers, so scaling can be based on the time jobs wait instead of CPU.
+
+Queue wait is measured from the clock of the dispatcher to the clock of the
+worker, so the clocks of both have to be in sync (as for deadlines).
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from redis import asyncio as redis_aio
+from redis.client import Pipeline
+from redis.exceptions import ResponseError
+
+from qgis_server_light.interface.dispatcher.redis_asio import RedisQueue
+from qgis_server_light.interface.dispatcher.redis_stream_asio import RedisStreamQueue
+from qgis_server_light.interface.worker.info import Status as WorkerStatus
+
+
+def percentile(values: list[float], percent: float) -> float:
+    """The nearest-rank percentile of already sorted values."""
+    rank = max(math.ceil(percent / 100 * len(values)), 1)
+    return values[rank - 1]
+
+
+def _decode(value: bytes | str | None) -> str | None:
+    if isinstance(value, bytes):
+        return value.decode()
+    return value
+
+
+class QueueTelemetry:
+    """Aggregates the latency samples written by the workers.
+
+    Attributes:
+        client: The redis client.
+        window: Only samples of the last `window` seconds are aggregated.
+        queue_backend: The queue backend the workers consume (`list` or
+            `stream`), it decides how the queue depth is determined.
+    """
+
+    wait_name: str = "telemetry:wait"
+    service_name: str = "telemetry:service"
+    types_name: str = "telemetry:types"
+    # samples kept per job type, older ones are trimmed by the workers
+    sample_limit: int = 1000
+    percentiles: tuple[float, ...] = (50, 90, 99)
+
+    def __init__(
+        self,
+        client: redis_aio.Redis,
+        window: float = 300.0,
+        queue_backend: str = "list",
+    ) -> None:
+        self.client = client
+        self.window = window
+        self.queue_backend = queue_backend
+
+    @classmethod
+    def record(
+        cls,
+        pipeline: Pipeline,
+        job_type: str,
+        wait: float,
+        service: float,
+        now: float | None = None,
+    ) -> None:
+        """Queues the samples of a served job on the (synchronous) pipeline of
+        a worker.
+
+        Args:
+            pipeline: The pipeline which publishes the result.
+            job_type: The class name of the job info.
+            wait: Seconds the job waited in the queue.
+            service: Seconds the worker spent on the job.
+            now: The time of the samples, defaults to now.
+        """
+        now = time.time() if now is None else now
+        for name, value in ((cls.wait_name, wait), (cls.service_name, service)):
+            key = f"{name}:{job_type}"
+            pipeline.lpush(key, f"{now!r} {value!r}")
+            pipeline.ltrim(key, 0, cls.sample_limit - 1)
+        pipeline.sadd(cls.types_name, job_type)
+
+    def summarize(self, samples: list, now: float) -> dict[str, float | int]:
+        """Percentiles, mean and maximum of the samples within the window."""
+        values = []
+        for sample in samples:
+            timestamp, value = _decode(sample).split(" ")
+            if now - float(timestamp) <= self.window:
+                values.append(float(value))
+        summary: dict[str, float | int] = {"count": len(values)}
+        if values:
+            values.sort()
+            for percent in self.percentiles:
+                summary[f"p{percent:g}"] = percentile(values, percent)
+            summary["mean"] = sum(values) / len(values)
+            summary["max"] = values[-1]
+        return summary
+
+    async def queue_depth(self) -> int:
+        """The number of jobs no worker claimed yet."""
+        if self.queue_backend == "stream":
+            try:
+                groups = await self.client.xinfo_groups(
+                    RedisStreamQueue.job_stream_name
+                )
+            except ResponseError:
+                # the stream does not exist (yet)
+                return 0
+            for group in groups:
+                if _decode(group["name"]) == RedisStreamQueue.job_group_name:
+                    return int(group.get("lag") or 0)
+            return 0
+        return await self.client.llen(RedisQueue.job_queue_name)
+
+    async def oldest_wait(self, now: float) -> float | None:
+        """Seconds the next job of the list backend is waiting already."""
+        if self.queue_backend != "list":
+            return None
+        job_id = await self.client.lindex(RedisQueue.job_queue_name, 0)
+        if job_id is None:
+            return None
+        enqueued = await self.client.hget(
+            f"job:{_decode(job_id)}", RedisQueue.job_enqueued_key
+        )
+        if enqueued is None:
+            return None
+        return max(now - float(enqueued), 0.0)
+
+    async def worker_counts(self) -> dict[str, int]:
+        """The number of registered workers which are alive and how many of
+        them are processing a job.
+        """
+        worker_ids = await self.client.smembers(RedisQueue.worker_set_name)
+        async with self.client.pipeline(transaction=False) as p:
+            for worker_id in worker_ids:
+                await p.hget(f"worker:{_decode(worker_id)}", "status")
+            statuses = [_decode(status) for status in await p.execute()]
+        alive = [status for status in statuses if status is not None]
+        return {
+            "active": len(alive),
+            "busy": alive.count(WorkerStatus.PROCESSING.value),
+        }
+
+    async def snapshot(self) -> dict:
+        """Collects all telemetry into one document.
+
+        Returns:
+            The queue depth, the age of the oldest queued job, the worker
+            counts and per job type the percentiles of the queue wait and
+            the service time.
+        """
+        now = time.time()
+        job_types = sorted(
+            _decode(job_type)
+            for job_type in await self.client.smembers(self.types_name)
+        )
+        async with self.client.pipeline(transaction=False) as p:
+            for job_type in job_types:
+                await p.lrange(f"{self.wait_name}:{job_type}", 0, -1)
+                await p.lrange(f"{self.service_name}:{job_type}", 0, -1)
+            samples = await p.execute()
+        return {
+            "timestamp": now,
+            "window": self.window,
+            "queue_depth": await self.queue_depth(),
+            "oldest_wait": await self.oldest_wait(now),
+            "workers": await self.worker_counts(),
+            "job_types": {
+                job_type: {
+                    "wait": self.summarize(samples[2 * index], now),
+                    "service": self.summarize(samples[2 * index + 1], now),
+                }
+                for index, job_type in enumerate(job_types)
+            },
+        }
+
+
+def main() -> None:
+    """Serves the telemetry as JSON document over HTTP."""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--redis-url", type=str, help="redis url", required=True)
+    parser.add_argument("--port", type=int, help="HTTP port", default=9130)
+    parser.add_argument(
+        "--window",
+        type=float,
+        help="Seconds of samples which are aggregated. Defaults to 300",
+        default=300.0,
+    )
+    parser.add_argument(
+        "--queue-backend",
+        type=str,
+        choices=("list", "stream"),
+        help="The queue backend the workers consume. Defaults to list",
+        default="list",
+    )
+    args = parser.parse_args()
+
+    async def snapshot() -> dict:
+        client = redis_aio.Redis.from_url(args.redis_url)
+        try:
+            return await QueueTelemetry(
+                client, args.window, args.queue_backend
+            ).snapshot()
+        finally:
+            await client.aclose()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = json.dumps(asyncio.run(snapshot())).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    ThreadingHTTPServer(("", args.port), Handler).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""Codecs for the job infos which are stored in the `job:{id}` hash.
+
+The codec a job info was encoded with is part of the `info_type` field of the
+hash (`QslJobInfoRender;codec=fast`). A worker decodes every job with the
+codec named there, so dispatchers can switch codecs without coordinating with
+the workers. An `info_type` without a codec is the xsdata JSON of before.
+"""
+
+import dataclasses
+import enum
+import types
+import typing
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Type, TypeVar
+
+import orjson
+from xsdata.formats.dataclass.parsers import JsonParser
+from xsdata.formats.dataclass.serializers import JsonSerializer
+
+from qgis_server_light.interface.job.common.input import QslJobInfoParameter
+
+T = TypeVar("T", bound=QslJobInfoParameter)
+
+CODEC_SEPARATOR = ";codec="
+
+
+class JobCodec(ABC):
+    """Encodes job infos for the queue and decodes them in the worker."""
+
+    name: str
+
+    @abstractmethod
+    def encode(self, job_info: QslJobInfoParameter) -> str | bytes:
+        """Encodes the job info."""
+
+    @abstractmethod
+    def decode(self, data: str | bytes, job_info_class: Type[T]) -> T:
+        """Decodes a job info of the passed class."""
+
+
+class XsdataJsonCodec(JobCodec):
+    """The generic xsdata JSON binding. It is self describing but walks the
+    metadata of every field for every job.
+    """
+
+    name = "xsdata"
+
+    def encode(self, job_info: QslJobInfoParameter) -> str:
+        return JsonSerializer().render(job_info)
+
+    def decode(self, data: str | bytes, job_info_class: Type[T]) -> T:
+        if isinstance(data, bytes):
+            return JsonParser().from_bytes(data, job_info_class)
+        return JsonParser().from_string(data, job_info_class)
+
+
+Converter = Callable[[Any], Any]
+
+
+def _strip_optional(hint: Any) -> Any:
+    """Strips `None` of an optional type hint."""
+    if typing.get_origin(hint) in (typing.Union, types.UnionType):
+        args = [arg for arg in typing.get_args(hint) if arg is not type(None)]
+        if len(args) < len(typing.get_args(hint)):
+            return args[0] if len(args) == 1 else typing.Union[tuple(args)]
+    return hint
+
+
+def _is_dataclass_union(hint: Any) -> bool:
+    return typing.get_origin(hint) in (typing.Union, types.UnionType) and all(
+        dataclasses.is_dataclass(option) for option in typing.get_args(hint)
+    )
+
+
+class FastJobCodec(JobCodec):
+    """A compact JSON codec which is compiled once per job info class.
+
+    A dataclass is encoded as array of its field values in field order, a
+    value of a union of dataclasses as `[index of its class, value]`. The
+    plan how to encode and decode each field is derived from the type hints
+    the first time a class is seen and reused for every job after, strings
+    (like the base64 encoded styles) are passed to orjson untouched.
+    """
+
+    name = "fast"
+
+    def __init__(self) -> None:
+        self._encoders: dict[Any, Converter | None] = {}
+        self._decoders: dict[Any, Converter | None] = {}
+
+    def _encoder(self, hint: Any) -> Converter | None:
+        """The converter of a value of the type hint to plain JSON types or
+        `None` if the value is one already.
+        """
+        key = hint
+        if key in self._encoders:
+            return self._encoders[key]
+        hint = _strip_optional(hint)
+        origin = typing.get_origin(hint)
+        encoder: Converter | None = None
+        if dataclasses.is_dataclass(hint):
+            hints = typing.get_type_hints(hint)
+            plan = [
+                (f.name, self._encoder(hints[f.name])) for f in dataclasses.fields(hint)
+            ]
+
+            def encoder(value):
+                if value is None:
+                    return None
+                values = value.__dict__
+                return [
+                    values[name] if convert is None else convert(values[name])
+                    for name, convert in plan
+                ]
+
+        elif origin in (list, tuple, set):
+            (item,) = typing.get_args(hint)[:1] or (Any,)
+            convert_item = self._encoder(item)
+            if convert_item is not None:
+
+                def encoder(value):
+                    if value is None:
+                        return None
+                    return [convert_item(item) for item in value]
+
+        elif _is_dataclass_union(hint):
+            options = typing.get_args(hint)
+            indexes = {option: index for index, option in enumerate(options)}
+            converters = [self._encoder(option) for option in options]
+
+            def encoder(value):
+                if value is None:
+                    return None
+                index = indexes[type(value)]
+                convert = converters[index]
+                return [index, value if convert is None else convert(value)]
+
+        elif isinstance(hint, type) and issubclass(hint, enum.Enum):
+
+            def encoder(value):
+                return None if value is None else value.value
+
+        self._encoders[key] = encoder
+        return encoder
+
+    def _decoder(self, hint: Any) -> Converter | None:
+        """The converter of a decoded JSON value to the type hint or `None`
+        if no conversion is necessary.
+        """
+        key = hint
+        if key in self._decoders:
+            return self._decoders[key]
+        hint = _strip_optional(hint)
+        origin = typing.get_origin(hint)
+        decoder: Converter | None = None
+        if dataclasses.is_dataclass(hint):
+            cls = hint
+            hints = typing.get_type_hints(cls)
+            plan = [
+                (f.name, self._decoder(hints[f.name])) for f in dataclasses.fields(cls)
+            ]
+
+            def decoder(value):
+                if value is None:
+                    return None
+                return cls(
+                    **{
+                        name: item if convert is None else convert(item)
+                        for (name, convert), item in zip(plan, value)
+                    }
+                )
+
+        elif origin in (list, tuple, set):
+            (item,) = typing.get_args(hint)[:1] or (Any,)
+            convert_item = self._decoder(item)
+            if convert_item is not None or origin is not list:
+
+                def decoder(value):
+                    if value is None:
+                        return None
+                    if convert_item is None:
+                        return origin(value)
+                    return origin(convert_item(item) for item in value)
+
+        elif _is_dataclass_union(hint):
+            converters = [self._decoder(option) for option in typing.get_args(hint)]
+
+            def decoder(value):
+                if value is None:
+                    return None
+                index, item = value
+                convert = converters[index]
+                return item if convert is None else convert(item)
+
+        elif isinstance(hint, type) and issubclass(hint, enum.Enum):
+            enum_class = hint
+
+            def decoder(value):
+                return None if value is None else enum_class(value)
+
+        self._decoders[key] = decoder
+        return decoder
+
+    def encode(self, job_info: QslJobInfoParameter) -> bytes:
+        return orjson.dumps(self._encoder(type(job_info))(job_info))
+
+    def decode(self, data: str | bytes, job_info_class: Type[T]) -> T:
+        return self._decoder(job_info_class)(orjson.loads(data))
+
+
+CODECS: dict[str, JobCodec] = {
+    codec.name: codec for codec in (XsdataJsonCodec(), FastJobCodec())
+}
+DEFAULT_CODEC = CODECS[XsdataJsonCodec.name]
+
+
+def codec_info_type(job_info: QslJobInfoParameter, codec: JobCodec) -> str:
+    """The `info_type` of a job info encoded with the codec. The default
+    codec is not named, so older workers still understand it.
+    """
+    info_type = job_info.__class__.__name__
+    if codec.name == DEFAULT_CODEC.name:
+        return info_type
+    return f"{info_type}{CODEC_SEPARATOR}{codec.name}"
+
+
+def split_info_type(info_type: str) -> tuple[str, str]:
+    """Splits an `info_type` into the name of the job info class and the
+    name of the codec.
+    """
+    job_type, _, codec_name = info_type.partition(CODEC_SEPARATOR)
+    return job_type, codec_name or DEFAULT_CODEC.name
+
+
+def codec_by_name(name: str) -> JobCodec:
+    """The codec with the name.
+
+    Raises:
+        LookupError: When there is no such codec.
+    """
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise LookupError(f"Unknown job codec '{name}'")
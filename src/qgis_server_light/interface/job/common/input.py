@@ -83,6 +83,10 @@ class QslJobLayer(BaseInterface):
     filter: OgcFilter110 | OgcFilterFES20 | None = field(
         default=None, metadata={"type": "Element"}
     )
+    # the hashes of the source and the style definition when they are sent
+    # by reference, `source` and `style.definition` are empty then
+    source_ref: str | None = field(default=None, metadata={"type": "Element"})
+    style_ref: str | None = field(default=None, metadata={"type": "Element"})
 
     @property
     def redacted_fields(self) -> set:
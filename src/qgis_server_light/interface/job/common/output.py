@@ -4,6 +4,29 @@ from typing import Any
 from qgis_server_light.interface.common import BaseInterface
 
 
+@dataclass(repr=False)
+class PhaseTiming(BaseInterface):
+    """The time a worker spent in one phase of a job.
+
+    Attributes:
+        name: The phase, e.g. `claim`, `decode`, `resolve`, `layer`, `style`, `render`
+            or `encode`.
+        wall: Elapsed wall clock time in seconds.
+        cpu: CPU time of the worker process in seconds. This includes the
+            threads QGIS renders in.
+        target: The layer id for phases which run once per layer.
+        cache_hit: For the `layer` phase, if the layer came from the layer
+            cache of the worker. For the `style` phase, if the style was
+            applied to the layer before and did not have to be imported.
+    """
+
+    name: str = field(metadata={"type": "Element"})
+    wall: float = field(metadata={"type": "Element"})
+    cpu: float = field(metadata={"type": "Element"})
+    target: str | None = field(default=None, metadata={"type": "Element"})
+    cache_hit: bool | None = field(default=None, metadata={"type": "Element"})
+
+
 @dataclass
 class JobResult(BaseInterface):
     id: str = field(metadata={"type": "Element"})
@@ -11,6 +34,10 @@ class JobResult(BaseInterface):
     content_type: str = field(metadata={"type": "Element"})
     worker_id: str | None = field(default=None, metadata={"type": "Element"})
     worker_host_name: str | None = field(default=None, metadata={"type": "Element"})
+    status: str | None = field(default=None, metadata={"type": "Element"})
+    timings: list[PhaseTiming] | None = field(
+        default=None, metadata={"type": "Element"}
+    )
 
     @property
     def shortened_fields(self) -> set:
@@ -0,0 +1,182 @@
+import dataclasses
+import math
+from dataclasses import dataclass, field
+
+from qgis_server_light.interface.common import BBox
+from qgis_server_light.interface.job.common.input import (
+    QslJobInfoParameter,
+    QslJobLayer,
+    QslJobParameter,
+)
+
+
+@dataclass(frozen=True)
+class TileMatrixSet:
+    """A tile matrix set where each zoom level doubles the number of tiles
+    in both directions.
+
+    Attributes:
+        crs: The CRS as it is passed to QGIS, with x/y axis order.
+        x_min: The left edge of the matrix.
+        y_max: The top edge of the matrix, tiles are counted from it.
+        span: The width (and height) of one tile on zoom level 0.
+        matrix_width: The number of tiles in x direction on zoom level 0.
+        matrix_height: The number of tiles in y direction on zoom level 0.
+    """
+
+    crs: str
+    x_min: float
+    y_max: float
+    span: float
+    matrix_width: int = 1
+    matrix_height: int = 1
+
+    def size(self, z: int) -> tuple[int, int]:
+        """The number of tiles in x and y direction on a zoom level."""
+        return self.matrix_width << z, self.matrix_height << z
+
+    def tile_range(self, bbox: BBox, z: int) -> tuple[range, range]:
+        """The columns and rows of the tiles on a zoom level which intersect
+        a bbox (in the CRS of the tile matrix set).
+        """
+        span = self.span / (1 << z)
+        width, height = self.size(z)
+        columns = range(
+            max(math.floor((bbox.x_min - self.x_min) / span), 0),
+            min(math.ceil((bbox.x_max - self.x_min) / span), width),
+        )
+        rows = range(
+            max(math.floor((self.y_max - bbox.y_max) / span), 0),
+            min(math.ceil((self.y_max - bbox.y_min) / span), height),
+        )
+        return columns, rows
+
+
+# the tile matrix sets of OGC TMS 2.0 which are supported by tile jobs
+TILE_MATRIX_SETS: dict[str, TileMatrixSet] = {
+    "WebMercatorQuad": TileMatrixSet(
+        crs="EPSG:3857",
+        x_min=-20037508.3427892,
+        y_max=20037508.3427892,
+        span=2 * 20037508.3427892,
+    ),
+    "WorldCRS84Quad": TileMatrixSet(
+        crs="CRS:84", x_min=-180.0, y_max=90.0, span=180.0, matrix_width=2
+    ),
+}
+
+
+@dataclass(kw_only=True)
+class QslJobParameterTile(QslJobParameter):
+    """A tile of a tile matrix set. It is rendered as part of a metatile of
+    `metatile` x `metatile` tiles, so labels and features are placed once
+    for all of them. The other tiles of the metatile are stored in the
+    result cache.
+
+    The map settings of the metatile are exposed like the ones of a
+    `QslJobParameterRender` (`bbox`, `crs`, `width` and `height`).
+    """
+
+    layers: list[QslJobLayer] = field(metadata={"type": "Element"})
+    tile_matrix_set: str = field(
+        default="WebMercatorQuad", metadata={"type": "Element"}
+    )
+    z: int = field(metadata={"type": "Element"})
+    x: int = field(metadata={"type": "Element"})
+    y: int = field(metadata={"type": "Element"})
+    metatile: int = field(default=4, metadata={"type": "Element"})
+    tile_size: int = field(default=256, metadata={"type": "Element"})
+    dpi: int | None = field(default=None, metadata={"type": "Element"})
+    format: str = field(default="image/png", metadata={"type": "Element"})
+
+    def __post_init__(self):
+        if self.tile_matrix_set not in TILE_MATRIX_SETS:
+            raise ValueError(f"Unknown tile matrix set '{self.tile_matrix_set}'")
+        if self.metatile < 1:
+            raise ValueError("The metatile factor must be at least 1")
+        width, height = self.matrix_size
+        if not (0 <= self.x < width and 0 <= self.y < height):
+            raise ValueError(f"Tile {self.z}/{self.x}/{self.y} is out of the matrix")
+
+    @property
+    def matrix(self) -> TileMatrixSet:
+        return TILE_MATRIX_SETS[self.tile_matrix_set]
+
+    @property
+    def matrix_size(self) -> tuple[int, int]:
+        """The number of tiles in x and y direction on the zoom level."""
+        return self.matrix.size(self.z)
+
+    @property
+    def metatile_columns(self) -> range:
+        """The columns of the metatile, it is cut at the edge of the matrix."""
+        start = self.x - self.x % self.metatile
+        return range(start, min(start + self.metatile, self.matrix_size[0]))
+
+    @property
+    def metatile_rows(self) -> range:
+        """The rows of the metatile, it is cut at the edge of the matrix."""
+        start = self.y - self.y % self.metatile
+        return range(start, min(start + self.metatile, self.matrix_size[1]))
+
+    def tiles(self) -> list[tuple[int, int]]:
+        """The x and y of all tiles of the metatile, row by row."""
+        return [(x, y) for y in self.metatile_rows for x in self.metatile_columns]
+
+    def sibling(self, x: int, y: int) -> "QslJobParameterTile":
+        """The job of another tile of the same metatile."""
+        return dataclasses.replace(self, x=x, y=y)
+
+    def metatile_origin(self) -> "QslJobParameterTile":
+        """The job of the top left tile of the metatile, which is the same
+        for all tiles of it.
+        """
+        return self.sibling(self.metatile_columns.start, self.metatile_rows.start)
+
+    def tile_bbox(self, x: int, y: int) -> BBox:
+        # each edge is computed from its index, so neighbouring tiles share
+        # exactly the same coordinates
+        span = self.matrix.span / (1 << self.z)
+        return BBox(
+            x_min=self.matrix.x_min + x * span,
+            x_max=self.matrix.x_min + (x + 1) * span,
+            y_min=self.matrix.y_max - (y + 1) * span,
+            y_max=self.matrix.y_max - y * span,
+        )
+
+    @property
+    def crs(self) -> str:
+        return self.matrix.crs
+
+    @property
+    def bbox(self) -> BBox:
+        """The extent of the metatile."""
+        top_left = self.tile_bbox(self.metatile_columns[0], self.metatile_rows[0])
+        bottom_right = self.tile_bbox(self.metatile_columns[-1], self.metatile_rows[-1])
+        return BBox(
+            x_min=top_left.x_min,
+            x_max=bottom_right.x_max,
+            y_min=bottom_right.y_min,
+            y_max=top_left.y_max,
+        )
+
+    @property
+    def width(self) -> int:
+        """The width of the metatile in pixels."""
+        return len(self.metatile_columns) * self.tile_size
+
+    @property
+    def height(self) -> int:
+        """The height of the metatile in pixels."""
+        return len(self.metatile_rows) * self.tile_size
+
+    def get_layer_by_name(self, name: str) -> QslJobLayer:
+        for layer in self.layers:
+            if layer.name == name:
+                return layer
+        raise LookupError(f'No layer with name "{name}" was found.')
+
+
+@dataclass
+class QslJobInfoTile(QslJobInfoParameter):
+    job: QslJobParameterTile = field(metadata={"type": "Element", "required": True})
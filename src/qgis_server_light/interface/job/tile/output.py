@@ -0,0 +1,29 @@
+from dataclasses import dataclass, field
+from typing import Any
+
+from qgis_server_light.interface.common import BaseInterface
+from qgis_server_light.interface.job.common.output import JobResult
+
+
+@dataclass(repr=False)
+class TileSibling(BaseInterface):
+    """Another tile of the metatile a tile job rendered."""
+
+    x: int = field(metadata={"type": "Element"})
+    y: int = field(metadata={"type": "Element"})
+    data: Any = field(metadata={"type": "Element"})
+
+    @property
+    def shortened_fields(self) -> set:
+        return {"data"}
+
+
+@dataclass
+class TileJobResult(JobResult):
+    """The result of a tile job. The siblings stay on the worker, which
+    stores them in the result cache, they are not published.
+    """
+
+    siblings: list[TileSibling] = field(
+        default_factory=list, metadata={"type": "Element"}
+    )
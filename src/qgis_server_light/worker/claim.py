@@ -0,0 +1,493 @@
+"""Reliable claiming of jobs from the redis queue.
+
+A job id is never only popped from the queue. With the list backend it is
+atomically moved to a processing list which belongs to the claiming worker
+(`processing:{worker_id}`) and stays there until the worker released it after
+publishing the result. If a worker dies in between, its `worker:{id}` hash
+expires and any other worker puts the orphaned job ids back to the front of the
+queue. With the stream backend the consumer group keeps track of the pending
+jobs. Entries which are pending for too long at a consumer whose `worker:{id}`
+hash expired are reclaimed with `XCLAIM`. Jobs of a live worker are never
+taken over, however long they render.
+"""
+
+import datetime
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from dataclasses import dataclass
+
+from redis.client import Pipeline, Redis
+from redis.exceptions import ResponseError
+
+from qgis_server_light.interface.dispatcher.common import Status
+from qgis_server_light.interface.dispatcher.redis_asio import RedisQueue
+from qgis_server_light.interface.dispatcher.redis_stream_asio import RedisStreamQueue
+from qgis_server_light.interface.job.codec import split_info_type
+from qgis_server_light.interface.job.common.output import PhaseTiming
+from qgis_server_light.worker.timing import measure
+
+# Marks the job KEYS[1] with the id ARGV[1] as running and returns its
+# payload. Jobs nobody waits for anymore are skipped: if the dispatcher
+# cancelled the job or its deadline passed (which marks it expired) only the
+# id, the lease (so coalesced waiters can be told) and the status are
+# returned.
+MARK_RUNNING_FUNCTION = """
+local function mark_running(job_key, job_id)
+    local payload = redis.call(
+        "HMGET", job_key,
+        ARGV[2], ARGV[3], ARGV[11], ARGV[12], ARGV[13], ARGV[4], ARGV[18]
+    )
+    if not payload[1] then
+        return {job_id}
+    end
+    if payload[6] == ARGV[15] then
+        return {job_id, false, false, false, payload[4], ARGV[15]}
+    end
+    if payload[5] and tonumber(payload[5]) < tonumber(ARGV[14]) then
+        redis.call(
+            "HSET", job_key,
+            ARGV[4], ARGV[16],
+            ARGV[17], ARGV[7],
+            ARGV[8], ARGV[7]
+        )
+        return {job_id, false, false, false, payload[4], ARGV[16]}
+    end
+    redis.call(
+        "HSET", job_key,
+        ARGV[4], ARGV[5],
+        ARGV[6], ARGV[7],
+        ARGV[8], ARGV[7],
+        ARGV[9], ARGV[10]
+    )
+    return {
+        job_id, payload[1], payload[2], payload[3], payload[4], false, payload[5],
+        payload[7]
+    }
+end
+"""
+
+MARK_RUNNING_SCRIPT = MARK_RUNNING_FUNCTION + "return mark_running(KEYS[1], ARGV[1])"
+
+# Marks a job which was moved to the processing list KEYS[2] as running and
+# returns its payload. A job which is skipped is removed from the list again.
+CLAIM_SCRIPT = (
+    MARK_RUNNING_FUNCTION
+    + """
+local claimed = mark_running(KEYS[1], ARGV[1])
+if not claimed[2] then
+    -- the job was cleaned up, cancelled or expired, nobody waits for it
+    redis.call("LREM", KEYS[2], 1, ARGV[1])
+end
+return claimed
+"""
+)
+
+# Puts the jobs of the processing list KEYS[2] of a worker back to the front
+# of the queue KEYS[3] (keeping their order) and removes the worker ARGV[1]
+# from the worker set KEYS[4], unless its heartbeat KEYS[1] is alive again.
+REAP_SCRIPT = """
+if redis.call("EXISTS", KEYS[1]) == 1 then
+    return 0
+end
+local requeued = 0
+while redis.call("LMOVE", KEYS[2], KEYS[3], "RIGHT", "LEFT") do
+    requeued = requeued + 1
+end
+redis.call("SREM", KEYS[4], ARGV[1])
+return requeued
+"""
+
+# Releases the lease KEYS[2] of a coalesced job ARGV[1] and returns (and
+# removes) its waiters KEYS[1]. Both happens at once, so a dispatcher either
+# joined before and gets the result or finds no lease and queues a new job.
+TAKE_WAITERS_FUNCTION = """
+local function take_waiters()
+    if redis.call("GET", KEYS[2]) == ARGV[1] then
+        redis.call("DEL", KEYS[2])
+    end
+    local waiters = redis.call("SMEMBERS", KEYS[1])
+    redis.call("DEL", KEYS[1])
+    return waiters
+end
+"""
+
+# Publishes the result ARGV[2] to all waiters of a coalesced job.
+PUBLISH_WAITERS_SCRIPT = (
+    TAKE_WAITERS_FUNCTION
+    + """
+local waiters = take_waiters()
+for _, channel in ipairs(waiters) do
+    redis.call("PUBLISH", channel, ARGV[2])
+end
+return #waiters
+"""
+)
+
+# Adds the result ARGV[2] with the status ARGV[3] to the results streams of
+# all waiters of a coalesced job. The streams are trimmed to ARGV[4] and
+# expire ARGV[5] seconds after this result.
+XADD_WAITERS_SCRIPT = (
+    TAKE_WAITERS_FUNCTION
+    + """
+local waiters = take_waiters()
+for _, stream in ipairs(waiters) do
+    redis.call(
+        "XADD", stream, "MAXLEN", "~", ARGV[4], "*",
+        "id", ARGV[1], "status", ARGV[3], "data", ARGV[2]
+    )
+    redis.call("EXPIRE", stream, ARGV[5])
+end
+return #waiters
+"""
+)
+
+
+@dataclass
+class ClaimedJob:
+    """A job which was claimed by a worker.
+
+    Attributes:
+        id: The id of the job.
+        info: The serialized job info. It is `None` when the job was
+            already removed by the dispatcher.
+        info_type: The class name of the serialized job info, together with
+            the codec it was encoded with.
+        reply_to: The channel or stream the result has to be delivered to.
+        lease: The lease key of a coalesced job. Its result is delivered to
+            the waiters of the lease as well, also when it is skipped.
+        status: The status of a job which was skipped because nobody waits
+            for it anymore (`cancelled` or `expired`).
+        deadline: The absolute time (unix timestamp) after which nobody waits
+            for the result anymore.
+        enqueued: The time (unix timestamp) the dispatcher queued the job.
+        timing: The time it took to claim the job, without the time spent
+            blocking on an empty queue.
+    """
+
+    id: str
+    info: str | None = None
+    info_type: str | None = None
+    reply_to: str | None = None
+    lease: str | None = None
+    status: str | None = None
+    deadline: str | None = None
+    enqueued: str | None = None
+    timing: PhaseTiming | None = None
+
+    @property
+    def job_type(self) -> str | None:
+        """The class name of the job info."""
+        if self.info_type is None:
+            return None
+        return split_info_type(self.info_type)[0]
+
+
+class JobClaimer(ABC):
+    """The worker side of a queue backend. It claims jobs, publishes their
+    results and releases them again.
+    """
+
+    def __init__(self, client: Redis, worker_id: str) -> None:
+        self.client = client
+        self.worker_id = worker_id
+        self._mark_running_script = client.register_script(MARK_RUNNING_SCRIPT)
+
+    @staticmethod
+    def _job_key(job_id: str) -> str:
+        return f"job:{job_id}"
+
+    @staticmethod
+    def _script_args(job_id: str) -> list[str]:
+        return [
+            job_id,
+            RedisQueue.job_info_key,
+            RedisQueue.job_info_type_key,
+            RedisQueue.job_status_key,
+            Status.RUNNING.value,
+            f"{RedisQueue.job_timestamp_key}.{Status.RUNNING.value}",
+            datetime.datetime.now().isoformat(),
+            RedisQueue.job_last_update_key,
+            RedisQueue.job_duration_key,
+            "0.0",
+            RedisQueue.job_reply_to_key,
+            RedisQueue.job_lease_key,
+            RedisQueue.job_deadline_key,
+            repr(time.time()),
+            Status.CANCELLED.value,
+            Status.EXPIRED.value,
+            f"{RedisQueue.job_timestamp_key}.{Status.EXPIRED.value}",
+            RedisQueue.job_enqueued_key,
+        ]
+
+    def publish_to_waiters(
+        self,
+        pipeline: Pipeline,
+        claimed: ClaimedJob,
+        data: memoryview,
+        status: str,
+    ) -> None:
+        """Queues the delivery of a result envelope to the waiters of a
+        coalesced job only, and releases its lease.
+        """
+        if claimed.lease is None:
+            return
+        self._waiters_script(
+            keys=[f"{RedisQueue.job_waiters_name}:{claimed.id}", claimed.lease],
+            args=[
+                claimed.id,
+                data,
+                status,
+                RedisStreamQueue.result_stream_max_length,
+                RedisStreamQueue.result_stream_expire,
+            ],
+            client=pipeline,
+        )
+
+    def _mark_running(self, job_id: str) -> ClaimedJob:
+        with measure("claim") as timing:
+            result = self._mark_running_script(
+                keys=[self._job_key(job_id)], args=self._script_args(job_id)
+            )
+        return ClaimedJob(*result, timing=timing)
+
+    @abstractmethod
+    def claim(self, timeout: int) -> ClaimedJob | None:
+        """Claims the next job or waits up to `timeout` seconds for one.
+
+        Args:
+            timeout: Seconds to block when the queue is empty.
+
+        Returns:
+            The claimed job or `None` when no job arrived within the timeout.
+        """
+
+    @abstractmethod
+    def publish(
+        self, pipeline: Pipeline, claimed: ClaimedJob, data: memoryview, status: str
+    ) -> None:
+        """Queues the delivery of a result envelope on the pipeline."""
+
+    @abstractmethod
+    def release(self, pipeline: Pipeline, claimed: ClaimedJob) -> None:
+        """Marks a finished job as done. This is queued on the pipeline which
+        publishes the result, so no extra round trip is needed.
+        """
+
+    @abstractmethod
+    def reap(self) -> int:
+        """Rescues the jobs of dead workers.
+
+        Returns:
+            The number of rescued jobs.
+        """
+
+
+class RedisJobClaimer(JobClaimer):
+    """Claims jobs from the `jobs` list.
+
+    A claim moves the next job id to the processing list of the worker with
+    `BLMOVE` and marks the job as running with a script, which declares the
+    keys of the job. If marking the job fails, the id is kept and marking it
+    is retried with the next claim, so the job is not stranded in the
+    processing list of a live worker.
+    """
+
+    def __init__(self, client: Redis, worker_id: str) -> None:
+        super().__init__(client, worker_id)
+        self.processing_list_name = f"{RedisQueue.job_processing_list_name}:{worker_id}"
+        self._claim_script = client.register_script(CLAIM_SCRIPT)
+        self._reap_script = client.register_script(REAP_SCRIPT)
+        self._waiters_script = client.register_script(PUBLISH_WAITERS_SCRIPT)
+        # the job which was moved to the processing list but not marked yet
+        self._moved: str | None = None
+
+    def claim(self, timeout: int) -> ClaimedJob | None:
+        if self._moved is None:
+            self._moved = self.client.blmove(
+                RedisQueue.job_queue_name,
+                self.processing_list_name,
+                timeout,
+                "LEFT",
+                "RIGHT",
+            )
+            if self._moved is None:
+                return None
+        with measure("claim") as timing:
+            result = self._claim_script(
+                keys=[self._job_key(self._moved), self.processing_list_name],
+                args=self._script_args(self._moved),
+            )
+        self._moved = None
+        return ClaimedJob(*result, timing=timing)
+
+    def publish(
+        self, pipeline: Pipeline, claimed: ClaimedJob, data: memoryview, status: str
+    ) -> None:
+        # results of jobs from dispatchers without a result channel are
+        # published on a channel of their own
+        channel = claimed.reply_to or f"{RedisQueue.job_channel_name}:{claimed.id}"
+        pipeline.publish(channel, data)
+        self.publish_to_waiters(pipeline, claimed, data, status)
+
+    def release(self, pipeline: Pipeline, claimed: ClaimedJob) -> None:
+        pipeline.lrem(self.processing_list_name, 1, claimed.id)
+
+    def reap(self) -> int:
+        """Re-queues the jobs of workers whose heartbeat expired."""
+        worker_ids = sorted(self.client.smembers(RedisQueue.worker_set_name))
+        with self.client.pipeline(transaction=False) as p:
+            for worker_id in worker_ids:
+                p.exists(f"worker:{worker_id}")
+            alive = p.execute()
+        requeued = 0
+        for worker_id, exists in zip(worker_ids, alive):
+            if exists:
+                continue
+            # the heartbeat is checked again within the script
+            requeued += self._reap_script(
+                keys=[
+                    f"worker:{worker_id}",
+                    f"{RedisQueue.job_processing_list_name}:{worker_id}",
+                    RedisQueue.job_queue_name,
+                    RedisQueue.worker_set_name,
+                ],
+                args=[worker_id],
+            )
+        return requeued
+
+
+class RedisStreamJobClaimer(JobClaimer):
+    """Claims jobs from the job stream as a consumer of the workers group.
+
+    Args:
+        batch_size: How many jobs are read from the stream at once. Jobs which
+            were read but not processed yet stay pending for this worker.
+        visibility_timeout: Seconds after which a pending job of a dead
+            worker is reclaimed.
+    """
+
+    # how many pending entries are inspected by one reap
+    reap_scan_count: int = 1000
+
+    def __init__(
+        self,
+        client: Redis,
+        worker_id: str,
+        batch_size: int = 1,
+        visibility_timeout: int = 300,
+    ) -> None:
+        super().__init__(client, worker_id)
+        self.batch_size = batch_size
+        self.visibility_timeout = visibility_timeout
+        self._buffer: deque[tuple[str, ClaimedJob]] = deque()
+        self._entry_ids: dict[str, str] = {}
+        self._waiters_script = client.register_script(XADD_WAITERS_SCRIPT)
+        self._create_group()
+
+    def _create_group(self):
+        try:
+            self.client.xgroup_create(
+                RedisStreamQueue.job_stream_name,
+                RedisStreamQueue.job_group_name,
+                id="0",
+                mkstream=True,
+            )
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def _buffer_entries(self, entries: list) -> int:
+        for entry_id, entry in entries:
+            self._buffer.append(
+                (entry_id, ClaimedJob(id=entry["id"], reply_to=entry["reply_to"]))
+            )
+        return len(entries)
+
+    def claim(self, timeout: int) -> ClaimedJob | None:
+        if not self._buffer:
+            response = self.client.xreadgroup(
+                RedisStreamQueue.job_group_name,
+                self.worker_id,
+                {RedisStreamQueue.job_stream_name: ">"},
+                count=self.batch_size,
+                block=timeout * 1000,
+            )
+            for _, entries in response or []:
+                self._buffer_entries(entries)
+        if not self._buffer:
+            return None
+        entry_id, buffered = self._buffer[0]
+        # the entry stays buffered until it was marked, so a failed mark is
+        # retried with the next claim
+        claimed = self._mark_running(buffered.id)
+        self._buffer.popleft()
+        claimed.reply_to = buffered.reply_to
+        if claimed.info is None:
+            # the job was cleaned up, cancelled or expired, nobody waits for it
+            self.client.xack(
+                RedisStreamQueue.job_stream_name,
+                RedisStreamQueue.job_group_name,
+                entry_id,
+            )
+        else:
+            self._entry_ids[claimed.id] = entry_id
+        return claimed
+
+    def publish(
+        self, pipeline: Pipeline, claimed: ClaimedJob, data: memoryview, status: str
+    ) -> None:
+        pipeline.xadd(
+            claimed.reply_to,
+            {"id": claimed.id, "status": status, "data": data},
+            maxlen=RedisStreamQueue.result_stream_max_length,
+            approximate=True,
+        )
+        # the stream of a dispatcher which died is removed after a while
+        pipeline.expire(claimed.reply_to, RedisStreamQueue.result_stream_expire)
+        self.publish_to_waiters(pipeline, claimed, data, status)
+
+    def release(self, pipeline: Pipeline, claimed: ClaimedJob) -> None:
+        entry_id = self._entry_ids.pop(claimed.id, None)
+        if entry_id is not None:
+            pipeline.xack(
+                RedisStreamQueue.job_stream_name,
+                RedisStreamQueue.job_group_name,
+                entry_id,
+            )
+
+    def reap(self) -> int:
+        """Takes over jobs of dead workers which are pending longer than the
+        visibility timeout. They are processed by this worker next.
+        """
+        pending = self.client.xpending_range(
+            RedisStreamQueue.job_stream_name,
+            RedisStreamQueue.job_group_name,
+            min="-",
+            max="+",
+            count=self.reap_scan_count,
+            idle=self.visibility_timeout * 1000,
+        )
+        consumers = sorted({entry["consumer"] for entry in pending} - {self.worker_id})
+        if not consumers:
+            return 0
+        # a worker whose heartbeat is alive still processes its jobs
+        with self.client.pipeline(transaction=False) as p:
+            for consumer in consumers:
+                p.exists(f"worker:{consumer}")
+            alive = p.execute()
+        dead = {consumer for consumer, exists in zip(consumers, alive) if not exists}
+        entry_ids = [
+            entry["message_id"] for entry in pending if entry["consumer"] in dead
+        ]
+        if not entry_ids:
+            return 0
+        claimed = self.client.xclaim(
+            RedisStreamQueue.job_stream_name,
+            RedisStreamQueue.job_group_name,
+            self.worker_id,
+            self.visibility_timeout * 1000,
+            entry_ids,
+        )
+        # entries which were trimmed from the stream meanwhile have no fields
+        return self._buffer_entries([entry for entry in claimed if entry[1]])
@@ -0,0 +1,123 @@
+"""Resolves the sources and style definitions which were sent by reference.
+
+See `qgis_server_light.interface.dispatcher.definitions`. Resolved
+definitions are kept in memory, so redis is only asked for definitions the
+worker did not see yet, with one round trip per job.
+"""
+
+import dataclasses
+from collections import OrderedDict
+from typing import TypeVar
+
+from redis import Redis
+
+from qgis_server_light.interface.common import Style
+from qgis_server_light.interface.dispatcher.definitions import (
+    SOURCE,
+    STYLE,
+    definition_key,
+    map_job_layers,
+)
+from qgis_server_light.interface.job.common.input import QslJobLayer
+
+T = TypeVar("T")
+
+
+class DefinitionResolver:
+    """Puts the referenced definitions back into the job layers.
+
+    Attributes:
+        client: The redis client of the worker.
+        max_entries: The number of definitions kept in memory.
+        hits: Number of definitions found in memory.
+        misses: Number of definitions fetched from redis.
+    """
+
+    def __init__(self, client: Redis, max_entries: int = 4096) -> None:
+        self.client = client
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._definitions: OrderedDict[tuple[str, str], str] = OrderedDict()
+
+    def _refs(self, job_info) -> set[tuple[str, str]]:
+        refs = set()
+
+        def collect(layer: QslJobLayer) -> QslJobLayer:
+            if layer.source_ref is not None:
+                refs.add((SOURCE, layer.source_ref))
+            if layer.style_ref is not None:
+                refs.add((STYLE, layer.style_ref))
+            return layer
+
+        map_job_layers(job_info, collect)
+        return refs
+
+    def _fetch(self, refs: list[tuple[str, str]]) -> dict[tuple[str, str], str]:
+        """Fetches definitions from redis with one round trip.
+
+        Raises:
+            LookupError: When a definition was not registered.
+        """
+        with self.client.pipeline(transaction=False) as p:
+            for kind, ref in refs:
+                p.get(definition_key(kind, ref))
+            definitions = p.execute()
+        fetched = {}
+        for (kind, ref), definition in zip(refs, definitions):
+            if definition is None:
+                raise LookupError(f"The {kind} {ref} is not registered or expired")
+            fetched[(kind, ref)] = definition
+        return fetched
+
+    def resolve(self, job_info: T) -> T:
+        """Replaces the references of a job by their definitions.
+
+        Args:
+            job_info: The decoded job info.
+
+        Returns:
+            The job info with inline definitions only, it is the passed one
+            if it did not carry any references.
+
+        Raises:
+            LookupError: When a referenced definition is unknown.
+        """
+        refs = self._refs(job_info)
+        if not refs:
+            return job_info
+        definitions = {}
+        missing = []
+        for ref in refs:
+            if ref in self._definitions:
+                self._definitions.move_to_end(ref)
+                definitions[ref] = self._definitions[ref]
+            else:
+                missing.append(ref)
+        self.hits += len(definitions)
+        self.misses += len(missing)
+        if missing:
+            fetched = self._fetch(missing)
+            definitions.update(fetched)
+            self._definitions.update(fetched)
+            while len(self._definitions) > self.max_entries:
+                self._definitions.popitem(last=False)
+
+        def convert(layer: QslJobLayer) -> QslJobLayer:
+            changes = {}
+            if layer.source_ref is not None:
+                changes.update(
+                    source=definitions[(SOURCE, layer.source_ref)],
+                    source_ref=None,
+                )
+            if layer.style_ref is not None:
+                name = layer.style.name if layer.style is not None else layer.name
+                changes.update(
+                    style=Style(
+                        name=name, definition=definitions[(STYLE, layer.style_ref)]
+                    ),
+                    style_ref=None,
+                )
+            return dataclasses.replace(layer, **changes) if changes else layer
+
+        return map_job_layers(job_info, convert)
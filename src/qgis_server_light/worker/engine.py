@@ -7,7 +7,9 @@ import pathlib
 import uuid
 from abc import ABC
 from dataclasses import asdict, dataclass
-from typing import Any, List, Optional, Type, Union
+from typing import Callable, List, Optional, Type, Union
+
+from PyQt5.QtCore import QEvent
 
 from qgis_server_light.interface.job.common.input import QslJobInfoParameter
 from qgis_server_light.interface.job.common.output import JobResult
@@ -16,8 +18,16 @@ from qgis_server_light.interface.worker.info import (
     QgisInfo,
     Status,
 )
-from qgis_server_light.worker.qgis import Qgis, version, version_name
+from qgis_server_light.worker.layer_cache import LayerCache
+from qgis_server_light.worker.qgis import (
+    Qgis,
+    dispose_layer,
+    layer_source_path,
+    version,
+    version_name,
+)
 from qgis_server_light.worker.runner.common import JobContext, Runner
+from qgis_server_light.worker.timing import JobTimings
 
 
 @dataclass
@@ -35,7 +45,10 @@ class Engine(ABC):
     ):
         self.qgis = Qgis(svg_paths, log_level)
         self.context = context
-        self.layer_cache: dict[Any, Any] = {}
+        # unbounded unless configured otherwise, see `LayerCache`
+        self.layer_cache = LayerCache(
+            dispose=dispose_layer, source_path=layer_source_path
+        )
         self.available_runner_classes: dict[str, Type[Runner]] = {}
         self.available_runner_classes_by_job_info: dict[str, Type[Runner]] = {}
         self.available_job_info_classes: dict[str, Type[QslJobInfoParameter]] = {}
@@ -100,6 +113,13 @@ class Engine(ABC):
         logging.debug(json.dumps(asdict(worker_info), indent=2))
         return worker_info
 
+    def reinitialize_infos(self):
+        """Gives the engine a fresh identity. This is necessary when a process
+        with an already initialized engine is forked, so that every child is
+        recognizable on its own.
+        """
+        self.info = self._initialize_infos()
+
     def runner_plugin_by_job_info(self, job_info: QslJobInfoParameter) -> Type[Runner]:
         """
         Here we decide which plugin we load dynamically out of the available ones.
@@ -118,15 +138,51 @@ class Engine(ABC):
         except KeyError:
             raise RuntimeError(f"Type {type(job_info)} not supported")
 
-    def process(self, job_info: QslJobInfoParameter) -> JobResult:
+    def process(
+        self,
+        job_info: QslJobInfoParameter,
+        deadline: float | None = None,
+        cancelled: Callable[[], bool] | None = None,
+        timings: JobTimings | None = None,
+    ) -> JobResult:
+        """Runs a job with the matching runner.
+
+        Args:
+            job_info: The job to run.
+            deadline: The absolute time (unix timestamp) after which the
+                runner stops working on the job.
+            cancelled: Tells if the job was cancelled while it is running.
+            timings: Collects the time the runner spends in its phases.
+
+        Raises:
+            JobCancelledError: When the runner stopped because of the
+                deadline or a cancellation.
+        """
         runner_class = self.runner_plugin_by_job_info(job_info)
         runner = runner_class(
             self.qgis,
-            JobContext(self.context.base_path),
+            JobContext(
+                self.context.base_path,
+                deadline,
+                cancelled,
+                timings=timings or JobTimings(),
+            ),
             job_info,
             layer_cache=self.layer_cache,
         )
-        return runner.run()
+        try:
+            return runner.run()
+        finally:
+            self.release_layers()
+
+    def release_layers(self):
+        """Disposes the layers which were evicted from the layer cache while
+        the last job was running.
+        """
+        if self.layer_cache.release():
+            # there is no event loop running which would process the
+            # scheduled deletions
+            self.qgis.sendPostedEvents(None, QEvent.DeferredDelete)
 
     @property
     def status(self):
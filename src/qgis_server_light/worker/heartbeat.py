@@ -0,0 +1,89 @@
+"""Keeps the registration of a worker alive, independent of the job it is
+working on.
+
+The heartbeat runs in its own thread with its own redis connection. This
+way the `worker:{id}` hash does not expire during long renders and the job
+loop of the worker does not spend any redis commands on the registration.
+"""
+
+import datetime
+import logging
+import threading
+
+from redis import Redis
+from redis.exceptions import ConnectionError as RedisConnectionError
+from xsdata.formats.dataclass.serializers import JsonSerializer
+
+from qgis_server_light.interface.dispatcher.redis_asio import RedisQueue
+
+
+class Heartbeat(threading.Thread):
+    """Refreshes the `worker:{id}` hash of an engine on a fixed interval.
+
+    A beat only renews the expiry of the hash, a worker is alive as long as
+    its hash exists. When the status of the engine or the job it is working
+    on changed, or the hash expired meanwhile, the hash is written in full:
+    the time, the status, the job, the serialized engine info and the worker
+    details, and the worker is (re-)added to the worker set.
+
+    Attributes:
+        engine: The `RedisEngine` whose registration is kept alive.
+        client: The connection which is used by this thread only.
+        interval: Seconds between two beats.
+    """
+
+    def __init__(self, engine, client: Redis, interval: float) -> None:
+        super().__init__(name=f"heartbeat-{engine.info.id}", daemon=True)
+        self.engine = engine
+        self.client = client
+        self.interval = interval
+        self._stopped = threading.Event()
+        # the status and the job which were written last
+        self._written: tuple[str, str] | None = None
+
+    @property
+    def key(self) -> str:
+        return f"worker:{self.engine.info.id}"
+
+    def beat(self) -> datetime.datetime:
+        """Writes one heartbeat, with one round trip unless the hash expired
+        meanwhile.
+        """
+        now = datetime.datetime.now()
+        state = (self.engine.status, self.engine.current_job_id or "")
+        if state == self._written and self.client.expire(
+            self.key, self.engine.info_expire
+        ):
+            return now
+        mapping = {
+            "last_seen": now.isoformat(),
+            "status": state[0],
+            "job": state[1],
+            "info": JsonSerializer().render(self.engine.info),
+        }
+        if self.engine.worker_details:
+            mapping.update(self.engine.worker_details)
+        with self.client.pipeline(transaction=False) as p:
+            p.hset(self.key, mapping=mapping)
+            p.expire(self.key, self.engine.info_expire)
+            p.sadd(RedisQueue.worker_set_name, self.engine.info.id)
+            p.execute()
+        self._written = state
+        return now
+
+    def run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                now = self.beat()
+                logging.debug(f"Worker heartbeat renewed {now.isoformat()}")
+            except RedisConnectionError:
+                logging.warning("Worker heartbeat failed, retrying next interval")
+                # the hash might have expired meanwhile, it is written in full
+                self._written = None
+            except Exception as e:
+                logging.error(e, exc_info=True)
+            self._stopped.wait(self.interval)
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.join()
@@ -1,31 +1,191 @@
-from typing import Tuple
+"""The image encoders all runners use.
 
+The format of a job is a mime type, optionally with parameters which select
+the trade-off between size and speed, e.g. `image/png; mode=8bit` or
+`image/jpeg; quality=85`:
+
+- `image/png`: `compression=fast` (fpng, the default), `slower` (fpng with
+  per image Huffman tables, around 6% smaller) or `smallest` (zlib level 9,
+  many times slower). `mode=8bit` writes a palette image: the colors are
+  reduced to 256 by Qt and it is written with zlib, the `compression` then
+  only decides the zlib level.
+- `image/jpeg`: `quality` from 1 to 100 (75 by default). It is encoded by
+  the libjpeg-turbo (SIMD) encoder of `simplejpeg` without copying the
+  pixels.
+- `image/webp`: `quality` from 1 to 100 (80 by default), 100 is lossless.
+  It needs the WebP image plugin of Qt.
+
+Encoders are registered by mime type with `register_encoder`.
+
+Images are big (64 MB for a 4096 x 4096 print), so encoders read the pixels
+through a `memoryview` of the image instead of a copy. Only fpng-py takes
+nothing but `bytes`, so PNGs are copied once. Runners render in the
+pixel format returned by `render_format`, which is the one the encoder of the
+job reads, so at most a conversion in place is left.
+"""
+
+import sys
+from typing import Any, Callable
+
+import numpy
+import simplejpeg
 from fpng_py import CompressionFlags, fpng_encode_image_to_memory
 from PyQt5.QtCore import QBuffer, QByteArray, QIODevice
-from PyQt5.QtGui import QImage
+from PyQt5.QtGui import QImage, QImageWriter
+
+Encoder = Callable[[QImage, dict[str, str]], Any]
+
+ENCODERS: dict[str, Encoder] = {}
+PNG_COMPRESSIONS = ("fast", "slower", "smallest")
+
+# the order of the channels in memory of the 32 bit formats, for simplejpeg
+_ARGB32 = "BGRA" if sys.byteorder == "little" else "ARGB"
+_RGB32 = "BGRX" if sys.byteorder == "little" else "XRGB"
+JPEG_COLORSPACES = {
+    QImage.Format_ARGB32: _ARGB32,
+    QImage.Format_ARGB32_Premultiplied: _ARGB32,
+    QImage.Format_RGB32: _RGB32,
+    QImage.Format_RGBA8888: "RGBA",
+    QImage.Format_RGBA8888_Premultiplied: "RGBA",
+    QImage.Format_RGBX8888: "RGBX",
+}
+
+
+def register_encoder(mime_type: str) -> Callable[[Encoder], Encoder]:
+    """Registers the decorated function as encoder of a mime type."""
+
+    def register(encoder: Encoder) -> Encoder:
+        ENCODERS[mime_type] = encoder
+        return encoder
+
+    return register
+
+
+def parse_format(fmt: str) -> tuple[str, dict[str, str]]:
+    """Splits a format into its mime type and parameters.
+
+    Example:
+        `image/png; mode=8bit` becomes `("image/png", {"mode": "8bit"})`.
+    """
+    mime_type, *parts = fmt.split(";")
+    parameters = {}
+    for part in parts:
+        name, _, value = part.partition("=")
+        if name.strip():
+            parameters[name.strip().lower()] = value.strip().lower()
+    return mime_type.strip().lower(), parameters
+
+
+def render_format(fmt: str) -> QImage.Format:
+    """The pixel format to render an image in which is encoded in a format.
+
+    fpng reads RGBA, which is unpremultiplied in place before encoding. All
+    other encoders read the pixel format Qt paints fastest in.
+    """
+    mime_type, parameters = parse_format(fmt)
+    if (
+        mime_type == "image/png"
+        and parameters.get("mode") != "8bit"
+        and parameters.get("compression") != "smallest"
+    ):
+        return QImage.Format_RGBA8888_Premultiplied
+    return QImage.Format_ARGB32_Premultiplied
+
+
+def pixels(image: QImage) -> memoryview:
+    """A read only view of the pixels of an image, without copying them.
+    The image must be kept alive and not be changed while the view is used.
+    """
+    bits = image.constBits()
+    bits.setsize(image.sizeInBytes())
+    return memoryview(bits)
+
+
+def _quality(parameters: dict[str, str], default: int) -> int:
+    quality = int(parameters.get("quality", default))
+    if not 1 <= quality <= 100:
+        raise ValueError(f"The quality must be between 1 and 100, got {quality}")
+    return quality
+
+
+def _save(image: QImage, fmt: str, quality: int = -1) -> QByteArray:
+    """Encodes an image with the image writer plugin of Qt."""
+    image_data = QByteArray()
+    buf = QBuffer(image_data)
+    buf.open(QIODevice.WriteOnly)
+    if not image.save(buf, fmt, quality):
+        raise RuntimeError(f"Qt could not encode the image as {fmt}")
+    return image_data
 
 
-def _encode_image(image: QImage, fmt: str) -> Tuple:
-    """Encodes an image in a specific mime type
+@register_encoder("image/png")
+def encode_png(image: QImage, parameters: dict[str, str]):
+    compression = parameters.get("compression", "fast")
+    if compression not in PNG_COMPRESSIONS:
+        raise ValueError(f"Unknown PNG compression '{compression}'")
+    if parameters.get("mode") == "8bit":
+        image = image.convertToFormat(QImage.Format_Indexed8)
+        # the quality of the Qt PNG writer is the inverse of the zlib level
+        return _save(image, "PNG", 0 if compression == "smallest" else 50)
+    if compression == "smallest":
+        return _save(image, "PNG", 0)
+    # in place for the 32 bit formats, unless the pixels are shared
+    image.convertTo(QImage.Format_RGBA8888)
+    return fpng_encode_image_to_memory(
+        # fpng-py rejects any other bytes-like object
+        pixels(image).tobytes(),
+        image.width(),
+        image.height(),
+        0,
+        CompressionFlags.FPNG_ENCODE_SLOWER
+        if compression == "slower"
+        else CompressionFlags.NONE,
+    )
+
+
+@register_encoder("image/jpeg")
+def encode_jpeg(image: QImage, parameters: dict[str, str]):
+    quality = _quality(parameters, 75)
+    if image.format() not in JPEG_COLORSPACES:
+        image.convertTo(QImage.Format_RGB32)
+    # JPEG has no alpha, it is ignored like Qt does
+    array = numpy.frombuffer(pixels(image), numpy.uint8).reshape(
+        image.height(), image.width(), 4
+    )
+    return simplejpeg.encode_jpeg(
+        array, quality=quality, colorspace=JPEG_COLORSPACES[image.format()]
+    )
+
+
+@register_encoder("image/webp")
+def encode_webp(image: QImage, parameters: dict[str, str]):
+    if b"webp" not in QImageWriter.supportedImageFormats():
+        raise RuntimeError("The WebP image plugin of Qt is not installed")
+    return _save(image, "WEBP", _quality(parameters, 80))
+
+
+def encode_image(image: QImage, fmt: str) -> tuple[str, Any]:
+    """Encodes an image in a specific format.
+
     Args:
-        image (QImage): The image to encode
-        fmt (str): The mime type of the format
+        image: The image to encode, ideally in the `render_format` of the
+            format. It may be converted in place and should not be used
+            afterwards.
+        fmt: The mime type, optionally with parameters.
+
     Returns:
-        A tuple with mime type and bytes-like object of an encoded image in the desired format
+        The mime type (without the parameters) and the bytes-like encoded
+        image.
+
+    Raises:
+        RuntimeError: When there is no encoder for the mime type.
+        ValueError: When a parameter is invalid.
     """
-    if fmt.lower() == "image/png":
-        image.convertTo(QImage.Format_RGBA8888)
-        image_data = fpng_encode_image_to_memory(
-            image.constBits().asstring(image.sizeInBytes()),
-            image.width(),
-            image.height(),
-            0,
-            CompressionFlags.NONE,
+    mime_type, parameters = parse_format(fmt)
+    try:
+        encoder = ENCODERS[mime_type]
+    except KeyError:
+        raise RuntimeError(
+            f"Requested mimetype '{mime_type}' was not found in {list(ENCODERS)}."
         )
-        return "image/png", image_data
-    else:
-        image_data = QByteArray()
-        buf = QBuffer(image_data)
-        buf.open(QIODevice.WriteOnly)
-        image.save(buf, "JPG")
-        return "image/jpeg", image_data
+    return mime_type, encoder(image, parameters)
@@ -0,0 +1,94 @@
+"""Receives the layer invalidations which are published to all workers.
+
+After the data under the data root was updated, `RedisQueue.invalidate_layers`
+publishes the affected layer ids and paths. Each worker listens in a thread
+with its own connection and hands them to its layer cache, which evicts the
+layers before they are used again. This way a data deploy does not need a
+restart of the workers.
+"""
+
+import logging
+import os
+import threading
+
+from redis import Redis
+from redis.exceptions import ConnectionError as RedisConnectionError
+from xsdata.formats.dataclass.parsers import JsonParser
+
+from qgis_server_light.interface.dispatcher.common import LayerInvalidation
+from qgis_server_light.interface.dispatcher.redis_asio import RedisQueue
+from qgis_server_light.worker.layer_cache import LayerCache
+
+
+class LayerInvalidationListener(threading.Thread):
+    """Subscribes to the layer invalidation channel and invalidates the
+    layers of a layer cache.
+
+    Attributes:
+        cache: The layer cache of the worker.
+        client: The connection which is used by this thread only.
+        data_root: Relative paths of invalidations are relative to it.
+        retry_interval: Seconds to wait before subscribing again after the
+            connection was lost.
+    """
+
+    def __init__(
+        self,
+        cache: LayerCache,
+        client: Redis,
+        data_root: str,
+        retry_interval: float = 5.0,
+    ) -> None:
+        super().__init__(name="layer-invalidation", daemon=True)
+        self.cache = cache
+        self.client = client
+        self.data_root = data_root
+        self.retry_interval = retry_interval
+        self._stopped = threading.Event()
+
+    def handle(self, data: str | bytes) -> LayerInvalidation:
+        """Passes one published invalidation on to the cache."""
+        if isinstance(data, bytes):
+            data = data.decode()
+        invalidation = JsonParser().from_string(data, LayerInvalidation)
+        self.cache.invalidate(
+            invalidation.layers,
+            [os.path.join(self.data_root, path) for path in invalidation.paths],
+        )
+        logging.info(f"Layers invalidated: {invalidation.layers} {invalidation.paths}")
+        return invalidation
+
+    def listen(self) -> None:
+        with self.client.pubsub(ignore_subscribe_messages=True) as pubsub:
+            pubsub.subscribe(RedisQueue.layer_invalidation_channel_name)
+            while not self._stopped.is_set():
+                message = pubsub.get_message(timeout=1.0)
+                if message is None:
+                    continue
+                try:
+                    self.handle(message["data"])
+                except Exception as e:
+                    logging.error(f"Invalid layer invalidation: {e}")
+
+    def run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                self.listen()
+            except RedisConnectionError:
+                logging.warning(
+                    "Listening for layer invalidations failed, "
+                    f"retrying in {self.retry_interval} seconds"
+                )
+            except Exception:
+                # the thread must not end, invalidation would stop for good
+                logging.exception(
+                    "Listening for layer invalidations failed unexpectedly, "
+                    f"retrying in {self.retry_interval} seconds"
+                )
+            # invalidations published meanwhile are missed, the layers are
+            # still revalidated by the identity of their files
+            self._stopped.wait(self.retry_interval)
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.join()
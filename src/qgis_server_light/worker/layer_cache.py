@@ -0,0 +1,303 @@
+"""A bounded cache for the QGIS layers a worker keeps loaded between jobs.
+
+Every cached layer keeps its data provider (and with that e.g. a database
+connection or open file) alive. The cache is therefore bounded by a number
+of entries and an approximate memory budget and entries can expire.
+
+The memory of a layer can't be determined directly. Instead the growth of
+the resident memory of the worker while the layer was created (between the
+miss and storing the layer) is attributed to it. Layers created meanwhile,
+like the unfiltered layer a filtered variant is derived from, are not
+attributed twice. This is only an estimate, but good enough to keep a worker
+which serves many tenants from growing until it is killed.
+
+Layers read from local files remember the identity of their file (mtime,
+size and inode). It is checked again at most every `revalidate_interval`
+seconds and a layer whose file was replaced is loaded again. Layers can also
+be invalidated by id or path from another thread, e.g. when the data root
+was updated.
+
+Evicted layers are not disposed right away, they might still be used by the
+job which is running. They are disposed with `release`, after the job.
+"""
+
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Any, Callable, Hashable, Iterable
+
+from qgis_server_light.worker.metrics import resident_memory
+
+EVICTION_POLICIES = ("lru", "lfu")
+# separates the name of a layer from the name of its variant in a cache name
+VARIANT_SEPARATOR = "#"
+
+FileIdentity = tuple[int, int, int]
+
+
+def file_identity(path: str) -> FileIdentity | None:
+    """The modification time, size and inode of a file or `None` if it
+    does not exist (or is no local file at all).
+    """
+    try:
+        stat = os.stat(path)
+    except (OSError, ValueError):
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+
+def _within(path: str, paths: tuple[str, ...]) -> bool:
+    return any(
+        path == parent or path.startswith(parent.rstrip(os.sep) + os.sep)
+        for parent in paths
+    )
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    # estimated bytes of resident memory held by the value
+    weight: int
+    created: float
+    hits: int = 0
+    # the file the value was loaded from and its identity at that time
+    path: str | None = None
+    identity: FileIdentity | None = None
+    checked: float = 0.0
+
+
+class LayerCache:
+    """A mapping of cache names to layers with bounded size.
+
+    It supports the operations `MapRunner._handle_layer_cache` uses on a
+    plain dict (`in`, item access and assignment), so it can be passed to
+    the runners as is.
+
+    Attributes:
+        max_entries: The maximum number of layers or `None` for no limit.
+        max_memory: The approximate number of bytes all layers may hold or
+            `None` for no limit.
+        ttl: Seconds after which a layer is loaded again or `None` to keep
+            layers until they are evicted.
+        policy: `lru` evicts the least recently used layer, `lfu` the least
+            frequently used one (the least recently used of those on a tie).
+        dispose: Called with each evicted layer on `release`.
+        on_evict: Called with the cache name of each evicted layer, e.g. to
+            count evictions.
+        source_path: Returns the file a layer was loaded from or `None`.
+            Without it, layers are not revalidated.
+        revalidate_interval: Seconds between two checks of the file of a
+            layer.
+        hits: Number of lookups which found a layer.
+        misses: Number of lookups which found none.
+        evictions: Number of evicted layers.
+    """
+
+    def __init__(
+        self,
+        max_entries: int | None = None,
+        max_memory: int | None = None,
+        ttl: float | None = None,
+        policy: str = "lru",
+        dispose: Callable[[Any], None] | None = None,
+        on_evict: Callable[[Hashable], None] | None = None,
+        source_path: Callable[[Any], str | None] | None = None,
+        revalidate_interval: float = 10.0,
+        memory: Callable[[], int | None] = resident_memory,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if policy not in EVICTION_POLICIES:
+            raise ValueError(f"Unknown eviction policy '{policy}'")
+        self.max_entries = max_entries
+        self.max_memory = max_memory
+        self.ttl = ttl
+        self.policy = policy
+        self.dispose = dispose
+        self.on_evict = on_evict
+        self.source_path = source_path
+        self.revalidate_interval = revalidate_interval
+        self.memory = memory
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[Hashable, CacheEntry] = OrderedDict()
+        self._evicted: list[Any] = []
+        # invalidations requested by other threads, applied by the owner
+        self._invalidations: deque[tuple[tuple[str, ...], tuple[str, ...]]] = deque()
+        # resident memory at the miss of each layer which is being created
+        self._baselines: dict[Hashable, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        self._apply_invalidations()
+        entry = self._entries.get(key)
+        if entry is not None and (self._expired(entry) or self._changed(entry)):
+            self.evict(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            baseline = self.memory()
+            if baseline is not None:
+                self._baselines[key] = baseline
+            return False
+        return True
+
+    def __getitem__(self, key: Hashable) -> Any:
+        entry = self._entries[key]
+        entry.hits += 1
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry.value
+
+    def __setitem__(self, key: Hashable, value: Any) -> None:
+        if key in self._entries:
+            self.evict(key)
+        weight = 0
+        baseline = self._baselines.pop(key, None)
+        current = self.memory()
+        if current is not None and baseline is not None:
+            weight = max(current - baseline, 0)
+            # the layers created around this one must not be charged for it
+            for pending in self._baselines:
+                self._baselines[pending] += weight
+        entry = CacheEntry(value, weight, self.clock())
+        if self.source_path is not None:
+            path = self.source_path(value)
+            identity = file_identity(path) if path else None
+            if identity is not None:
+                entry.path, entry.identity = path, identity
+                entry.checked = entry.created
+        self._entries[key] = entry
+        self._shrink(keep=key)
+
+    def __delitem__(self, key: Hashable) -> None:
+        if not self.evict(key):
+            raise KeyError(key)
+
+    @property
+    def weight(self) -> int:
+        """The estimated bytes held by all cached layers."""
+        return sum(entry.weight for entry in self._entries.values())
+
+    def _expired(self, entry: CacheEntry) -> bool:
+        return self.ttl is not None and self.clock() - entry.created > self.ttl
+
+    def _changed(self, entry: CacheEntry) -> bool:
+        """Checks if the file of a layer was replaced, at most once per
+        revalidation interval.
+        """
+        if entry.identity is None:
+            return False
+        now = self.clock()
+        if now - entry.checked < self.revalidate_interval:
+            return False
+        entry.checked = now
+        if file_identity(entry.path) == entry.identity:
+            return False
+        logging.info(f"{entry.path} changed, the layer is loaded again")
+        return True
+
+    def invalidate(self, layers: Iterable[str] = (), paths: Iterable[str] = ()) -> None:
+        """Requests reloading layers. This is safe to call from any thread,
+        the layers are evicted with the next lookup or `release`.
+
+        Args:
+            layers: The cache names of the layers, their variants
+                (`{name}#{variant}`) are evicted as well.
+            paths: Absolute paths of files or directories, all layers loaded
+                from within are evicted.
+        """
+        self._invalidations.append((tuple(layers), tuple(paths)))
+
+    def _apply_invalidations(self) -> None:
+        while self._invalidations:
+            layers, paths = self._invalidations.popleft()
+            for key in list(self._entries):
+                path = self._entries[key].path
+                name = (
+                    key.split(VARIANT_SEPARATOR, 1)[0] if isinstance(key, str) else key
+                )
+                if name in layers or (path is not None and _within(path, paths)):
+                    self.evict(key)
+
+    def _victim(self, keep: Hashable) -> Hashable | None:
+        candidates = (key for key in self._entries if key != keep)
+        if self.policy == "lfu":
+            # entries are ordered from least to most recently used, so min
+            # picks the least recently used of the least frequently used
+            return min(
+                candidates, key=lambda key: self._entries[key].hits, default=None
+            )
+        return next(candidates, None)
+
+    def _over_budget(self) -> bool:
+        if self.max_entries is not None and len(self._entries) > self.max_entries:
+            return True
+        return self.max_memory is not None and self.weight > self.max_memory
+
+    def _shrink(self, keep: Hashable) -> None:
+        """Evicts layers until the cache is within its bounds again. The
+        layer which was stored just now is kept, even if it exceeds the
+        budget on its own.
+        """
+        while self._over_budget():
+            victim = self._victim(keep)
+            if victim is None:
+                break
+            self.evict(victim)
+
+    def evict(self, key: Hashable) -> bool:
+        """Removes a layer from the cache. It is disposed on the next
+        `release`.
+
+        Returns:
+            If the layer was cached.
+        """
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self.evictions += 1
+        self._evicted.append(entry.value)
+        logging.debug(f"Evicted layer {key} from the layer cache")
+        if self.on_evict is not None:
+            self.on_evict(key)
+        return True
+
+    def clear(self) -> None:
+        """Evicts all layers."""
+        for key in list(self._entries):
+            self.evict(key)
+
+    def release(self) -> int:
+        """Disposes the evicted layers. This must only be called when no job
+        uses them anymore.
+
+        Returns:
+            The number of disposed layers.
+        """
+        self._apply_invalidations()
+        # layers which missed but were never stored, e.g. invalid ones
+        self._baselines.clear()
+        evicted, self._evicted = self._evicted, []
+        if self.dispose is not None:
+            for value in evicted:
+                self.dispose(value)
+        return len(evicted)
+
+    def stats(self) -> dict[str, int]:
+        """The hit and miss statistics and the current size of the cache."""
+        return {
+            "entries": len(self._entries),
+            "weight": self.weight,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
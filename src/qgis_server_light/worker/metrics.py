@@ -0,0 +1,379 @@
+"""Metrics of a worker in the Prometheus text exposition format.
+
+The metrics are kept in plain python structures and are only updated once
+per job, after its result was published. Rendering them for a scrape or the
+textfile collector happens in a thread of its own, so neither touches the
+critical path of a job.
+"""
+
+import logging
+import math
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Iterable
+
+from qgis_server_light.worker.timing import JobTimings
+
+DURATION_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+SIZE_BUCKETS = tuple(1024 * 4**exponent for exponent in range(9))
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format_labels(labels: Iterable[tuple[str, str]]) -> str:
+    pairs = ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels)
+    return f"{{{pairs}}}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf"
+    return repr(float(value))
+
+
+def resident_memory() -> int | None:
+    """The resident set size of this process in bytes or `None` where it
+    can't be read (only linux is supported).
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class Metric:
+    """Base of all metrics, a metric has one value per combination of its
+    labels.
+    """
+
+    type: str = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+
+    def header(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type}",
+        ]
+
+    def samples(self, const_labels: tuple[tuple[str, str], ...]) -> list[str]:
+        raise NotImplementedError()
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labels)
+        self.values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1.0) -> None:
+        self.values[label_values] = self.values.get(label_values, 0.0) + amount
+
+    def samples(self, const_labels: tuple[tuple[str, str], ...]) -> list[str]:
+        if not self.values and not self.labels:
+            # a counter without labels is always exposed, starting at 0
+            return [f"{self.name}{_format_labels(const_labels)} 0.0"]
+        return [
+            f"{self.name}"
+            f"{_format_labels(const_labels + tuple(zip(self.labels, label_values)))} "
+            f"{_format_value(value)}"
+            for label_values, value in self.values.items()
+        ]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DURATION_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets) + (math.inf,)
+        # per combination of labels: the count of each bucket and the sum
+        self.values: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        counts, total = self.values.setdefault(
+            label_values, ([0] * len(self.buckets), [0.0])
+        )
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+                break
+        total[0] += value
+
+    def samples(self, const_labels: tuple[tuple[str, str], ...]) -> list[str]:
+        lines = []
+        for label_values, (counts, total) in self.values.items():
+            labels = const_labels + tuple(zip(self.labels, label_values))
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                bucket_labels = _format_labels(labels + (("le", _format_value(bound)),))
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {total[0]!r}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+class Gauge(Metric):
+    """A gauge whose value is read when the metrics are rendered. It is
+    omitted when the value is `None`.
+    """
+
+    type = "gauge"
+
+    def __init__(
+        self, name: str, documentation: str, read: Callable[[], float | None]
+    ) -> None:
+        super().__init__(name, documentation)
+        self.read = read
+
+    def samples(self, const_labels: tuple[tuple[str, str], ...]) -> list[str]:
+        value = self.read()
+        if value is None:
+            return []
+        return [f"{self.name}{_format_labels(const_labels)} {_format_value(value)}"]
+
+
+class WorkerMetrics:
+    """All metrics of one worker process.
+
+    Attributes:
+        const_labels: Labels added to every sample, e.g. the worker id.
+    """
+
+    prefix: str = "qsl_worker"
+
+    def __init__(
+        self,
+        layer_cache_size: Callable[[], int] | None = None,
+        const_labels: dict[str, str] | None = None,
+    ) -> None:
+        self.const_labels = tuple((const_labels or {}).items())
+        self._lock = threading.Lock()
+        p = self.prefix
+        self.jobs = Counter(
+            f"{p}_jobs_total",
+            "Jobs processed by the worker.",
+            ("runner", "content_type", "status"),
+        )
+        self.skipped_jobs = Counter(
+            f"{p}_skipped_jobs_total",
+            "Claimed jobs which were skipped because nobody waits for them.",
+            ("status",),
+        )
+        self.job_duration = Histogram(
+            f"{p}_job_duration_seconds",
+            "Time from claiming a job until its result was published.",
+            ("runner", "content_type"),
+        )
+        self.layer_cache_requests = Counter(
+            f"{p}_layer_cache_requests_total",
+            "Layers provided to a job, by layer cache result (hit or miss).",
+            ("result",),
+        )
+        self.style_cache_requests = Counter(
+            f"{p}_style_cache_requests_total",
+            "Styles applied to a layer, by if they had to be imported (miss).",
+            ("result",),
+        )
+        self.layer_cache_evictions = Counter(
+            f"{p}_layer_cache_evictions_total",
+            "Layers removed from the layer cache.",
+        )
+        self.encode_duration = Histogram(
+            f"{p}_encode_seconds",
+            "Time spent encoding results, by format.",
+            ("format",),
+        )
+        self.result_size = Histogram(
+            f"{p}_result_bytes",
+            "Size of the encoded results, by format.",
+            ("format",),
+            buckets=SIZE_BUCKETS,
+        )
+        self.provider_failures = Counter(
+            f"{p}_provider_open_failures_total",
+            "Layers QGIS could not open.",
+        )
+        self.redis_retries = Counter(
+            f"{p}_redis_retries_total",
+            "Retries of the connection to redis.",
+        )
+        self.metrics: list[Metric] = [
+            self.jobs,
+            self.skipped_jobs,
+            self.job_duration,
+            self.layer_cache_requests,
+            self.style_cache_requests,
+            self.layer_cache_evictions,
+            self.encode_duration,
+            self.result_size,
+            self.provider_failures,
+            self.redis_retries,
+            Gauge(
+                f"{p}_resident_memory_bytes",
+                "Resident set size of the worker process.",
+                resident_memory,
+            ),
+        ]
+        if layer_cache_size is not None:
+            self.metrics.append(
+                Gauge(
+                    f"{p}_layer_cache_size",
+                    "Layers held in the layer cache.",
+                    layer_cache_size,
+                )
+            )
+
+    def observe_job(
+        self,
+        runner: str,
+        content_type: str,
+        status: str,
+        duration: float,
+        timings: JobTimings,
+        result_size: int | None = None,
+        provider_failure: bool = False,
+    ) -> None:
+        """Records a finished job. This is meant to be called after its
+        result was published.
+
+        Args:
+            runner: The class name of the runner which ran the job.
+            content_type: The content type of the result.
+            status: The status the job finished with.
+            duration: Seconds from claiming the job until the result was
+                published.
+            timings: The phase timings of the job.
+            result_size: The size of the encoded result in bytes.
+            provider_failure: If the job failed because QGIS could not open
+                one of its layers.
+        """
+        with self._lock:
+            self.jobs.inc(runner, content_type, status)
+            self.job_duration.observe(duration, runner, content_type)
+            for timing in timings.phases:
+                if timing.cache_hit is not None:
+                    counter = (
+                        self.style_cache_requests
+                        if timing.name == "style"
+                        else self.layer_cache_requests
+                    )
+                    counter.inc("hit" if timing.cache_hit else "miss")
+                elif timing.name == "encode":
+                    self.encode_duration.observe(timing.wall, content_type)
+            if result_size is not None:
+                self.result_size.observe(result_size, content_type)
+            if provider_failure:
+                self.provider_failures.inc()
+
+    def count(self, counter: Counter, *label_values: str, amount: float = 1.0):
+        """Increments one of the counters."""
+        with self._lock:
+            counter.inc(*label_values, amount=amount)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for metric in self.metrics:
+                lines.extend(metric.header())
+                lines.extend(metric.samples(self.const_labels))
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str) -> None:
+        """Writes the metrics for the textfile collector of the node
+        exporter. The file is replaced atomically, so a half written file is
+        never collected.
+        """
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w") as textfile:
+            textfile.write(self.render())
+        os.replace(temporary, path)
+
+
+class MetricsServer(threading.Thread):
+    """Serves the metrics on `/metrics` over HTTP in a background thread."""
+
+    def __init__(self, metrics: WorkerMetrics, port: int, address: str = "") -> None:
+        super().__init__(name=f"metrics-{port}", daemon=True)
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logging.debug(f"Metrics request: {format % args}")
+
+        self.server = ThreadingHTTPServer((address, port), Handler)
+
+    def run(self) -> None:
+        self.server.serve_forever()
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class MetricsTextfileWriter(threading.Thread):
+    """Writes the metrics to a file on a fixed interval, for the textfile
+    collector of the node exporter.
+    """
+
+    def __init__(self, metrics: WorkerMetrics, path: str, interval: float) -> None:
+        super().__init__(name="metrics-textfile", daemon=True)
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            try:
+                self.metrics.write_textfile(self.path)
+            except OSError as e:
+                logging.warning(f"Writing metrics to {self.path} failed: {e}")
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.join()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
@@ -0,0 +1,229 @@
+"""Prefork supervisor which runs several `RedisEngine` processes out of one warm
+parent.
+
+The parent initializes QGIS and loads the runner plugins exactly once, freezes
+its heap and forks the children from it. This way booting a node with many
+workers only pays the QGIS startup once and the children share all read-only
+memory copy-on-write with the parent.
+
+A crashed child is restarted with an exponential backoff. A slot whose child
+keeps crashing right after its start (e.g. because of a wrong configuration)
+is given up, the supervisor stops when no slot is left.
+"""
+
+import gc
+import logging
+import os
+import signal
+import time
+import uuid
+
+
+def exit_code(code) -> int:
+    """Maps the code of a `SystemExit` to a process exit code, which only
+    has 8 bits. Codes out of range are reported as generic failure.
+    """
+    if code is None:
+        return 0
+    if not isinstance(code, int):
+        return 1
+    return code if 0 <= code <= 255 else 1
+
+
+class PreforkSupervisor:
+    """Forks and watches a fixed number of `RedisEngine` children.
+
+    Attributes:
+        engine: The fully initialized engine which is shared by all children.
+        redis_url: The url of the redis each child connects to.
+        processes: The number of children which are kept alive.
+        restart_delay: Seconds to wait before a crashed child is restarted
+            the first time. The delay doubles with each further crash.
+        max_restart_delay: The maximum delay between two restarts.
+        max_failures: Number of crashes in a row after which a slot is
+            given up.
+        stable_after: Seconds after which a running child counts as
+            started successfully, its next crash starts a new backoff.
+        id: The unique identifier of this supervisor. It is reported by each
+            child in its `worker:{id}` hash.
+        children: Running children by their pid, the value is the slot number.
+        restarts: Number of restarts per slot.
+        failures: Number of crashes in a row per slot.
+        scheduled: The time (`time.monotonic`) a crashed slot is restarted
+            at, by slot.
+        given_up: The slots which are not restarted anymore.
+    """
+
+    # seconds between two checks for exited children while restarts are due
+    poll_interval: float = 0.1
+
+    def __init__(
+        self,
+        engine,
+        redis_url: str,
+        processes: int,
+        restart_delay: float = 1.0,
+        max_restart_delay: float = 60.0,
+        max_failures: int = 5,
+        stable_after: float = 60.0,
+    ) -> None:
+        if processes < 1:
+            raise ValueError(f"At least one process is needed, got {processes}")
+        self.engine = engine
+        self.redis_url = redis_url
+        self.processes = processes
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.max_failures = max_failures
+        self.stable_after = stable_after
+        self.id = str(uuid.uuid4())
+        self.children: dict[int, int] = {}
+        self.restarts: dict[int, int] = {slot: 0 for slot in range(processes)}
+        self.failures: dict[int, int] = {slot: 0 for slot in range(processes)}
+        self.scheduled: dict[int, float] = {}
+        self.given_up: set[int] = set()
+        self._started: dict[int, float] = {}
+        self.shutdown = False
+
+    def exit_gracefully(self, signum, frame):
+        logging.info(f"Supervisor received: {signum}, stopping children")
+        self.shutdown = True
+        self.scheduled.clear()
+        self._signal_children(signal.SIGTERM)
+
+    def _signal_children(self, signum: int):
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def _run_child(self, slot: int) -> int:
+        """The code path of a forked child. It never returns into the
+        supervisor loop.
+        """
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        self.engine.reinitialize_infos()
+        self.engine.worker_details.update(
+            {
+                "pid": str(os.getpid()),
+                "supervisor": self.id,
+                "slot": str(slot),
+                "restarts": str(self.restarts[slot]),
+            }
+        )
+        try:
+            self.engine.run(self.redis_url)
+        except SystemExit as e:
+            return exit_code(e.code)
+        except Exception as e:
+            logging.error(e, exc_info=True)
+            return 1
+        return 0
+
+    def _spawn(self, slot: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 1
+            try:
+                exit_code = self._run_child(slot)
+            finally:
+                # we must never fall back into the supervisor code in a child
+                os._exit(exit_code)
+        self.children[pid] = slot
+        self._started[slot] = time.monotonic()
+        logging.info(f"Started worker process {pid} in slot {slot}")
+
+    def restart_delay_of(self, slot: int) -> float:
+        """The delay before the next restart of a slot."""
+        return min(
+            self.restart_delay * 2 ** (self.failures[slot] - 1),
+            self.max_restart_delay,
+        )
+
+    def _reap(self, pid: int, wait_status: int) -> None:
+        """Handles an exited child and schedules its restart."""
+        slot = self.children.pop(pid, None)
+        if slot is None:
+            return
+        code = os.waitstatus_to_exitcode(wait_status)
+        if self.shutdown:
+            logging.info(f"Worker process {pid} stopped ({code})")
+            return
+        if time.monotonic() - self._started[slot] >= self.stable_after:
+            self.failures[slot] = 0
+        self.failures[slot] += 1
+        if self.failures[slot] > self.max_failures:
+            self.given_up.add(slot)
+            logging.error(
+                f"Worker process {pid} in slot {slot} exited with {code}, giving "
+                f"up the slot after {self.max_failures} restarts in a row"
+            )
+            return
+        delay = self.restart_delay_of(slot)
+        self.scheduled[slot] = time.monotonic() + delay
+        logging.error(
+            f"Worker process {pid} in slot {slot} exited with {code}, "
+            f"restarting in {delay:.1f} seconds "
+            f"(restart count: {self.restarts[slot] + 1})"
+        )
+
+    def _restart_due(self) -> None:
+        now = time.monotonic()
+        for slot, due in list(self.scheduled.items()):
+            if due <= now:
+                del self.scheduled[slot]
+                self.restarts[slot] += 1
+                self._spawn(slot)
+
+    def _wait(self) -> tuple[int, int]:
+        """Waits for the next exited child. While restarts are scheduled it
+        only waits until the next one is due.
+
+        Returns:
+            The pid and wait status of the exited child, the pid is 0 when
+            none exited.
+        """
+        if not self.scheduled:
+            return os.waitpid(-1, 0)
+        try:
+            pid, wait_status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            pid, wait_status = 0, 0
+        if pid == 0:
+            next_due = min(self.scheduled.values())
+            time.sleep(min(max(next_due - time.monotonic(), 0.0), self.poll_interval))
+        return pid, wait_status
+
+    def run(self) -> int:
+        """Forks the children and keeps them running until the supervisor is
+        stopped.
+
+        Returns:
+            The exit code of the supervisor, 1 when slots were given up.
+        """
+        signal.signal(signal.SIGINT, self.exit_gracefully)
+        signal.signal(signal.SIGTERM, self.exit_gracefully)
+        # everything allocated until now is shared with the children, moving it
+        # to the permanent generation keeps the gc from touching (and thereby
+        # copying) those pages in the children
+        gc.collect()
+        gc.freeze()
+        boot_start = time.time()
+        for slot in range(self.processes):
+            self._spawn(slot)
+        logging.info(
+            f"Forked {self.processes} worker processes in "
+            f"{time.time() - boot_start:.3f} seconds"
+        )
+        while self.children or self.scheduled:
+            self._restart_due()
+            try:
+                pid, wait_status = self._wait()
+            except ChildProcessError:
+                break
+            if pid:
+                self._reap(pid, wait_status)
+        logging.info("All worker processes stopped")
+        return 1 if self.given_up else 0
@@ -3,7 +3,7 @@ import os
 from typing import List, Optional
 
 from qgis.core import Qgis as Qgis_
-from qgis.core import QgsApplication, QgsCredentials
+from qgis.core import QgsApplication, QgsCredentials, QgsProviderRegistry
 
 
 class CredentialsHelper(QgsCredentials):
@@ -50,3 +50,20 @@ def version() -> int:
 
 def version_name() -> str:
     return Qgis_.version()
+
+
+def dispose_layer(layer) -> None:
+    """Schedules the deletion of a layer (and with it closing its data
+    provider) which is not used anymore.
+    """
+    layer.deleteLater()
+
+
+def layer_source_path(layer) -> str | None:
+    """The file a layer was loaded from or `None` if its source is no
+    file.
+    """
+    parts = QgsProviderRegistry.instance().decodeUri(
+        layer.providerType(), layer.source()
+    )
+    return parts.get("path") or None
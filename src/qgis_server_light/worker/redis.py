@@ -2,7 +2,7 @@ import argparse
 import datetime
 import logging
 import math
-import pickle
+import os
 import signal
 import socket
 import time
@@ -10,18 +10,54 @@ from typing import List, Optional
 
 from redis.backoff import ExponentialBackoff
 from redis.client import Pipeline, Redis
+from redis.commands.core import Script
 from redis.exceptions import ConnectionError as RedisConnectionError
 from redis.retry import Retry
-from xsdata.formats.dataclass.parsers import JsonParser
-from xsdata.formats.dataclass.serializers import JsonSerializer
 
-from qgis_server_light.interface.dispatcher.common import Status
+from qgis_server_light.interface.dispatcher.cache import (
+    DEFAULT_MAX_ENTRY_SIZE,
+    DEFAULT_MAX_SIZE,
+    STORE_SCRIPT,
+    RenderResultCache,
+    canonical_job_hash,
+)
+from qgis_server_light.interface.dispatcher.common import ResultReference, Status
+from qgis_server_light.interface.dispatcher.envelope import (
+    encode_reference,
+    encode_result,
+)
 from qgis_server_light.interface.dispatcher.redis_asio import RedisQueue
+from qgis_server_light.interface.dispatcher.telemetry import QueueTelemetry
+from qgis_server_light.interface.job.codec import codec_by_name, split_info_type
 from qgis_server_light.interface.job.common.output import JobResult
+from qgis_server_light.interface.job.tile.input import QslJobParameterTile
+from qgis_server_light.interface.job.tile.output import TileJobResult, TileSibling
+from qgis_server_light.worker.claim import (
+    ClaimedJob,
+    JobClaimer,
+    RedisJobClaimer,
+    RedisStreamJobClaimer,
+)
+from qgis_server_light.worker.definitions import DefinitionResolver
 from qgis_server_light.worker.engine import Engine, EngineContext
+from qgis_server_light.worker.heartbeat import Heartbeat
+from qgis_server_light.worker.invalidation import LayerInvalidationListener
+from qgis_server_light.worker.layer_cache import EVICTION_POLICIES
+from qgis_server_light.worker.metrics import (
+    MetricsServer,
+    MetricsTextfileWriter,
+    WorkerMetrics,
+)
+from qgis_server_light.worker.runner.common import LayerNotValidError
+from qgis_server_light.worker.runner.context import JobCancelledError
+from qgis_server_light.worker.timing import JobTimings
 
 DEFAULT_DATA_ROOT = "/io/data"
 DEFAULT_SVG_PATH = "/io/svg"
+DEFAULT_RESULT_INLINE_LIMIT = 512 * 1024
+DEFAULT_LAYER_CACHE_SIZE = 256
+DEFAULT_TILE_CACHE_TTL = 300
+QUEUE_BACKENDS = ("list", "stream")
 
 
 class RedisEngine(Engine):
@@ -37,6 +73,34 @@ class RedisEngine(Engine):
         self.retry_wait = 0.01
         self.max_retries = 11
         self.info_expire: int = 300
+        # results bigger than this (bytes) are not published but stored under
+        # their own key which expires after `result_expire` seconds
+        self.result_inline_limit: int = DEFAULT_RESULT_INLINE_LIMIT
+        self.result_expire: int = 60
+        # which queue backend is consumed, see `QUEUE_BACKENDS`
+        self.queue_backend: str = "list"
+        # number of jobs read at once from the stream backend
+        self.stream_batch_size: int = 1
+        # additional fields which are written to the `worker:{id}` hash
+        self.worker_details: dict[str, str] = {}
+        # seconds between two refreshes of the `worker:{id}` hash
+        self.heartbeat_interval: float = 10.0
+        # the id of the job which is processed right now
+        self.current_job_id: str | None = None
+        # metrics are served over HTTP on this port (plus the slot of a forked
+        # worker) and/or written to this directory for the textfile collector
+        self.metrics_port: int | None = None
+        self.metrics_textfile_dir: str | None = None
+        self.metrics_textfile_interval: float = 15.0
+        self.metrics: WorkerMetrics | None = None
+        # seconds the other tiles of a rendered metatile are kept in the
+        # shared result cache, `None` to drop them
+        self.tile_cache_ttl: int | None = DEFAULT_TILE_CACHE_TTL
+        self.tile_cache_max_entry_size: int = DEFAULT_MAX_ENTRY_SIZE
+        # the size budget of the shared result cache, has to match the one
+        # of the dispatchers
+        self.tile_cache_max_size: int = DEFAULT_MAX_SIZE
+        self._store_tile_script: Script | None = None
 
     def retry_handling_with_jitter(self, count: int):
         if count <= self.max_retries:
@@ -63,6 +127,9 @@ class RedisEngine(Engine):
         status: str,
         start_time: float,
     ):
+        """Queues the status update on the pipeline. Executing it is left to
+        the caller, so it can be sent together with the result.
+        """
         duration = time.time() - start_time
         ts = datetime.datetime.now().isoformat()
         pipeline.hset(f"job:{job_id}", RedisQueue.job_status_key, status)
@@ -73,27 +140,237 @@ class RedisEngine(Engine):
         )
         pipeline.hset(f"job:{job_id}", RedisQueue.job_last_update_key, ts)
         pipeline.hset(f"job:{job_id}", RedisQueue.job_duration_key, str(duration))
-        pipeline.execute()
 
-    def heartbeat(self, client: Redis) -> datetime.datetime:
-        now = datetime.datetime.now()
-        client.hset(f"worker:{self.info.id}", "last_seen", now.isoformat())
-        return now
+    @staticmethod
+    def set_job_timings(job_id: str, pipeline: Pipeline, timings: JobTimings):
+        """Queues writing the phase timings of a job to its hash."""
+        mapping = timings.job_hash_mapping()
+        if mapping:
+            pipeline.hset(f"job:{job_id}", mapping=mapping)
 
-    def register_worker(self, client: Redis):
-        # writing worker info to redis
-        client.hset(
-            f"worker:{self.info.id}", "info", JsonSerializer().render(self.info)
+    @staticmethod
+    def record_latency(pipeline: Pipeline, claimed: ClaimedJob, start_time: float):
+        """Queues the queue wait and service time of a job for the queue
+        telemetry.
+        """
+        if claimed.enqueued is None:
+            # queued by a dispatcher which does not record the time
+            return
+        QueueTelemetry.record(
+            pipeline,
+            claimed.job_type,
+            wait=max(start_time - float(claimed.enqueued), 0.0),
+            service=time.time() - start_time,
         )
-        # set timer to automatically remove worker info from list
-        client.expire(f"worker:{self.info.id}", self.info_expire)
-        # add worker to list of workers in redis
-        client.sadd("workers", self.info.id)
-        self.heartbeat(client)
+
+    @staticmethod
+    def is_cancelled(client: Redis, job_id: str) -> bool:
+        """Checks if the dispatcher gave up waiting for a running job."""
+        try:
+            status = client.hget(f"job:{job_id}", RedisQueue.job_status_key)
+        except RedisConnectionError:
+            return False
+        return status == Status.CANCELLED.value
+
+    def publish_result(
+        self,
+        pipeline: Pipeline,
+        claimer: JobClaimer,
+        claimed: ClaimedJob,
+        data: memoryview,
+        status: str,
+    ):
+        """Queues the publishing of a result envelope on the pipeline. Big
+        results are written once to a result key and only a small reference
+        is published, this keeps them out of the pub/sub output buffers.
+        """
+        if len(data) > self.result_inline_limit:
+            key = f"{RedisQueue.job_result_name}:{claimed.id}"
+            pipeline.set(key, data, ex=self.result_expire)
+            data = encode_reference(
+                ResultReference(
+                    id=claimed.id,
+                    status=status,
+                    key=key,
+                    size=len(data),
+                    shared=claimed.lease is not None,
+                )
+            )
+        claimer.publish(pipeline, claimed, data, status)
+
+    def publish_skipped(
+        self, pipeline: Pipeline, claimer: JobClaimer, claimed: ClaimedJob
+    ) -> None:
+        """Tells the waiters of a skipped coalesced job that no result will
+        come, so they do not wait for their timeout.
+        """
+        result = JobResult(
+            id=claimed.id,
+            data=f"Job {claimed.id} was skipped ({claimed.status})",
+            content_type="text",
+            worker_id=self.info.id,
+            worker_host_name=socket.gethostname(),
+            status=claimed.status,
+        )
+        try:
+            claimer.publish_to_waiters(
+                pipeline, claimed, encode_result(result), claimed.status
+            )
+            pipeline.execute()
+        except RedisConnectionError:
+            pipeline.reset()
+            logging.warning(
+                f"Telling the waiters of {claimed.id} failed", exc_info=True
+            )
+
+    def cache_tiles(
+        self, pipeline: Pipeline, job: QslJobParameterTile, result: TileJobResult
+    ) -> int:
+        """Queues storing all tiles of a rendered metatile in the result
+        cache of the dispatchers, under the keys of their own jobs. The
+        requested tile is stored as well, dispatchers which coalesced their
+        tile with this job read it from there.
+
+        Returns:
+            The number of stored tiles.
+        """
+        siblings, result.siblings = result.siblings, []
+        if not self.tile_cache_ttl:
+            return 0
+        if self._store_tile_script is None:
+            self._store_tile_script = pipeline.register_script(STORE_SCRIPT)
+        index_keys = RenderResultCache.index_keys(job)
+        stored = 0
+        for sibling in [TileSibling(x=job.x, y=job.y, data=result.data), *siblings]:
+            data = encode_result(
+                JobResult(
+                    id=result.id,
+                    data=sibling.data,
+                    content_type=result.content_type,
+                    worker_id=result.worker_id,
+                    worker_host_name=result.worker_host_name,
+                    status=Status.SUCCESS.value,
+                )
+            )
+            if len(data) > self.tile_cache_max_entry_size:
+                continue
+            key = RenderResultCache.entry_key(
+                canonical_job_hash(job.sibling(sibling.x, sibling.y))
+            )
+            self._store_tile_script(
+                keys=RenderResultCache.store_keys(key),
+                args=RenderResultCache.store_args(
+                    data, self.tile_cache_ttl, self.tile_cache_max_size
+                ),
+                client=pipeline,
+            )
+            for index_key in index_keys:
+                pipeline.sadd(index_key, key)
+            stored += 1
+        if stored:
+            for index_key in index_keys:
+                pipeline.expire(index_key, self.tile_cache_ttl)
+        return stored
+
+    def create_claimer(self, client: Redis) -> JobClaimer:
+        if self.queue_backend == "stream":
+            return RedisStreamJobClaimer(
+                client,
+                self.info.id,
+                batch_size=self.stream_batch_size,
+                visibility_timeout=self.info_expire,
+            )
+        return RedisJobClaimer(client, self.info.id)
+
+    def register_worker(self, redis_url: str) -> Heartbeat:
+        """Registers the worker and keeps the registration alive in a
+        background thread with its own connection.
+        """
+        heartbeat = Heartbeat(
+            self,
+            Redis.from_url(redis_url, decode_responses=True),
+            self.heartbeat_interval,
+        )
+        heartbeat.beat()
+        heartbeat.start()
         logging.info("Worker was registered in Redis")
+        return heartbeat
+
+    def listen_for_invalidations(self, redis_url: str) -> LayerInvalidationListener:
+        """Starts receiving the layer invalidations published to all
+        workers, in a background thread with its own connection.
+        """
+        listener = LayerInvalidationListener(
+            self.layer_cache,
+            Redis.from_url(redis_url, decode_responses=True),
+            str(self.context.base_path),
+        )
+        listener.start()
+        return listener
+
+    def start_metrics(self) -> list[MetricsServer | MetricsTextfileWriter]:
+        """Creates the metrics of this worker and starts exposing them if
+        configured.
+
+        Returns:
+            The started threads, they have to be stopped on shutdown.
+        """
+        threads: list[MetricsServer | MetricsTextfileWriter] = []
+        if self.metrics_port is None and self.metrics_textfile_dir is None:
+            return threads
+        self.metrics = WorkerMetrics(
+            layer_cache_size=lambda: len(self.layer_cache),
+            const_labels={"worker": self.info.id},
+        )
+        self.layer_cache.on_evict = lambda _: self.metrics.count(
+            self.metrics.layer_cache_evictions
+        )
+        if self.metrics_port is not None:
+            # forked workers of one node must not collide
+            port = self.metrics_port + int(self.worker_details.get("slot", 0))
+            threads.append(MetricsServer(self.metrics, port))
+            logging.info(f"Serving metrics on port {port}")
+        if self.metrics_textfile_dir is not None:
+            path = os.path.join(
+                self.metrics_textfile_dir, f"qsl_worker_{self.info.id}.prom"
+            )
+            threads.append(
+                MetricsTextfileWriter(
+                    self.metrics, path, self.metrics_textfile_interval
+                )
+            )
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def observe_job(
+        self,
+        claimed: ClaimedJob,
+        result: JobResult,
+        start_time: float,
+        timings: JobTimings,
+        error: Exception | None = None,
+    ):
+        """Updates the metrics with a job whose result was published."""
+        if self.metrics is None:
+            return
+        runner_class = self.available_runner_classes_by_job_info.get(claimed.job_type)
+        self.metrics.observe_job(
+            runner_class.__name__ if runner_class else str(claimed.job_type),
+            result.content_type,
+            result.status,
+            time.time() - start_time,
+            timings,
+            result_size=(
+                len(result.data) if result.status == Status.SUCCESS.value else None
+            ),
+            provider_failure=isinstance(error, LayerNotValidError),
+        )
 
     def retry_connection(self, redis_url: str, count: int):
         logging.warning(f"Could not connect to redis on `{redis_url}`.")
+        if self.metrics is not None:
+            self.metrics.count(self.metrics.redis_retries)
         self.retry_handling_with_jitter(count)
 
     def start(self, redis_url) -> Redis:
@@ -117,73 +394,147 @@ class RedisEngine(Engine):
         return r
 
     def run(self, redis_url):
+        metrics_threads = self.start_metrics()
         r = self.start(redis_url)
         p = r.pipeline()
+        claimer = self.create_claimer(r)
+        # resolves the sources and styles which are sent by reference
+        definitions = DefinitionResolver(r)
+        invalidation_listener = self.listen_for_invalidations(redis_url)
         expire_limit = self.info_expire * 0.95
         retry_count = 0
+        last_reap = 0.0
+        heartbeat = None
         while not self.shutdown:
             try:
-                self.register_worker(r)
+                if heartbeat is None:
+                    heartbeat = self.register_worker(redis_url)
+                if time.time() - last_reap > self.info_expire:
+                    # we rescue jobs of dead workers, at latest once per expire
+                    # cycle of the workers heartbeat
+                    requeued = claimer.reap()
+                    last_reap = time.time()
+                    if requeued:
+                        logging.warning(f"Re-queued {requeued} jobs of dead workers")
                 logging.debug("Waiting for jobs")
                 self.set_waiting()
                 # this is blocking the loop until a job is found in the redis
-                # list/queue, if there is one we take it, we have a timeout here, to
-                # renew the workers heartbeat in redis
-                result = r.blpop([RedisQueue.job_queue_name], int(expire_limit))
-                if result is None:
-                    now = self.heartbeat(r)
-                    logging.debug(
-                        f"Worker heartbeat renewed in queue {now.isoformat()}"
-                    )
-                    r.expire(f"worker:{self.info.id}", self.info_expire)
+                # list/queue, if there is one we move it to our processing list
+                # and mark it running. We have a timeout here, to renew the
+                # workers heartbeat in redis
+                claimed = claimer.claim(int(expire_limit))
+                if claimed is None:
                     continue
-                else:
-                    _, job_id = result
             except RedisConnectionError:
                 retry_count += 1
                 self.retry_connection(redis_url, retry_count)
                 continue
+            job_id = claimed.id
+            if claimed.info is None:
+                if claimed.status is None:
+                    logging.warning(f"Job {job_id} was removed before it was claimed")
+                else:
+                    logging.warning(f"Job {job_id} was skipped ({claimed.status})")
+                if self.metrics is not None:
+                    self.metrics.count(
+                        self.metrics.skipped_jobs, claimed.status or "removed"
+                    )
+                if claimed.lease is not None:
+                    self.publish_skipped(p, claimer, claimed)
+                continue
             start_time = time.time()
+            self.current_job_id = job_id
+            self.set_processing()
+            timings = JobTimings()
+            error = None
+            if claimed.timing is not None:
+                timings.add(claimed.timing)
             try:
-                # we inform, that the job is running.
-                self.set_job_runtime_status(job_id, p, Status.RUNNING.value, start_time)
-
-                job_info_json = r.hget(f"job:{job_id}", RedisQueue.job_info_key)
-                job_info_class_name = r.hget(
-                    f"job:{job_id}", RedisQueue.job_info_type_key
+                job_type, codec_name = split_info_type(claimed.info_type)
+                job_info_class = self.available_job_info_classes[job_type]
+                with timings.measure("decode"):
+                    job_info = codec_by_name(codec_name).decode(
+                        claimed.info, job_info_class
+                    )
+                with timings.measure("resolve"):
+                    job_info = definitions.resolve(job_info)
+                result: JobResult = self.process(
+                    job_info,
+                    deadline=float(claimed.deadline) if claimed.deadline else None,
+                    cancelled=lambda: self.is_cancelled(r, job_id),
+                    timings=timings,
                 )
-                job_info_class = self.available_job_info_classes[job_info_class_name]
-                job_info = JsonParser().from_string(job_info_json, job_info_class)
-                result: JobResult = self.process(job_info)
                 result.worker_id = self.info.id
                 result.worker_host_name = socket.gethostname()
-                data = pickle.dumps(result)
+                result.status = Status.SUCCESS.value
+                result.timings = list(timings.phases)
+                with timings.measure("serialize"):
+                    data = encode_result(result)
 
                 # we inform, that the job was finished successful
                 self.set_job_runtime_status(job_id, p, Status.SUCCESS.value, start_time)
+                self.set_job_timings(job_id, p, timings)
+
+                # the tiles are cached before the result is published, so
+                # dispatchers waiting for the metatile find their tiles
+                if isinstance(result, TileJobResult):
+                    self.cache_tiles(p, job_info.job, result)
 
                 # we publish the result to any subscribers
-                p.publish(f"{RedisQueue.job_channel_name}:{job_id}", data)
+                self.publish_result(p, claimer, claimed, data, Status.SUCCESS.value)
 
+            except JobCancelledError as e:
+                error = e
+                result = JobResult(id=job_id, data=str(e), content_type="text")
+                result.worker_id = self.info.id
+                result.worker_host_name = socket.gethostname()
+                result.status = Status.CANCELLED.value
+                result.timings = list(timings.phases)
+                self.set_job_runtime_status(
+                    job_id, p, Status.CANCELLED.value, start_time
+                )
+                self.set_job_timings(job_id, p, timings)
+                self.publish_result(
+                    p, claimer, claimed, encode_result(result), Status.CANCELLED.value
+                )
+                logging.warning(f"Job {job_id} was cancelled while running")
             except Exception as e:
+                error = e
                 # preparation of the result, containing error information
                 result = JobResult(id=job_id, data=str(e), content_type="text")
                 result.worker_id = self.info.id
                 result.worker_host_name = socket.gethostname()
-                data = pickle.dumps(result)
+                result.status = Status.FAILURE.value
+                result.timings = list(timings.phases)
+                data = encode_result(result)
 
                 # we inform, that the job has failed with errors
                 # self.set_job_runtime_status(job_id, p, Status.FAILURE.value,
                 # start_time)
+                self.set_job_timings(job_id, p, timings)
 
                 # we publish the result to any subscribers
-                p.publish(f"{RedisQueue.job_channel_name}:{job_id}", data)
+                self.publish_result(p, claimer, claimed, data, Status.FAILURE.value)
 
                 # we provide error information to the logs
                 logging.error(e, exc_info=True)
             finally:
-                p.execute()
+                # the job is done, it must not be rescued by the reaper anymore
+                claimer.release(p, claimed)
+                self.record_latency(p, claimed, start_time)
+                # the round trip delivering the result can't be part of the
+                # result itself, it is only logged
+                with timings.measure("publish"):
+                    p.execute()
+                self.current_job_id = None
+            self.observe_job(claimed, result, start_time, timings, error)
             logging.debug(f"Job duration: {time.time() - start_time}")
+            logging.debug(f"Job {job_id} timings: {timings.summary()}")
+        if heartbeat is not None:
+            heartbeat.stop()
+        invalidation_listener.stop()
+        for thread in metrics_threads:
+            thread.stop()
         exit(0)
 
 
@@ -214,6 +565,118 @@ def main() -> None:
         default=DEFAULT_SVG_PATH,
     )
 
+    parser.add_argument(
+        "--result-inline-limit",
+        type=int,
+        help="Results bigger than this number of bytes are stored under their own "
+        "key instead of being published directly. Defaults to "
+        f"{DEFAULT_RESULT_INLINE_LIMIT}",
+        default=DEFAULT_RESULT_INLINE_LIMIT,
+    )
+
+    parser.add_argument(
+        "--queue-backend",
+        type=str,
+        choices=QUEUE_BACKENDS,
+        help="The redis structure jobs are consumed from. Defaults to list",
+        default="list",
+    )
+
+    parser.add_argument(
+        "--stream-batch-size",
+        type=int,
+        help="Number of jobs read at once with the stream backend. Defaults to 1",
+        default=1,
+    )
+
+    parser.add_argument(
+        "--heartbeat-interval",
+        type=float,
+        help="Seconds between two refreshes of the worker registration. Defaults to 10",
+        default=10.0,
+    )
+
+    parser.add_argument(
+        "--layer-cache-size",
+        type=int,
+        help="Maximum number of layers kept loaded between jobs. Defaults to "
+        f"{DEFAULT_LAYER_CACHE_SIZE}",
+        default=DEFAULT_LAYER_CACHE_SIZE,
+    )
+
+    parser.add_argument(
+        "--layer-cache-memory",
+        type=int,
+        help="Approximate memory (in MiB) the cached layers may hold. Unlimited "
+        "by default",
+        default=None,
+    )
+
+    parser.add_argument(
+        "--layer-cache-ttl",
+        type=float,
+        help="Seconds after which a cached layer is loaded again. Unlimited by default",
+        default=None,
+    )
+
+    parser.add_argument(
+        "--layer-revalidate-interval",
+        type=float,
+        help="Seconds between two checks if the file of a cached layer was "
+        "replaced. Defaults to 10",
+        default=10.0,
+    )
+
+    parser.add_argument(
+        "--layer-cache-policy",
+        type=str,
+        choices=EVICTION_POLICIES,
+        help="Which layer is evicted from a full layer cache: the least recently "
+        "(lru) or the least frequently (lfu) used one. Defaults to lru",
+        default="lru",
+    )
+
+    parser.add_argument(
+        "--tile-cache-ttl",
+        type=int,
+        help="Seconds the other tiles of a rendered metatile are kept in the shared "
+        f"result cache, 0 to drop them. Defaults to {DEFAULT_TILE_CACHE_TTL}",
+        default=DEFAULT_TILE_CACHE_TTL,
+    )
+
+    parser.add_argument(
+        "--tile-cache-max-size",
+        type=int,
+        help="Megabytes all entries of the shared result cache may take together, "
+        "the ones expiring first are dropped beyond. Has to match the budget of the "
+        f"dispatchers, 0 for no limit. Defaults to {DEFAULT_MAX_SIZE // 1024 // 1024}",
+        default=DEFAULT_MAX_SIZE // 1024 // 1024,
+    )
+
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="Serve Prometheus metrics over HTTP on this port. Forked workers use "
+        "this port plus their slot number. Disabled by default",
+        default=None,
+    )
+
+    parser.add_argument(
+        "--metrics-textfile-dir",
+        type=str,
+        help="Write Prometheus metrics to this directory for the textfile "
+        "collector of the node exporter. Disabled by default",
+        default=None,
+    )
+
+    parser.add_argument(
+        "--processes",
+        type=int,
+        help="Number of worker processes which are forked from one initialized "
+        "parent. Defaults to 1 (no forking).",
+        default=1,
+    )
+
     args = parser.parse_args()
 
     logging.basicConfig(
@@ -231,6 +694,7 @@ def main() -> None:
         EngineContext(args.data_root),
         [
             "qgis_server_light.worker.runner.render.RenderRunner",
+            "qgis_server_light.worker.runner.tile.TileRunner",
             "qgis_server_light.worker.runner.legend.GetLegendRunner",
             "qgis_server_light.worker.runner.feature.GetFeatureRunner",
             # Not fully functional yet
@@ -238,9 +702,29 @@ def main() -> None:
         ],
         svg_paths=svg_paths,
     )
-    engine.run(
-        args.redis_url,
-    )
+    engine.result_inline_limit = args.result_inline_limit
+    engine.queue_backend = args.queue_backend
+    engine.stream_batch_size = args.stream_batch_size
+    engine.heartbeat_interval = args.heartbeat_interval
+    engine.layer_cache.max_entries = args.layer_cache_size
+    if args.layer_cache_memory is not None:
+        engine.layer_cache.max_memory = args.layer_cache_memory * 1024 * 1024
+    engine.layer_cache.ttl = args.layer_cache_ttl
+    engine.layer_cache.policy = args.layer_cache_policy
+    engine.layer_cache.revalidate_interval = args.layer_revalidate_interval
+    engine.tile_cache_ttl = args.tile_cache_ttl
+    engine.tile_cache_max_size = args.tile_cache_max_size * 1024 * 1024
+    engine.metrics_port = args.metrics_port
+    engine.metrics_textfile_dir = args.metrics_textfile_dir
+    if args.processes > 1:
+        # imported here to avoid a circular import
+        from qgis_server_light.worker.prefork import PreforkSupervisor
+
+        exit(PreforkSupervisor(engine, args.redis_url, args.processes).run())
+    else:
+        engine.run(
+            args.redis_url,
+        )
 
 
 if __name__ == "__main__":
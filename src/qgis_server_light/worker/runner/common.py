@@ -1,3 +1,4 @@
+import dataclasses
 import json
 import logging
 import os
@@ -5,8 +6,7 @@ import uuid
 import zlib
 from abc import ABC
 from base64 import urlsafe_b64decode
-from dataclasses import dataclass
-from pathlib import Path
+from collections import OrderedDict
 from typing import Dict, List, Optional, Type
 
 from PyQt5.QtCore import QSize, Qt
@@ -28,16 +28,18 @@ from qgis.core import (
 )
 from xsdata.formats.dataclass.parsers import JsonParser
 
+from qgis_server_light.interface.dispatcher.cache import filter_hash, style_hash
 from qgis_server_light.interface.job.common.input import (
     OgcFilter110,
     QslJobInfoParameter,
     QslJobLayer,
 )
+from qgis_server_light.worker.layer_cache import VARIANT_SEPARATOR
+from qgis_server_light.worker.runner.context import JobContext
 
 
-@dataclass
-class JobContext:
-    base_path: str | Path
+class LayerNotValidError(RuntimeError):
+    """Raised when QGIS could not open the data source of a layer."""
 
 
 class Runner(ABC):
@@ -88,6 +90,14 @@ class MapRunner(Runner):
     ]
     custom_layer_drivers = ["xyzvectortiles", "mbtilesvectortiles"]
     default_style_name = "default"
+    # prefix of the named styles a layer keeps in its style manager
+    style_name_prefix = "qsl-"
+    # named styles kept per layer, besides the current one
+    max_named_styles = 16
+    # the attribute of a layer which holds its named styles in the order
+    # they were used, least recently used first. It goes away with the
+    # layer, a custom property would be saved into the named styles instead
+    style_uses_attribute = "_qsl_style_uses"
 
     def __init__(
         self,
@@ -136,7 +146,31 @@ class MapRunner(Runner):
         settings.setDestinationCrs(destination_crs)
         return settings
 
-    def _load_style(self, qgs_layer: QgsMapLayer, job_layer_definition: QslJobLayer):
+    def _load_style(
+        self, qgs_layer: QgsMapLayer, job_layer_definition: QslJobLayer
+    ) -> bool | None:
+        """Applies the style of the job layer. Each style a layer was
+        rendered with is kept as named style (by the hash of its definition)
+        in the style manager of the layer, so a cached layer only has to
+        switch to it instead of parsing the QML again.
+
+        Returns:
+            If the style was applied without importing it.
+        """
+        style_name = f"{self.style_name_prefix}{style_hash(job_layer_definition.style)}"
+        manager = qgs_layer.styleManager()
+        uses = self._style_uses_of(qgs_layer)
+        if manager.currentStyle() == style_name:
+            uses[style_name] = None
+            uses.move_to_end(style_name)
+            logging.info(f" ✓ Style {job_layer_definition.style.name} is applied")
+            return True
+        if style_name in manager.styles():
+            uses[style_name] = None
+            uses.move_to_end(style_name)
+            manager.setCurrentStyle(style_name)
+            logging.info(f" ✓ Style {job_layer_definition.style.name} switched")
+            return True
         logging.info(
             f"Preparing job_layer_definition Style: {job_layer_definition.style.name}"
         )
@@ -145,15 +179,74 @@ class MapRunner(Runner):
             urlsafe_b64decode(job_layer_definition.style.definition)
         )
         style_doc.setContent(style_xml)
+        # the new entry starts as copy of the current style, switching to it
+        # stores the current style unchanged before the QML is imported
+        previous_style_name = manager.currentStyle()
+        kept = {
+            name
+            for name in manager.styles()
+            if name.startswith(self.style_name_prefix) and name != previous_style_name
+        }
+        if len(kept) >= self.max_named_styles:
+            manager.removeStyle(self._least_recently_used_style(uses, kept))
+            uses[previous_style_name] = None
+        manager.addStyleFromLayer(style_name)
+        manager.setCurrentStyle(style_name)
         success, _ = qgs_layer.importNamedStyle(style_doc)
+        if success:
+            uses[style_name] = None
+        else:
+            # the style must not be reused
+            manager.setCurrentStyle(previous_style_name)
+            manager.removeStyle(style_name)
 
         logging.info(f" ✓ Style loaded: {success}")
+        return False
+
+    def _style_uses_of(self, qgs_layer: QgsMapLayer) -> "OrderedDict[str, None]":
+        """The use order of the named styles of a layer."""
+        uses = getattr(qgs_layer, self.style_uses_attribute, None)
+        if uses is None:
+            uses = OrderedDict()
+            setattr(qgs_layer, self.style_uses_attribute, uses)
+        return uses
+
+    @staticmethod
+    def _least_recently_used_style(uses: "OrderedDict[str, None]", kept: set) -> str:
+        """The named style to remove to make room for a new one. Styles whose
+        use was not recorded are removed first.
+        """
+        for name in [name for name in uses if name not in kept]:
+            # removed meanwhile, or the current style which is not evicted
+            del uses[name]
+        untracked = sorted(kept.difference(uses))
+        if untracked:
+            return untracked[0]
+        victim, _ = uses.popitem(last=False)
+        return victim
 
     def get_cache_name(self, job_layer_definition: QslJobLayer) -> str:
         """Central method to decide which name is used in the cache to
-        identify a layer.
+        identify a layer. A layer with a filter is a variant of its own,
+        identified by the hash of the filter.
         """
-        return job_layer_definition.id
+        layer_filter = self._layer_filter(job_layer_definition)
+        if layer_filter is None:
+            return job_layer_definition.id
+        return (
+            f"{job_layer_definition.id}{VARIANT_SEPARATOR}"
+            f"filter:{filter_hash(layer_filter)}"
+        )
+
+    def _layer_filter(self, job_layer_definition: QslJobLayer) -> OgcFilter110 | None:
+        """The filter which is applied to the layer itself (as subset string)
+        or `None` if the layer is not filtered.
+        """
+        if job_layer_definition.driver not in self.vector_layer_drivers:
+            return None
+        if isinstance(job_layer_definition.filter, OgcFilter110):
+            return job_layer_definition.filter
+        return None
 
     def _decide_drivers(self, job_layer_definition: QslJobLayer) -> QgsMapLayer:
         """Decides which type of layer we are dealing with and delegates initialization
@@ -188,25 +281,28 @@ class MapRunner(Runner):
             The layer (from cache or newly created).
         """
         cache_name = self.get_cache_name(job_layer_definition)
-        if self.layer_cache is not None and cache_name in self.layer_cache:
-            logging.debug(
-                f"Using cached job_layer_definition {job_layer_definition.name} (identifier: {cache_name})"
-            )
-            qgs_layer = self.layer_cache[cache_name]
-        else:
-            qgs_layer = self._decide_drivers(job_layer_definition)
-            if qgs_layer.isValid():
+        with self.context.timings.measure("layer", job_layer_definition.id) as timing:
+            if self.layer_cache is not None and cache_name in self.layer_cache:
                 logging.debug(
-                    f"Newly initialized layer {job_layer_definition.name} is valid: {qgs_layer.isValid()}"
+                    f"Using cached job_layer_definition {job_layer_definition.name} (identifier: {cache_name})"
                 )
-                if self.layer_cache is not None:
-                    self.layer_cache[cache_name] = qgs_layer
+                qgs_layer = self.layer_cache[cache_name]
+                timing.cache_hit = True
             else:
-                logging.error(qgs_layer.error().message())
-                logging.error(qgs_layer.dataProvider().error().message())
-                raise RuntimeError(
-                    f"Newly initialized layer {job_layer_definition.name} is not valid. JobLayerDefinition: {job_layer_definition}"
-                )
+                timing.cache_hit = False
+                qgs_layer = self._decide_drivers(job_layer_definition)
+                if qgs_layer.isValid():
+                    logging.debug(
+                        f"Newly initialized layer {job_layer_definition.name} is valid: {qgs_layer.isValid()}"
+                    )
+                    if self.layer_cache is not None:
+                        self.layer_cache[cache_name] = qgs_layer
+                else:
+                    logging.error(qgs_layer.error().message())
+                    logging.error(qgs_layer.dataProvider().error().message())
+                    raise LayerNotValidError(
+                        f"Newly initialized layer {job_layer_definition.name} is not valid. JobLayerDefinition: {job_layer_definition}"
+                    )
         return qgs_layer
 
     def _provide_layer(self, job_layer_definition: QslJobLayer) -> None:
@@ -219,8 +315,14 @@ class MapRunner(Runner):
             None
         """
         qgs_layer = self._handle_layer_cache(job_layer_definition)
+        if self._layer_filter(job_layer_definition) is not None:
+            logging.info(
+                f" Layer {job_layer_definition.id} is filtered by subset: "
+                f"{qgs_layer.subsetString()}"
+            )
         # applying the style to the job_layer_definition
-        self._load_style(qgs_layer, job_layer_definition)
+        with self.context.timings.measure("style", job_layer_definition.id) as timing:
+            timing.cache_hit = self._load_style(qgs_layer, job_layer_definition)
         self.map_layers.append(qgs_layer)
 
     def _handle_datasource_definition(self, job_layer_definition: QslJobLayer) -> dict:
@@ -256,6 +358,9 @@ class MapRunner(Runner):
                 data sources).
         """
 
+        layer_filter = self._layer_filter(job_layer_definition)
+        if layer_filter is not None:
+            return self._derive_filtered_layer(job_layer_definition, layer_filter)
         layer_source = self._handle_datasource_definition(job_layer_definition)
         layer_source_path = self._decoded_layer_source_to_connection_string(
             job_layer_definition.driver, layer_source
@@ -272,26 +377,67 @@ class MapRunner(Runner):
             job_layer_definition.driver,
             options,
         )
-        if job_layer_definition.filter:
-            if isinstance(job_layer_definition.filter, OgcFilter110):
-                # TODO: This is potentially bad: We always get all features from datasource. However, QGIS
-                #   does not seem to support sliding window feature filter out of the box...
-                logging.info(" QslJobLayer is filtered by:")
-                logging.info(job_layer_definition.filter.definition)
-                filter_doc = QDomDocument()
-                filter_doc.setContent(job_layer_definition.filter.definition)
-                filter_expression = QgsOgcUtils.expressionFromOgcFilter(
-                    filter_doc.documentElement(),
-                    QgsOgcUtils.FilterVersion.FILTER_OGC_1_1,
-                    qgs_layer,
-                )
-                existing_expression = qgs_layer.subsetString()
-                if existing_expression:
-                    # Combining with AND the originally defined expression always takes precedence
-                    expression = f"({existing_expression}) AND ({filter_expression.expression()})"
-                else:
-                    expression = filter_expression.expression()
-                qgs_layer.setSubsetString(expression)
+        return qgs_layer
+
+    def _derive_filtered_layer(
+        self, job_layer_definition: QslJobLayer, layer_filter: OgcFilter110
+    ) -> QgsVectorLayer:
+        """Derives the filtered variant of a vector layer from the unfiltered
+        layer, which is taken from (or put into) the layer cache. The variant
+        is a new layer on the resolved data source of the unfiltered layer,
+        without validating the crs or loading the default style. Unlike a
+        clone it does not copy the named styles. QGIS opens a data provider
+        of its own for it, which takes its connection from the connection
+        pool of the provider where there is one. The unfiltered layer is not
+        changed. Without a layer cache the filter is applied to a new layer.
+
+        Args:
+            job_layer_definition: The job_layer_definition definition as
+                received from the runner.
+            layer_filter: The filter of the job layer.
+
+        Returns:
+            The filtered QgsVectorLayer.
+        """
+        # TODO: This is potentially bad: We always get all features from datasource. However, QGIS
+        #   does not seem to support sliding window feature filter out of the box...
+        base_definition = dataclasses.replace(job_layer_definition, filter=None)
+        if self.layer_cache is None:
+            qgs_layer = self._prepare_vector_layer(base_definition)
+        else:
+            base_layer = self._handle_layer_cache(base_definition)
+            options = QgsVectorLayer.LayerOptions(
+                loadDefaultStyle=False, readExtentFromXml=False
+            )
+            options.skipCrsValidation = True
+            options.forceReadOnly = True
+            qgs_layer = QgsVectorLayer(
+                base_layer.source(),
+                base_layer.name(),
+                base_layer.providerType(),
+                options,
+            )
+        filter_doc = QDomDocument()
+        filter_doc.setContent(layer_filter.definition)
+        filter_expression = QgsOgcUtils.expressionFromOgcFilter(
+            filter_doc.documentElement(),
+            QgsOgcUtils.FilterVersion.FILTER_OGC_1_1,
+            qgs_layer,
+        )
+        logging.info(
+            f" QslJobLayer filter compiled to: {filter_expression.expression()}"
+        )
+        if filter_expression.hasParserError():
+            logging.warning(filter_expression.parserErrorString())
+        existing_expression = qgs_layer.subsetString()
+        if existing_expression:
+            # Combining with AND the originally defined expression always takes precedence
+            expression = (
+                f"({existing_expression}) AND ({filter_expression.expression()})"
+            )
+        else:
+            expression = filter_expression.expression()
+        qgs_layer.setSubsetString(expression)
         return qgs_layer
 
     def _prepare_custom_layer(
@@ -0,0 +1,67 @@
+"""The environment a runner works on a job in.
+
+It does not depend on QGIS, so the cancellation of jobs can be decided
+without it.
+"""
+
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+
+from qgis_server_light.worker.timing import JobTimings
+
+
+class JobCancelledError(Exception):
+    """Raised by a runner which stopped working on a job because nobody
+    waits for its result anymore.
+    """
+
+
+@dataclass
+class JobContext:
+    """The environment a job is run in.
+
+    Attributes:
+        base_path: The path relative data sources are resolved against.
+        deadline: The absolute time (unix timestamp) after which nobody
+            waits for the result anymore.
+        cancelled: Tells if the job was cancelled by the client. It usually
+            asks redis, so it is called at most every
+            `cancelled_poll_interval` seconds.
+        cancel_check_interval: Seconds between two checks for cancellation
+            while a runner waits for QGIS.
+        cancelled_poll_interval: Seconds during which the answer of
+            `cancelled` is reused. A cancelled job stays cancelled.
+        timings: Collects the time spent in the phases of the job.
+        clock: Returns the current unix timestamp.
+    """
+
+    base_path: str | Path
+    deadline: float | None = None
+    cancelled: Callable[[], bool] | None = None
+    cancel_check_interval: float = 0.25
+    cancelled_poll_interval: float = 2.0
+    timings: JobTimings = field(default_factory=JobTimings)
+    clock: Callable[[], float] = time.time
+    _cancelled: bool = field(default=False, init=False, repr=False)
+    _polled: float | None = field(default=None, init=False, repr=False)
+
+    def is_cancelled(self) -> bool:
+        now = self.clock()
+        if self.deadline is not None and now > self.deadline:
+            return True
+        if self._cancelled or self.cancelled is None:
+            return self._cancelled
+        if (
+            self._polled is not None
+            and now - self._polled < self.cancelled_poll_interval
+        ):
+            return False
+        self._polled = now
+        self._cancelled = self.cancelled()
+        return self._cancelled
+
+    def raise_if_cancelled(self):
+        if self.is_cancelled():
+            raise JobCancelledError("The job was cancelled or its deadline passed")
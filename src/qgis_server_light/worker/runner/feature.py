@@ -5,6 +5,7 @@ from PyQt5.QtXml import QDomDocument
 from qgis.core import (
     QgsApplication,
     QgsFeatureRequest,
+    QgsFeedback,
     QgsMapLayer,
     QgsOgcUtils,
     QgsVectorLayer,
@@ -23,11 +24,14 @@ from qgis_server_light.interface.job.feature.output import (
     QueryCollection,
 )
 from qgis_server_light.worker.qgis_type_serializer import register_converters_at_runtime
-from qgis_server_light.worker.runner.common import JobContext, MapRunner
+from qgis_server_light.worker.runner.common import MapRunner
+from qgis_server_light.worker.runner.context import JobCancelledError, JobContext
 
 
 class GetFeatureRunner(MapRunner):
     job_info_class = QslJobInfoFeature
+    # number of features fetched between two checks for cancellation
+    cancel_check_features = 1000
 
     def __init__(
         self,
@@ -53,6 +57,26 @@ class GetFeatureRunner(MapRunner):
     def _load_style(self, qgs_layer: QgsMapLayer, job_layer_definition: QslJobLayer):
         logging.info(" ✓ Omit style loading on WFS layer operation.")
 
+    def _fetch_features(self, layer: QgsVectorLayer, feature_request) -> list:
+        """Fetches all features of the request. The iteration stops as soon as
+        the job is cancelled, the feedback also stops the provider from
+        fetching any further.
+        """
+        feedback = QgsFeedback()
+        feature_request.setFeedback(feedback)
+        layer_features = []
+        for layer_feature in layer.getFeatures(feature_request):
+            layer_features.append(layer_feature)
+            if (
+                len(layer_features) % self.cancel_check_features == 0
+                and self.context.is_cancelled()
+            ):
+                feedback.cancel()
+                raise JobCancelledError(
+                    f"Fetching features of job {self.job_info.id} cancelled"
+                )
+        return layer_features
+
     def run(self):
         query_collection = QueryCollection()
         numbers_matched = 0
@@ -87,7 +111,8 @@ class GetFeatureRunner(MapRunner):
                         feature_request = QgsFeatureRequest(expression)
                     else:
                         feature_request = QgsFeatureRequest()
-                    layer_features = list(layer.getFeatures(feature_request))
+                    with self.context.timings.measure("fetch"):
+                        layer_features = self._fetch_features(layer, feature_request)
                     numbers_matched += len(layer_features)
                     logging.info(f" Found {len(layer_features)} features")
                     if self.job_info.job.count:
@@ -114,7 +139,10 @@ class GetFeatureRunner(MapRunner):
                     )
         if numbers_matched > 0:
             query_collection.numbers_matched = numbers_matched
-        with register_converters_at_runtime():
+        with (
+            register_converters_at_runtime(),
+            self.context.timings.measure("encode"),
+        ):
             data = JsonSerializer().render(query_collection).encode()
             return JobResult(
                 id=self.job_info.id,
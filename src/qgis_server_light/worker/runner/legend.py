@@ -1,7 +1,6 @@
 import logging
-from typing import Dict, Optional, Tuple
+from typing import Dict, Optional
 
-from fpng_py import CompressionFlags, fpng_encode_image_to_memory
 from qgis.core import (
     QgsApplication,
     QgsLayerTree,
@@ -10,11 +9,12 @@ from qgis.core import (
     QgsLegendSettings,
     QgsLegendStyle,
 )
-from qgis.PyQt.QtCore import QBuffer, QByteArray, QIODevice, Qt
+from qgis.PyQt.QtCore import Qt
 from qgis.PyQt.QtGui import QImage, QPainter
 
 from qgis_server_light.interface.job.common.output import JobResult
 from qgis_server_light.interface.job.legend.input import QslJobInfoLegend
+from qgis_server_light.worker.image_utils import encode_image, render_format
 from qgis_server_light.worker.runner.common import JobContext, MapRunner
 
 
@@ -30,10 +30,6 @@ class GetLegendRunner(MapRunner):
     ) -> None:
         super().__init__(qgis, context, job_info, layer_cache)
 
-    @classmethod
-    def image_formats(cls):
-        return {"image/png": cls._encode_png, "image/jpeg": cls._encode_jpg}
-
     def run(self):
         logging.info(f"Executing job: {self.job_info}")
         for job_layer_definition in self.job_info.job.layers:
@@ -46,9 +42,6 @@ class GetLegendRunner(MapRunner):
         for layer in self.map_layers:
             root.addLayer(layer)
 
-        dpi = self.job_info.job.dpi
-        px_per_mm = dpi / 25.4
-
         model = QgsLayerTreeModel(root)
         settings = QgsLegendSettings()
 
@@ -62,6 +55,24 @@ class GetLegendRunner(MapRunner):
             for layer_node in root.children():
                 QgsLegendRenderer.setNodeLegendStyle(layer_node, QgsLegendStyle.Hidden)
 
+        with self.context.timings.measure("render"):
+            image = self._render_legend(model, settings)
+
+        with self.context.timings.measure("encode"):
+            content_type, image_data = encode_image(image, self.job_info.job.format)
+
+        return JobResult(
+            id=self.job_info.id,
+            data=image_data,
+            content_type=content_type,
+        )
+
+    def _render_legend(
+        self, model: QgsLayerTreeModel, settings: QgsLegendSettings
+    ) -> QImage:
+        dpi = self.job_info.job.dpi
+        px_per_mm = dpi / 25.4
+
         renderer = QgsLegendRenderer(model, settings)
 
         width = self.job_info.job.width
@@ -86,7 +97,7 @@ class GetLegendRunner(MapRunner):
             y_scale = height / (legend_size_mm.height() * px_per_mm)
             painter_scale = min(x_scale, y_scale)
 
-        image = QImage(width, height, QImage.Format_ARGB32)
+        image = QImage(width, height, render_format(self.job_info.job.format))
         image.setDotsPerMeterX(int(dpi * 39.37))
         image.setDotsPerMeterY(int(dpi * 39.37))
         image.fill(Qt.white)
@@ -99,50 +110,4 @@ class GetLegendRunner(MapRunner):
 
         renderer.drawLegend(painter)
         painter.end()
-
-        content_type, image_data = self._encode_image(
-            image, self.job_info.job.format.lower()
-        )
-
-        return JobResult(
-            id=self.job_info.id,
-            data=image_data,
-            content_type=content_type,
-        )
-
-    def _encode_image(self, image: QImage, fmt: str) -> Tuple[str, bytearray]:
-        """Encodes an image in a specific mime type
-        Args:
-            image (QImage): The image to encode
-            fmt (str): The mime type of the format
-        Returns:
-            A tuple with mime type and bytes-like object of an encoded image in the desired format
-        """
-        try:
-            fmt = fmt.lower()
-            encoding_method = self.image_formats()[fmt]
-            return fmt, encoding_method(image)
-        except KeyError:
-            raise RuntimeError(
-                f"Requested mimtype '{fmt}' was found in {list(self.image_formats())}."
-            )
-
-    @staticmethod
-    def _encode_png(image: QImage):
-        image = image.convertToFormat(QImage.Format_RGBA8888)
-        image_data = fpng_encode_image_to_memory(
-            image.constBits().asstring(image.sizeInBytes()),
-            image.width(),
-            image.height(),
-            0,
-            CompressionFlags.NONE,
-        )
-        return image_data
-
-    @staticmethod
-    def _encode_jpg(image: QImage):
-        image_data = QByteArray()
-        buf = QBuffer(image_data)
-        buf.open(QIODevice.WriteOnly)
-        image.save(buf, "JPG")
-        return image_data
+        return image
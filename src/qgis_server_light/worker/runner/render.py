@@ -1,15 +1,17 @@
 import logging
-from typing import Dict, Optional, Tuple
+from functools import partial
+from typing import Dict, Optional, Set
 
-from fpng_py import CompressionFlags, fpng_encode_image_to_memory
-from PyQt5.QtCore import QBuffer, QByteArray, QEventLoop, QIODevice
+from PyQt5.QtCore import QEventLoop, QTimer
 from PyQt5.QtGui import QImage
 from qgis.core import QgsApplication, QgsMapRendererParallelJob
 from qgis.server import QgsFeatureFilter, QgsFeatureFilterProviderGroup
 
 from qgis_server_light.interface.job.common.output import JobResult
 from qgis_server_light.interface.job.render.input import QslJobInfoRender
-from qgis_server_light.worker.runner.common import JobContext, MapRunner
+from qgis_server_light.worker.image_utils import encode_image, render_format
+from qgis_server_light.worker.runner.common import MapRunner
+from qgis_server_light.worker.runner.context import JobCancelledError, JobContext
 
 
 class RenderRunner(MapRunner):
@@ -25,10 +27,10 @@ class RenderRunner(MapRunner):
         layer_cache: Optional[Dict] = None,
     ) -> None:
         super().__init__(qgis, context, job_info, layer_cache)
-
-    @classmethod
-    def image_formats(cls):
-        return {"image/png": cls._encode_png, "image/jpeg": cls._encode_jpg}
+        # cancelled renderers are kept alive until their threads finished,
+        # deleting a running renderer would block until then. The connection
+        # to `finished` keeps the runner and with it this set alive
+        self.cancelled_renderers: Set[QgsMapRendererParallelJob] = set()
 
     def run(self):
         """Run this runner.
@@ -36,59 +38,64 @@ class RenderRunner(MapRunner):
             A JobResult with the content_type and image_data (bytes) of the rendered image.
         """
         logging.info(f"Executing job: {self.job_info}")
+        img = self._render()
+        with self.context.timings.measure("encode"):
+            content_type, image_data = encode_image(img, self.job_info.job.format)
+        return JobResult(
+            id=self.job_info.id, data=image_data, content_type=content_type
+        )
+
+    def _render(self) -> QImage:
+        """Provides the layers of the job and renders its map.
+
+        Returns:
+            The rendered image.
+        """
         feature_filter = QgsFeatureFilter()
         for job_layer_definition in self.job_info.job.layers:
             self._provide_layer(job_layer_definition)
         map_settings = self._get_map_settings(self.map_layers)
+        map_settings.setOutputImageFormat(render_format(self.job_info.job.format))
         filter_providers = QgsFeatureFilterProviderGroup()
         filter_providers.addProvider(feature_filter)
         renderer = QgsMapRendererParallelJob(map_settings)
         renderer.setFeatureFilterProvider(filter_providers)
         event_loop = QEventLoop(self.qgis)
         renderer.finished.connect(event_loop.quit)
-        renderer.start()
-        event_loop.exec_()
+        cancel_timer = QTimer()
+        cancel_timer.setInterval(int(self.context.cancel_check_interval * 1000))
+        cancel_timer.timeout.connect(
+            partial(self._cancel_if_requested, renderer, event_loop)
+        )
+        self.context.raise_if_cancelled()
+        with self.context.timings.measure("render"):
+            renderer.start()
+            cancel_timer.start()
+            event_loop.exec_()
+            cancel_timer.stop()
+        if renderer in self.cancelled_renderers:
+            raise JobCancelledError(f"Rendering of job {self.job_info.id} cancelled")
         img = renderer.renderedImage()
+        # the image shares its pixels with the renderer, changing it (and
+        # converting it in place for the encoder) would copy them while the
+        # renderer is alive
+        cancel_timer.timeout.disconnect()
+        del renderer
         img.setDotsPerMeterX(int(map_settings.outputDpi() * 39.37))
         img.setDotsPerMeterY(int(map_settings.outputDpi() * 39.37))
-        content_type, image_data = self._encode_image(img, self.job_info.job.format)
-        return JobResult(
-            id=self.job_info.id, data=image_data, content_type=content_type
-        )
+        return img
 
-    def _encode_image(self, image: QImage, fmt: str) -> Tuple[str, bytearray]:
-        """Encodes an image in a specific mime type
-        Args:
-            image (QImage): The image to encode
-            fmt (str): The mime type of the format
-        Returns:
-            A tuple with mime type and bytes-like object of an encoded image in the desired format
+    def _cancel_if_requested(
+        self, renderer: QgsMapRendererParallelJob, event_loop: QEventLoop
+    ):
+        """Stops waiting for a renderer which nobody needs the result of. The
+        render threads are stopped in the background, the worker is free
+        right away.
         """
-        try:
-            fmt = fmt.lower()
-            encoding_method = self.image_formats()[fmt]
-            return fmt, encoding_method(image)
-        except KeyError:
-            raise RuntimeError(
-                f"Requested mimtype '{fmt}' was found in {list(self.image_formats.keys())}."
-            )
-
-    @staticmethod
-    def _encode_png(image: QImage):
-        image.convertTo(QImage.Format_RGBA8888)
-        image_data = fpng_encode_image_to_memory(
-            image.constBits().asstring(image.sizeInBytes()),
-            image.width(),
-            image.height(),
-            0,
-            CompressionFlags.NONE,
-        )
-        return image_data
-
-    @staticmethod
-    def _encode_jpg(image: QImage):
-        image_data = QByteArray()
-        buf = QBuffer(image_data)
-        buf.open(QIODevice.WriteOnly)
-        image.save(buf, "JPG")
-        return image_data
+        if not self.context.is_cancelled():
+            return
+        logging.info(f"Cancelling rendering of job {self.job_info.id}")
+        self.cancelled_renderers.add(renderer)
+        renderer.finished.connect(lambda: self.cancelled_renderers.discard(renderer))
+        renderer.cancelWithoutBlocking()
+        event_loop.quit()
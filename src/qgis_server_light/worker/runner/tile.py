@@ -0,0 +1,61 @@
+import logging
+from typing import Dict, Optional
+
+from PyQt5.QtCore import QRect
+from qgis.core import QgsApplication
+
+from qgis_server_light.interface.job.tile.input import QslJobInfoTile
+from qgis_server_light.interface.job.tile.output import TileJobResult, TileSibling
+from qgis_server_light.worker.image_utils import encode_image
+from qgis_server_light.worker.runner.common import JobContext
+from qgis_server_light.worker.runner.render import RenderRunner
+
+
+class TileRunner(RenderRunner):
+    """Renders the metatile of a QslJobInfoTile once and slices it into its
+    tiles. The requested tile is the result, the others are returned as its
+    siblings.
+    """
+
+    job_info_class = QslJobInfoTile
+
+    def __init__(
+        self,
+        qgis: QgsApplication,
+        context: JobContext,
+        job_info: QslJobInfoTile,
+        layer_cache: Optional[Dict] = None,
+    ) -> None:
+        super().__init__(qgis, context, job_info, layer_cache)
+
+    def run(self):
+        """Run this runner.
+        Returns:
+            A TileJobResult with the requested tile and its siblings.
+        """
+        logging.info(f"Executing job: {self.job_info}")
+        job = self.job_info.job
+        img = self._render()
+        result = None
+        siblings = []
+        columns, rows = job.metatile_columns, job.metatile_rows
+        with self.context.timings.measure("encode"):
+            for x, y in job.tiles():
+                tile = img.copy(
+                    QRect(
+                        (x - columns.start) * job.tile_size,
+                        (y - rows.start) * job.tile_size,
+                        job.tile_size,
+                        job.tile_size,
+                    )
+                )
+                content_type, image_data = encode_image(tile, job.format)
+                if (x, y) == (job.x, job.y):
+                    result = TileJobResult(
+                        id=self.job_info.id, data=image_data, content_type=content_type
+                    )
+                else:
+                    siblings.append(TileSibling(x=x, y=y, data=image_data))
+        result.siblings = siblings
+        logging.debug(f"Sliced {len(siblings) + 1} tiles of job {self.job_info.id}")
+        return result
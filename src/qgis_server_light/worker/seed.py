@@ -0,0 +1,428 @@
+"""Pre-renders the tiles of an exported project into a tile store.
+
+The layers are taken from the `Config` the exporter wrote for the project.
+The tiles of the bbox and zoom levels are rendered as metatiles (see
+`QslJobParameterTile`) by a pool of local processes, each running its own
+engine, and written to a directory, an MBTiles or a GeoPackage file:
+
+    python -m qgis_server_light.worker.seed project.json --output tiles.mbtiles \\
+        --data-root /io/data --folder-name project --bbox 730000,5830000,740000,5840000 \\
+        --min-zoom 10 --max-zoom 16 --layers roads,buildings
+
+Metatiles whose tiles are all stored already are skipped, so an interrupted
+seeding continues where it stopped when it is started again.
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Iterator
+from uuid import uuid4
+
+from xsdata.formats.dataclass.parsers import JsonParser, XmlParser
+
+from qgis_server_light.interface.common import BBox
+from qgis_server_light.interface.exporter.extract import Config, DataSet
+from qgis_server_light.interface.job.common.input import QslJobLayer
+from qgis_server_light.interface.job.tile.input import (
+    TILE_MATRIX_SETS,
+    QslJobInfoTile,
+    QslJobParameterTile,
+)
+from qgis_server_light.worker.tile_store import TileStore, open_tile_store
+
+TILE_RUNNER = "qgis_server_light.worker.runner.tile.TileRunner"
+
+# the engine of a pool process
+_engine = None
+
+
+def read_config(path: str) -> Config:
+    """Reads a JSON or XML export of a project."""
+    if path.lower().endswith(".xml"):
+        return XmlParser().from_path(path, Config)
+    return JsonParser().from_path(path, Config)
+
+
+def find_datasets(config: Config, names: list[str] | None = None) -> list[DataSet]:
+    """The datasets which are rendered, in the order of the names.
+
+    Args:
+        config: The exported project.
+        names: The names of the datasets. Without names, all checked
+            spatial datasets are used.
+
+    Raises:
+        LookupError: When a dataset does not exist.
+    """
+    datasets = [
+        *config.datasets.vector,
+        *config.datasets.raster,
+        *config.datasets.custom,
+    ]
+    if names is None:
+        return [
+            dataset for dataset in datasets if dataset.is_checked and dataset.is_spatial
+        ]
+    by_name = {dataset.name: dataset for dataset in datasets}
+    missing = [name for name in names if name not in by_name]
+    if missing:
+        raise LookupError(f"Unknown layers: {', '.join(missing)}")
+    return [by_name[name] for name in names]
+
+
+def job_layer(dataset: DataSet, folder_name: str) -> QslJobLayer:
+    """The job layer rendering a dataset with its current style.
+
+    Args:
+        dataset: The exported dataset.
+        folder_name: The folder of the project within the data root, the
+            paths of local sources are relative to it.
+    """
+    definition = dataset.source.definition
+    if definition is None or not hasattr(definition, "to_qgis_decoded_uri"):
+        raise ValueError(f"The source of {dataset.name} can't be rendered")
+    return QslJobLayer(
+        id=dataset.id,
+        name=dataset.name,
+        source=json.dumps(definition.to_qgis_decoded_uri),
+        remote=definition.remote,
+        folder_name=folder_name,
+        driver=dataset.driver,
+        style=dataset.style(),
+    )
+
+
+def plan_metatiles(
+    tile_matrix_set: str, bbox: BBox, zoom_levels: range, metatile: int
+) -> Iterator[tuple[int, int, int]]:
+    """The zoom level, column and row of the top left tile of each metatile
+    intersecting the bbox.
+    """
+    matrix = TILE_MATRIX_SETS[tile_matrix_set]
+    for z in zoom_levels:
+        columns, rows = matrix.tile_range(bbox, z)
+        if not columns or not rows:
+            continue
+        for y in range(rows.start - rows.start % metatile, rows.stop, metatile):
+            for x in range(
+                columns.start - columns.start % metatile, columns.stop, metatile
+            ):
+                yield z, x, y
+
+
+@dataclass
+class SeedStats:
+    """The progress of a seeding.
+
+    Attributes:
+        total: Number of planned metatiles.
+        rendered: Number of rendered metatiles.
+        skipped: Number of metatiles which were stored already.
+        failed: Number of metatiles which could not be rendered.
+        tiles: Number of stored tiles.
+        started: When the seeding was started (monotonic clock).
+    """
+
+    total: int = 0
+    rendered: int = 0
+    skipped: int = 0
+    failed: int = 0
+    tiles: int = 0
+    started: float = field(default_factory=time.monotonic)
+
+    @property
+    def done(self) -> int:
+        return self.rendered + self.skipped + self.failed
+
+    @property
+    def tiles_per_second(self) -> float:
+        elapsed = time.monotonic() - self.started
+        return self.tiles / elapsed if elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.done}/{self.total} metatiles ({self.rendered} rendered, "
+            f"{self.skipped} skipped, {self.failed} failed), {self.tiles} tiles, "
+            f"{self.tiles_per_second:.1f} tiles/s"
+        )
+
+
+def _start_engine(data_root: str, svg_paths: list[str] | None) -> None:
+    """Initializes QGIS in a pool process. The parent process only plans
+    the metatiles and writes the tiles, it never loads QGIS.
+    """
+    global _engine
+    from qgis_server_light.worker.engine import Engine, EngineContext
+
+    _engine = Engine(EngineContext(data_root), [TILE_RUNNER], svg_paths)
+
+
+def _render_metatile(
+    job: QslJobParameterTile,
+) -> tuple[QslJobParameterTile, list[tuple[int, int, bytes]] | None, str | None]:
+    """Renders a metatile in a pool process.
+
+    Returns:
+        The job, the column, row and data of each tile and the error if the
+        metatile could not be rendered.
+    """
+    job_info = QslJobInfoTile(id=str(uuid4()), type=QslJobInfoTile.__name__, job=job)
+    try:
+        result = _engine.process(job_info)
+    except Exception as e:
+        return job, None, str(e)
+    tiles = [(job.x, job.y, bytes(result.data))]
+    tiles.extend((s.x, s.y, bytes(s.data)) for s in result.siblings)
+    return job, tiles, None
+
+
+class Seeder:
+    """Renders the tiles of a bbox and range of zoom levels.
+
+    Attributes:
+        layers: The layers which are rendered.
+        bbox: The extent in the CRS of the tile matrix set.
+        zoom_levels: The zoom levels which are seeded.
+        tile_matrix_set: The name of the tile matrix set.
+        metatile: The metatile factor, see `QslJobParameterTile`.
+        tile_size: The width and height of a tile in pixels.
+        format: The mime type of the tiles.
+        dpi: The dpi the tiles are rendered with.
+        progress_interval: Seconds between two progress reports.
+    """
+
+    def __init__(
+        self,
+        layers: list[QslJobLayer],
+        bbox: BBox,
+        zoom_levels: range,
+        tile_matrix_set: str = "WebMercatorQuad",
+        metatile: int = 4,
+        tile_size: int = 256,
+        format: str = "image/png",
+        dpi: int | None = None,
+        progress_interval: float = 10.0,
+    ) -> None:
+        self.layers = layers
+        self.bbox = bbox
+        self.zoom_levels = zoom_levels
+        self.tile_matrix_set = tile_matrix_set
+        self.metatile = metatile
+        self.tile_size = tile_size
+        self.format = format
+        self.dpi = dpi
+        self.progress_interval = progress_interval
+
+    def job(self, z: int, x: int, y: int) -> QslJobParameterTile:
+        return QslJobParameterTile(
+            layers=self.layers,
+            tile_matrix_set=self.tile_matrix_set,
+            z=z,
+            x=x,
+            y=y,
+            metatile=self.metatile,
+            tile_size=self.tile_size,
+            dpi=self.dpi,
+            format=self.format,
+        )
+
+    def stored(self, store: TileStore, job: QslJobParameterTile) -> bool:
+        """If all tiles of a metatile within the bbox are stored already."""
+        columns, rows = TILE_MATRIX_SETS[self.tile_matrix_set].tile_range(
+            self.bbox, job.z
+        )
+        return all(
+            store.has(job.z, x, y) for x, y in job.tiles() if x in columns and y in rows
+        )
+
+    def jobs(self, store: TileStore, stats: SeedStats) -> Iterator[QslJobParameterTile]:
+        """The jobs of the metatiles which are not stored yet."""
+        for z, x, y in plan_metatiles(
+            self.tile_matrix_set, self.bbox, self.zoom_levels, self.metatile
+        ):
+            job = self.job(z, x, y)
+            if self.stored(store, job):
+                stats.skipped += 1
+                continue
+            yield job
+
+    def run(
+        self,
+        store: TileStore,
+        data_root: str,
+        processes: int | None = None,
+        svg_paths: list[str] | None = None,
+    ) -> SeedStats:
+        """Renders all missing metatiles in a pool of processes and stores
+        their tiles.
+
+        Args:
+            store: Where the tiles are written to.
+            data_root: The data root of the engines.
+            processes: The number of pool processes, one per CPU by default.
+            svg_paths: The paths QGIS looks up SVG symbols in.
+
+        Returns:
+            The statistics of the seeding.
+        """
+        stats = SeedStats(
+            total=sum(
+                1
+                for _ in plan_metatiles(
+                    self.tile_matrix_set, self.bbox, self.zoom_levels, self.metatile
+                )
+            )
+        )
+        # the pool consumes the jobs in a thread of its own, the store must
+        # only be used from this one
+        jobs = list(self.jobs(store, stats))
+        logging.info(f"Seeding {len(jobs)} metatiles: {stats.summary()}")
+        last_report = time.monotonic()
+        with multiprocessing.Pool(
+            processes, initializer=_start_engine, initargs=(data_root, svg_paths)
+        ) as pool:
+            for job, tiles, error in pool.imap_unordered(_render_metatile, jobs):
+                if error is not None:
+                    stats.failed += 1
+                    logging.error(f"Metatile {job.z}/{job.x}/{job.y} failed: {error}")
+                else:
+                    for x, y, data in tiles:
+                        store.put(job.z, x, y, data)
+                    # a metatile is either stored completely or rendered again
+                    store.commit()
+                    stats.rendered += 1
+                    stats.tiles += len(tiles)
+                if time.monotonic() - last_report >= self.progress_interval:
+                    logging.info(stats.summary())
+                    last_report = time.monotonic()
+        logging.info(f"Seeding finished: {stats.summary()}")
+        return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Pre-renders the tiles of an exported project."
+    )
+    parser.add_argument("config", help="The JSON or XML export of the project.")
+    parser.add_argument(
+        "--output",
+        required=True,
+        help="A directory, an .mbtiles or a .gpkg file the tiles are written to.",
+    )
+    parser.add_argument(
+        "--bbox",
+        required=True,
+        help="The extent which is seeded as 'x_min,y_min,x_max,y_max' in the CRS "
+        "of the tile matrix set.",
+    )
+    parser.add_argument("--min-zoom", type=int, required=True)
+    parser.add_argument("--max-zoom", type=int, required=True)
+    parser.add_argument(
+        "--layers",
+        type=str,
+        help="Comma separated names of the layers. Defaults to all checked layers",
+        default=None,
+    )
+    parser.add_argument(
+        "--tile-matrix-set",
+        type=str,
+        choices=list(TILE_MATRIX_SETS),
+        help="Defaults to WebMercatorQuad",
+        default="WebMercatorQuad",
+    )
+    parser.add_argument(
+        "--metatile",
+        type=int,
+        help="Number of tiles per side which are rendered at once. Defaults to 4",
+        default=4,
+    )
+    parser.add_argument(
+        "--tile-size", type=int, help="Defaults to 256 pixels", default=256
+    )
+    parser.add_argument(
+        "--format",
+        type=str,
+        help="image/png, image/jpeg or image/webp, optionally with encoder "
+        "parameters like 'image/png; mode=8bit'. Defaults to image/png",
+        default="image/png",
+    )
+    parser.add_argument("--dpi", type=int, default=None)
+    parser.add_argument(
+        "--data-root",
+        type=str,
+        required=True,
+        help="The directory the data of the projects is stored in.",
+    )
+    parser.add_argument(
+        "--folder-name",
+        type=str,
+        help="The folder of the project within the data root. Defaults to the "
+        "data root itself",
+        default="",
+    )
+    parser.add_argument(
+        "--svg-path",
+        type=str,
+        help="Colon separated paths QGIS looks up SVG symbols in.",
+        default=None,
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        help="Number of rendering processes. Defaults to the number of CPUs",
+        default=os.cpu_count(),
+    )
+    parser.add_argument(
+        "--progress-interval",
+        type=float,
+        help="Seconds between two progress reports. Defaults to 10",
+        default=10.0,
+    )
+    parser.add_argument(
+        "--log-level",
+        type=str,
+        help="The log level. Defaults to info",
+        default="info",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=args.log_level.upper(), format="%(asctime)s [%(levelname)s] %(message)s"
+    )
+
+    config = read_config(args.config)
+    names = args.layers.split(",") if args.layers else None
+    layers = [
+        job_layer(dataset, args.folder_name) for dataset in find_datasets(config, names)
+    ]
+    seeder = Seeder(
+        layers,
+        BBox.from_string(args.bbox),
+        range(args.min_zoom, args.max_zoom + 1),
+        tile_matrix_set=args.tile_matrix_set,
+        metatile=args.metatile,
+        tile_size=args.tile_size,
+        format=args.format,
+        dpi=args.dpi,
+        progress_interval=args.progress_interval,
+    )
+    with open_tile_store(
+        args.output, args.tile_matrix_set, args.format, args.tile_size
+    ) as store:
+        stats = seeder.run(
+            store,
+            args.data_root,
+            processes=args.processes,
+            svg_paths=args.svg_path.split(":") if args.svg_path else None,
+        )
+    if stats.failed:
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,329 @@
+"""Stores seeded tiles in a directory, an MBTiles or a GeoPackage file.
+
+All stores address tiles by zoom level, column and row counted from the top
+left corner of the tile matrix, like `QslJobParameterTile`. Stores can be
+opened again to resume an interrupted seeding, tiles which are present
+already are reported by `has`.
+"""
+
+import os
+import sqlite3
+from abc import ABC, abstractmethod
+
+from qgis_server_light.interface.job.tile.input import TILE_MATRIX_SETS
+
+# file extensions of the image formats tiles can be stored in
+TILE_EXTENSIONS = {"image/png": "png", "image/jpeg": "jpg", "image/webp": "webp"}
+
+# the spatial reference systems of the supported tile matrix sets for the
+# GeoPackage `gpkg_spatial_ref_sys` table: srs id, organization and WKT
+GPKG_SPATIAL_REF_SYS = {
+    "EPSG:3857": (
+        3857,
+        "EPSG",
+        'PROJCS["WGS 84 / Pseudo-Mercator",GEOGCS["WGS 84",DATUM["WGS_1984",'
+        'SPHEROID["WGS 84",6378137,298.257223563]],PRIMEM["Greenwich",0],'
+        'UNIT["degree",0.0174532925199433]],PROJECTION["Mercator_1SP"],'
+        'PARAMETER["central_meridian",0],PARAMETER["scale_factor",1],'
+        'PARAMETER["false_easting",0],PARAMETER["false_northing",0],'
+        'UNIT["metre",1],AUTHORITY["EPSG","3857"]]',
+    ),
+    "CRS:84": (
+        4326,
+        "EPSG",
+        'GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,'
+        '298.257223563]],PRIMEM["Greenwich",0],UNIT["degree",0.0174532925199433],'
+        'AUTHORITY["EPSG","4326"]]',
+    ),
+}
+
+
+def tile_extension(format: str) -> str:
+    """The file extension of a format, which may carry encoder parameters
+    like `image/png; mode=8bit`.
+
+    Raises:
+        ValueError: When tiles can't be stored in the format.
+    """
+    mime_type = format.split(";")[0].strip().lower()
+    if mime_type not in TILE_EXTENSIONS:
+        raise ValueError(f"Tiles can't be stored as '{format}'")
+    return TILE_EXTENSIONS[mime_type]
+
+
+class TileStore(ABC):
+    """Where seeded tiles are written to.
+
+    Attributes:
+        path: The directory or file of the store.
+        tile_matrix_set: The name of the tile matrix set of the tiles.
+        format: The format of the tiles.
+        extension: The file extension of the format.
+        tile_size: The width and height of the tiles in pixels.
+    """
+
+    def __init__(
+        self, path: str, tile_matrix_set: str, format: str, tile_size: int = 256
+    ) -> None:
+        self.extension = tile_extension(format)
+        self.path = path
+        self.tile_matrix_set = tile_matrix_set
+        self.format = format
+        self.tile_size = tile_size
+
+    @abstractmethod
+    def has(self, z: int, x: int, y: int) -> bool:
+        """If the tile is stored already."""
+
+    @abstractmethod
+    def put(self, z: int, x: int, y: int, data: bytes) -> None:
+        """Stores a tile, replacing a stored one."""
+
+    def commit(self) -> None:
+        """Makes the tiles stored until now durable."""
+
+    def close(self) -> None:
+        self.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class DirectoryTileStore(TileStore):
+    """Stores each tile as `{path}/{z}/{x}/{y}.{extension}`."""
+
+    def tile_path(self, z: int, x: int, y: int) -> str:
+        return os.path.join(self.path, str(z), str(x), f"{y}.{self.extension}")
+
+    def has(self, z: int, x: int, y: int) -> bool:
+        return os.path.exists(self.tile_path(z, x, y))
+
+    def put(self, z: int, x: int, y: int, data: bytes) -> None:
+        path = self.tile_path(z, x, y)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # an interrupted write must not leave a tile which is skipped when
+        # the seeding is resumed
+        temporary = f"{path}.tmp"
+        with open(temporary, "wb") as f:
+            f.write(data)
+        os.replace(temporary, path)
+
+
+class SqliteTileStore(TileStore):
+    """The common part of the stores which are SQLite databases."""
+
+    table: str
+
+    def __init__(
+        self, path: str, tile_matrix_set: str, format: str, tile_size: int = 256
+    ) -> None:
+        super().__init__(path, tile_matrix_set, format, tile_size)
+        self.connection = sqlite3.connect(path)
+        self.initialize()
+        self.connection.commit()
+
+    @abstractmethod
+    def initialize(self) -> None:
+        """Creates the tables if they do not exist yet."""
+
+    def row(self, z: int, y: int) -> int:
+        return y
+
+    def has(self, z: int, x: int, y: int) -> bool:
+        cursor = self.connection.execute(
+            f"SELECT 1 FROM {self.table} "
+            "WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            (z, x, self.row(z, y)),
+        )
+        return cursor.fetchone() is not None
+
+    def put(self, z: int, x: int, y: int, data: bytes) -> None:
+        self.connection.execute(
+            f"INSERT OR REPLACE INTO {self.table} "
+            "(zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)",
+            (z, x, self.row(z, y), sqlite3.Binary(data)),
+        )
+
+    def commit(self) -> None:
+        self.connection.commit()
+
+    def close(self) -> None:
+        self.commit()
+        self.connection.close()
+
+
+class MBTilesStore(SqliteTileStore):
+    """Stores tiles in an MBTiles file. MBTiles only supports the
+    `WebMercatorQuad` tile matrix set and counts rows from the bottom.
+    """
+
+    table = "tiles"
+
+    def initialize(self) -> None:
+        if self.tile_matrix_set != "WebMercatorQuad":
+            raise ValueError("MBTiles only supports the WebMercatorQuad tile matrix")
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS metadata (name TEXT, value TEXT);
+            CREATE UNIQUE INDEX IF NOT EXISTS metadata_name ON metadata (name);
+            CREATE TABLE IF NOT EXISTS tiles (
+                zoom_level INTEGER,
+                tile_column INTEGER,
+                tile_row INTEGER,
+                tile_data BLOB
+            );
+            CREATE UNIQUE INDEX IF NOT EXISTS tile_index
+                ON tiles (zoom_level, tile_column, tile_row);
+            """
+        )
+        name = os.path.splitext(os.path.basename(self.path))[0]
+        self.set_metadata(name=name, format=self.extension)
+
+    def set_metadata(self, **values) -> None:
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)",
+            [(name, str(value)) for name, value in values.items()],
+        )
+
+    def row(self, z: int, y: int) -> int:
+        return (1 << z) - 1 - y
+
+    def close(self) -> None:
+        min_zoom, max_zoom = self.connection.execute(
+            "SELECT min(zoom_level), max(zoom_level) FROM tiles"
+        ).fetchone()
+        if min_zoom is not None:
+            self.set_metadata(minzoom=min_zoom, maxzoom=max_zoom)
+        super().close()
+
+
+class GeoPackageTileStore(SqliteTileStore):
+    """Stores tiles in the `tiles` tile pyramid table of a GeoPackage."""
+
+    table = "tiles"
+
+    def initialize(self) -> None:
+        crs = TILE_MATRIX_SETS[self.tile_matrix_set].crs
+        srs_id, organization, definition = GPKG_SPATIAL_REF_SYS[crs]
+        self.matrix = TILE_MATRIX_SETS[self.tile_matrix_set]
+        self.connection.executescript(
+            f"""
+            PRAGMA application_id = {0x47504B47};
+            PRAGMA user_version = 10200;
+            CREATE TABLE IF NOT EXISTS gpkg_spatial_ref_sys (
+                srs_name TEXT NOT NULL,
+                srs_id INTEGER PRIMARY KEY,
+                organization TEXT NOT NULL,
+                organization_coordsys_id INTEGER NOT NULL,
+                definition TEXT NOT NULL,
+                description TEXT
+            );
+            CREATE TABLE IF NOT EXISTS gpkg_contents (
+                table_name TEXT NOT NULL PRIMARY KEY,
+                data_type TEXT NOT NULL,
+                identifier TEXT UNIQUE,
+                description TEXT DEFAULT '',
+                last_change DATETIME NOT NULL
+                    DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ','now')),
+                min_x DOUBLE,
+                min_y DOUBLE,
+                max_x DOUBLE,
+                max_y DOUBLE,
+                srs_id INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS gpkg_tile_matrix_set (
+                table_name TEXT NOT NULL PRIMARY KEY,
+                srs_id INTEGER NOT NULL,
+                min_x DOUBLE NOT NULL,
+                min_y DOUBLE NOT NULL,
+                max_x DOUBLE NOT NULL,
+                max_y DOUBLE NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS gpkg_tile_matrix (
+                table_name TEXT NOT NULL,
+                zoom_level INTEGER NOT NULL,
+                matrix_width INTEGER NOT NULL,
+                matrix_height INTEGER NOT NULL,
+                tile_width INTEGER NOT NULL,
+                tile_height INTEGER NOT NULL,
+                pixel_x_size DOUBLE NOT NULL,
+                pixel_y_size DOUBLE NOT NULL,
+                CONSTRAINT pk_ttm PRIMARY KEY (table_name, zoom_level)
+            );
+            CREATE TABLE IF NOT EXISTS {self.table} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                zoom_level INTEGER NOT NULL,
+                tile_column INTEGER NOT NULL,
+                tile_row INTEGER NOT NULL,
+                tile_data BLOB NOT NULL,
+                UNIQUE (zoom_level, tile_column, tile_row)
+            );
+            """
+        )
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO gpkg_spatial_ref_sys (srs_name, srs_id, "
+            "organization, organization_coordsys_id, definition) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [
+                ("Undefined cartesian SRS", -1, "NONE", -1, "undefined"),
+                ("Undefined geographic SRS", 0, "NONE", 0, "undefined"),
+                (crs, srs_id, organization, srs_id, definition),
+            ],
+        )
+        width, height = self.matrix.size(0)
+        extent = (
+            self.matrix.x_min,
+            self.matrix.y_max - height * self.matrix.span,
+            self.matrix.x_min + width * self.matrix.span,
+            self.matrix.y_max,
+        )
+        self.connection.execute(
+            "INSERT OR IGNORE INTO gpkg_contents (table_name, data_type, "
+            "identifier, min_x, min_y, max_x, max_y, srs_id) "
+            "VALUES (?, 'tiles', ?, ?, ?, ?, ?, ?)",
+            (self.table, self.table, *extent, srs_id),
+        )
+        self.connection.execute(
+            "INSERT OR IGNORE INTO gpkg_tile_matrix_set VALUES (?, ?, ?, ?, ?, ?)",
+            (self.table, srs_id, *extent),
+        )
+        self._zoom_levels: set[int] = set()
+
+    def put(self, z: int, x: int, y: int, data: bytes) -> None:
+        if z not in self._zoom_levels:
+            width, height = self.matrix.size(z)
+            pixel_size = self.matrix.span / (1 << z) / self.tile_size
+            self.connection.execute(
+                "INSERT OR IGNORE INTO gpkg_tile_matrix VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    self.table,
+                    z,
+                    width,
+                    height,
+                    self.tile_size,
+                    self.tile_size,
+                    pixel_size,
+                    pixel_size,
+                ),
+            )
+            self._zoom_levels.add(z)
+        super().put(z, x, y, data)
+
+
+def open_tile_store(
+    path: str, tile_matrix_set: str, format: str, tile_size: int = 256
+) -> TileStore:
+    """Opens the store matching the extension of the path, `.mbtiles`,
+    `.gpkg` or a directory for anything else.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".mbtiles":
+        store_class = MBTilesStore
+    elif extension == ".gpkg":
+        store_class = GeoPackageTileStore
+    else:
+        store_class = DirectoryTileStore
+    return store_class(path, tile_matrix_set, format, tile_size)
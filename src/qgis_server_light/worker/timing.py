@@ -0,0 +1,90 @@
+"""Measures the wall and CPU time of the phases a job goes through in the
+worker.
+
+Wall time is taken with `time.perf_counter` and CPU time with
+`time.process_time`. The CPU time is the one of the whole process, so it
+includes the threads QGIS renders in.
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from qgis_server_light.interface.dispatcher.redis_asio import RedisQueue
+from qgis_server_light.interface.job.common.output import PhaseTiming
+
+
+@contextmanager
+def measure(name: str, target: str | None = None) -> Iterator[PhaseTiming]:
+    """Measures the enclosed block. The timing is complete once the block
+    was left, also when it raised.
+
+    Args:
+        name: The name of the phase.
+        target: The layer id for phases which run once per layer.
+    """
+    timing = PhaseTiming(name=name, wall=0.0, cpu=0.0, target=target)
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    try:
+        yield timing
+    finally:
+        timing.wall = time.perf_counter() - wall
+        timing.cpu = time.process_time() - cpu
+
+
+class JobTimings:
+    """Collects the timings of the phases of one job.
+
+    Attributes:
+        phases: The timings in the order the phases were entered.
+    """
+
+    def __init__(self) -> None:
+        self.phases: list[PhaseTiming] = []
+
+    def add(self, timing: PhaseTiming) -> PhaseTiming:
+        self.phases.append(timing)
+        return timing
+
+    @contextmanager
+    def measure(self, name: str, target: str | None = None) -> Iterator[PhaseTiming]:
+        """Measures the enclosed block as a phase of this job, see
+        `measure`.
+        """
+        with measure(name, target) as timing:
+            self.add(timing)
+            yield timing
+
+    def job_hash_mapping(self) -> dict[str, str]:
+        """The timings as fields of the `job:{id}` hash.
+
+        Each phase is written as `timing.{name}.wall` and `timing.{name}.cpu`,
+        phases running per layer as `timing.{name}.{layer id}.wall` and so
+        on. The layer cache outcome is written as `timing.layer.{layer
+        id}.cache` (`hit` or `miss`). Phases which ran more than once for the
+        same target are summed up.
+        """
+        totals: dict[str, list[float]] = {}
+        mapping: dict[str, str] = {}
+        for timing in self.phases:
+            key = f"{RedisQueue.job_timing_key}.{timing.name}"
+            if timing.target is not None:
+                key = f"{key}.{timing.target}"
+            total = totals.setdefault(key, [0.0, 0.0])
+            total[0] += timing.wall
+            total[1] += timing.cpu
+            if timing.cache_hit is not None:
+                mapping[f"{key}.cache"] = "hit" if timing.cache_hit else "miss"
+        for key, (wall, cpu) in totals.items():
+            mapping[f"{key}.wall"] = repr(wall)
+            mapping[f"{key}.cpu"] = repr(cpu)
+        return mapping
+
+    def summary(self) -> str:
+        """A compact one line representation for the log."""
+        return ", ".join(
+            f"{timing.name}{f'[{timing.target}]' if timing.target else ''}="
+            f"{timing.wall * 1000:.1f}ms/{timing.cpu * 1000:.1f}ms cpu"
+            for timing in self.phases
+        )
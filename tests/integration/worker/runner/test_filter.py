@@ -0,0 +1,61 @@
+import json
+import uuid
+
+from qgis_server_light.interface.common import BBox
+from qgis_server_light.interface.exporter.extract import OgrSource
+from qgis_server_light.interface.job.common.input import OgcFilter110, QslJobLayer
+from qgis_server_light.interface.job.render.input import (
+    QslJobInfoRender,
+    QslJobParameterRender,
+)
+from qgis_server_light.worker.runner.context import JobContext
+from qgis_server_light.worker.runner.render import RenderRunner
+
+FILTER = """<ogc:Filter xmlns:ogc="http://www.opengis.net/ogc">
+  <ogc:PropertyIsEqualTo>
+    <ogc:PropertyName>canton</ogc:PropertyName>
+    <ogc:Literal>BE</ogc:Literal>
+  </ogc:PropertyIsEqualTo>
+</ogc:Filter>"""
+
+
+class TestFilteredLayerIntegration:
+    def test_variant_does_not_change_the_base_layer(self, qgis_app, data_path):
+        job_layer = QslJobLayer(
+            id=str(uuid.uuid4()),
+            name="test-local-gpkg",
+            source=json.dumps(
+                OgrSource(
+                    path="placenames.gpkg", layer_name="placenames"
+                ).to_qgis_decoded_uri
+            ),
+            remote=False,
+            folder_name="data",
+            driver="ogr",
+            filter=OgcFilter110(definition=FILTER),
+        )
+        layer_cache = {}
+        runner = RenderRunner(
+            qgis_app,
+            JobContext(base_path=data_path),
+            QslJobInfoRender(
+                id=str(uuid.uuid4()),
+                type=QslJobInfoRender.__name__,
+                job=QslJobParameterRender(
+                    layers=[job_layer],
+                    bbox=BBox(2485675.0, 2833675.0, 1075128.0, 1295628.0),
+                    crs="EPSG:2056",
+                    width=256,
+                    height=256,
+                ),
+            ),
+            layer_cache,
+        )
+        variant = runner._handle_layer_cache(job_layer)
+        base = layer_cache[job_layer.id]
+        assert layer_cache[runner.get_cache_name(job_layer)] is variant
+        assert variant is not base
+        assert "canton" in variant.subsetString()
+        assert base.subsetString() == ""
+        assert base.styleManager().styles() == ["default"]
+        assert variant.featureCount() < base.featureCount()
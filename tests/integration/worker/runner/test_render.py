@@ -15,7 +15,7 @@ from qgis_server_light.interface.job.render.input import (
     QslJobInfoRender,
     QslJobParameterRender,
 )
-from qgis_server_light.worker.runner.common import JobContext
+from qgis_server_light.worker.runner.context import JobCancelledError, JobContext
 from qgis_server_light.worker.runner.render import RenderRunner
 
 
@@ -118,3 +118,24 @@ class TestRenderRunnerIntegration:
 
         # we allow a number of X pixels difference between both images
         assert mismatch <= allowed_missmatch
+
+    def test_cancelled_render(self, qgis_app, data_path):
+        job_info = QslJobInfoRender(
+            id=str(uuid.uuid4()),
+            type=QslJobInfoRender.__name__,
+            job=QslJobParameterRender(
+                layers=[],
+                bbox=BBox(2485675.0, 2833675.0, 1075128.0, 1295628.0),
+                crs="EPSG:2056",
+                width=256,
+                height=256,
+            ),
+        )
+        runner = RenderRunner(
+            qgis_app,
+            JobContext(base_path=data_path, cancelled=lambda: True),
+            job_info,
+            {},
+        )
+        with pytest.raises(JobCancelledError):
+            runner.run()
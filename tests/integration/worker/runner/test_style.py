@@ -0,0 +1,71 @@
+import uuid
+import zlib
+from base64 import urlsafe_b64encode
+
+from PyQt5.QtXml import QDomDocument
+from qgis.core import QgsVectorLayer
+
+from qgis_server_light.interface.common import BBox, Style
+from qgis_server_light.interface.dispatcher.cache import style_hash
+from qgis_server_light.interface.job.common.input import QslJobLayer
+from qgis_server_light.interface.job.render.input import (
+    QslJobInfoRender,
+    QslJobParameterRender,
+)
+from qgis_server_light.worker.runner.context import JobContext
+from qgis_server_light.worker.runner.render import RenderRunner
+
+
+def job_layer(qml: str, number: int) -> QslJobLayer:
+    # a comment makes each definition (and with that its hash) unique
+    definition = f"{qml}<!-- {number} -->".encode()
+    return QslJobLayer(
+        id="points",
+        name="points",
+        source="",
+        remote=False,
+        folder_name="data",
+        driver="memory",
+        style=Style(
+            name=f"style-{number}",
+            definition=urlsafe_b64encode(zlib.compress(definition)).decode(),
+        ),
+    )
+
+
+class TestLoadStyleIntegration:
+    def test_least_recently_used_style_is_evicted(self, qgis_app, data_path):
+        runner = RenderRunner(
+            qgis_app,
+            JobContext(base_path=data_path),
+            QslJobInfoRender(
+                id=str(uuid.uuid4()),
+                type=QslJobInfoRender.__name__,
+                job=QslJobParameterRender(
+                    layers=[],
+                    bbox=BBox(2485675.0, 2833675.0, 1075128.0, 1295628.0),
+                    crs="EPSG:2056",
+                    width=256,
+                    height=256,
+                ),
+            ),
+            {},
+        )
+        runner.max_named_styles = 2
+        layer = QgsVectorLayer("Point?crs=EPSG:2056", "points", "memory")
+        document = QDomDocument()
+        layer.exportNamedStyle(document)
+        layers = [job_layer(document.toString(), number) for number in range(4)]
+        names = [
+            f"{runner.style_name_prefix}{style_hash(item.style)}" for item in layers
+        ]
+        for item in layers[:3]:
+            assert runner._load_style(layer, item) is False
+        # the first style is used again, the second one is the least
+        # recently used now
+        assert runner._load_style(layer, layers[0]) is True
+        assert runner._load_style(layer, layers[3]) is False
+        styles = layer.styleManager().styles()
+        assert names[1] not in styles
+        assert all(name in styles for name in (names[0], names[2], names[3]))
+        assert layer.styleManager().currentStyle() == names[3]
@@ -0,0 +1,258 @@
+import asyncio
+
+import fakeredis
+
+from qgis_server_light.interface.common import BBox, Style
+from qgis_server_light.interface.dispatcher.cache import (
+    STORE_SCRIPT,
+    RenderResultCache,
+    canonical_job_hash,
+    filter_hash,
+    job_etag,
+    style_hash,
+)
+from qgis_server_light.interface.dispatcher.common import Status
+from qgis_server_light.interface.dispatcher.envelope import encode_result
+from qgis_server_light.interface.dispatcher.redis_asio import RedisQueue
+from qgis_server_light.interface.job.common.input import (
+    OgcFilter110,
+    OgcFilterFES20,
+    QslJobLayer,
+)
+from qgis_server_light.interface.job.common.output import JobResult
+from qgis_server_light.interface.job.feature_info.input import (
+    QslJobParameterFeatureInfo,
+)
+from qgis_server_light.interface.job.legend.input import QslJobParameterLegend
+from qgis_server_light.interface.job.render.input import QslJobParameterRender
+from qgis_server_light.interface.job.tile.input import QslJobParameterTile
+
+
+def layer(layer_id="l1", definition="<qml/>"):
+    return QslJobLayer(
+        id=layer_id,
+        name=layer_id,
+        source="data.gpkg",
+        remote=False,
+        folder_name="data",
+        driver="ogr",
+        style=Style(name="default", definition=definition),
+    )
+
+
+def render(layers=None, x_max=1.0):
+    return QslJobParameterRender(
+        layers=layers or [layer()],
+        bbox=BBox(x_min=0.0, x_max=x_max, y_min=0.0, y_max=1.0),
+        crs="EPSG:2056",
+        width=256,
+        height=256,
+    )
+
+
+class CacheClient:
+    def __init__(self):
+        self.stored = {}
+        self.indexes = {}
+
+    def register_script(self, script):
+        async def store(keys, args, client):
+            self.stored[keys[0]] = args[0]
+            return 0
+
+        async def invalidate(keys):
+            entries = self.indexes.pop(keys[0], set())
+            for entry in entries:
+                self.stored.pop(entry, None)
+            return len(entries)
+
+        return store if script == STORE_SCRIPT else invalidate
+
+    def pipeline(self, transaction=True):
+        return CachePipeline(self)
+
+    async def get(self, key):
+        return self.stored.get(key)
+
+    async def exists(self, key):
+        return int(key in self.stored)
+
+
+class CachePipeline:
+    def __init__(self, client):
+        self.client = client
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def set(self, key, value, ex=None):
+        self.client.stored[key] = value
+
+    async def sadd(self, key, value):
+        self.client.indexes.setdefault(key, set()).add(value)
+
+    async def expire(self, key, seconds):
+        pass
+
+    async def execute(self):
+        pass
+
+
+class TestCanonicalJobHash:
+    def test_equal_parameters(self):
+        assert canonical_job_hash(render()) == canonical_job_hash(render())
+
+    def test_different_parameters(self):
+        assert canonical_job_hash(render()) != canonical_job_hash(render(x_max=2.0))
+        assert canonical_job_hash(render()) != canonical_job_hash(
+            render(layers=[layer(definition="<qml></qml>")])
+        )
+
+    def test_job_type_is_part_of_hash(self):
+        assert canonical_job_hash(
+            QslJobParameterLegend(layers=[layer()])
+        ) != canonical_job_hash(QslJobParameterLegend(layers=[layer()], dpi=96))
+        assert canonical_job_hash(render()) != canonical_job_hash(
+            QslJobParameterLegend(layers=[layer()])
+        )
+
+    def test_etag(self):
+        assert job_etag(render()) == f'"{canonical_job_hash(render())}"'
+
+
+class TestRenderResultCache:
+    def test_job_hash(self):
+        cache = RenderResultCache(CacheClient())
+        assert cache.job_hash(render()) == canonical_job_hash(render())
+        assert (
+            cache.job_hash(
+                QslJobParameterFeatureInfo(
+                    INFO_FORMAT="json", QUERY_LAYERS="l1", X="1", Y="1"
+                )
+            )
+            is None
+        )
+
+    def test_tile_sibling_hash(self):
+        cache = RenderResultCache(CacheClient())
+        tile = QslJobParameterTile(layers=[layer()], z=3, x=1, y=2)
+        neighbour = QslJobParameterTile(layers=[layer()], z=3, x=2, y=2)
+        assert cache.job_hash(tile.sibling(2, 2)) == cache.job_hash(neighbour)
+        assert cache.job_hash(tile) != cache.job_hash(neighbour)
+
+    def test_put_and_get(self):
+        cache = RenderResultCache(CacheClient())
+        job_hash = cache.job_hash(render())
+        result = JobResult(id="abc", data=b"png", content_type="image/png")
+
+        async def run():
+            stored = await cache.put(job_hash, render(), result)
+            return stored, await cache.exists(job_hash), await cache.get(job_hash)
+
+        stored, exists, cached = asyncio.run(run())
+        assert stored
+        assert exists
+        assert cached.data == b"png"
+
+    def test_too_big_entry(self):
+        cache = RenderResultCache(CacheClient(), max_entry_size=10)
+        result = JobResult(id="abc", data=b"png" * 10, content_type="image/png")
+        assert not asyncio.run(cache.put("abc", render(), result))
+
+    def test_invalidate(self):
+        client = CacheClient()
+        cache = RenderResultCache(client)
+        result = JobResult(id="abc", data=b"png", content_type="image/png")
+        other = render(layers=[layer("l2", definition="<qml></qml>")])
+
+        async def run():
+            await cache.put(cache.job_hash(render()), render(), result)
+            await cache.put(cache.job_hash(other), other, result)
+            by_layer = await cache.invalidate_layer("l1")
+            by_style = await cache.invalidate_style(other.layers[0].style)
+            return by_layer, by_style
+
+        assert asyncio.run(run()) == (1, 1)
+        assert client.stored == {}
+
+    def test_total_size_is_bounded(self):
+        client = fakeredis.FakeAsyncRedis()
+        result = JobResult(id="abc", data=b"png", content_type="image/png")
+        size = len(encode_result(result))
+        cache = RenderResultCache(client, max_size=2 * size)
+        renders = [render(x_max=float(x)) for x in range(1, 4)]
+
+        async def run():
+            for ttl, job in zip([200, 100, 300], renders):
+                cache.ttl = ttl
+                await cache.put(cache.job_hash(job), job, result)
+            cached = [await cache.exists(cache.job_hash(job)) for job in renders]
+            return cached, int(await client.get(cache.size_name))
+
+        # the entry expiring first is dropped
+        assert asyncio.run(run()) == ([True, False, True], 2 * size)
+
+    def test_entry_bigger_than_budget_is_kept_alone(self):
+        client = fakeredis.FakeAsyncRedis()
+        cache = RenderResultCache(client, max_size=1)
+        result = JobResult(id="abc", data=b"png", content_type="image/png")
+
+        async def run():
+            for job in [render(), render(x_max=2.0)]:
+                await cache.put(cache.job_hash(job), job, result)
+            return [
+                await cache.exists(cache.job_hash(render())),
+                await client.zcard(cache.expiry_index_name),
+            ]
+
+        assert asyncio.run(run()) == [False, 1]
+
+    def test_style_hash(self):
+        assert style_hash(layer().style) == style_hash(layer("l2").style)
+        assert style_hash(layer().style) != style_hash(layer(definition="").style)
+
+    def test_filter_hash(self):
+        compact = OgcFilter110(
+            definition='<Filter xmlns="http://www.opengis.net/ogc">'
+            "<PropertyIsEqualTo><PropertyName>a</PropertyName>"
+            "<Literal>1</Literal></PropertyIsEqualTo></Filter>"
+        )
+        formatted = OgcFilter110(
+            definition="""<ogc:Filter xmlns:ogc="http://www.opengis.net/ogc">
+              <ogc:PropertyIsEqualTo>
+                <ogc:PropertyName>a</ogc:PropertyName>
+                <ogc:Literal>1</ogc:Literal>
+              </ogc:PropertyIsEqualTo>
+            </ogc:Filter>"""
+        )
+        other = OgcFilter110(
+            definition=compact.definition.replace("<Literal>1", "<Literal>2")
+        )
+        assert filter_hash(compact) == filter_hash(formatted)
+        assert filter_hash(compact) != filter_hash(other)
+        assert filter_hash(compact) != filter_hash(
+            OgcFilterFES20(definition=compact.definition)
+        )
+
+    def test_filter_hash_invalid_xml(self):
+        assert filter_hash(OgcFilter110(definition="<Filter>")) == filter_hash(
+            OgcFilter110(definition="<Filter>")
+        )
+
+
+class TestRedisQueueResultCache:
+    def test_cache_hit_is_not_queued(self):
+        client = CacheClient()
+        cache = RenderResultCache(client)
+        client.stored[cache.entry_key(cache.job_hash(render()))] = encode_result(
+            JobResult(id="abc", data=b"png", content_type="image/png")
+        )
+        # any access to the queue would fail, the stub has no pubsub
+        queue = RedisQueue(client, result_cache=cache)
+        result, status = asyncio.run(queue.post(render()))
+        assert status == Status.SUCCESS.value
+        assert result.data == b"png"
+        assert result.id != "abc"
@@ -0,0 +1,64 @@
+from qgis_server_light.interface.dispatcher.common import (
+    LayerInvalidation,
+    ResultReference,
+    Status,
+)
+from tests.base.dataclass_test import DataclassTest
+from tests.base.enum_test import EnumTest
+
+
+class TestStatus(EnumTest):
+    enum_names = {
+        "SUCCESS",
+        "FAILURE",
+        "RUNNING",
+        "QUEUED",
+        "CANCELLED",
+        "EXPIRED",
+    }
+    enum_values = {
+        "succeed",
+        "failed",
+        "running",
+        "queued",
+        "cancelled",
+        "expired",
+    }
+    enum_class_to_test = Status
+
+
+class TestResultReference(DataclassTest):
+    field_defs = [
+        ("id", str),
+        ("status", str),
+        ("key", str),
+        ("size", int),
+        ("shared", bool),
+    ]
+    field_defaults = [
+        ("shared", False),
+    ]
+    dataclass_to_test = ResultReference
+
+    def test_instantiation(self):
+        reference = ResultReference(
+            id="abc", status="succeed", key="result:abc", size=1024
+        )
+        assert reference.id == "abc"
+        assert reference.status == "succeed"
+        assert reference.key == "result:abc"
+        assert reference.size == 1024
+
+
+class TestLayerInvalidation(DataclassTest):
+    field_defs = [
+        ("layers", list[str]),
+        ("paths", list[str]),
+    ]
+    field_default_factories = [("layers", list), ("paths", list)]
+    dataclass_to_test = LayerInvalidation
+
+    def test_instantiation(self):
+        invalidation = LayerInvalidation(layers=["a"], paths=["project/data.gpkg"])
+        assert invalidation.layers == ["a"]
+        assert invalidation.paths == ["project/data.gpkg"]
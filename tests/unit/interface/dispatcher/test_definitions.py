@@ -0,0 +1,128 @@
+import asyncio
+
+import pytest
+
+from qgis_server_light.interface.common import BBox, Style
+from qgis_server_light.interface.dispatcher.cache import style_hash
+from qgis_server_light.interface.dispatcher.definitions import (
+    DefinitionRegistry,
+    definition_key,
+    map_job_layers,
+    source_hash,
+)
+from qgis_server_light.interface.job.common.input import QslJobLayer
+from qgis_server_light.interface.job.render.input import QslJobParameterRender
+
+
+def layer(layer_id="l1", source="data.gpkg|layername=roads"):
+    return QslJobLayer(
+        id=layer_id,
+        name=layer_id,
+        source=source,
+        remote=False,
+        folder_name="data",
+        driver="ogr",
+        style=Style(name="default", definition="<qml/>"),
+    )
+
+
+def render(*layers):
+    return QslJobParameterRender(
+        layers=list(layers),
+        bbox=BBox(x_min=0.0, x_max=1.0, y_min=0.0, y_max=1.0),
+        crs="EPSG:2056",
+        width=256,
+        height=256,
+    )
+
+
+class DefinitionPipeline:
+    def __init__(self):
+        self.stored = []
+
+    async def set(self, key, value, ex=None):
+        self.stored.append((key, value, ex))
+
+
+def externalize(registry, pipeline, job):
+    """Externalizes a job like `RedisQueue.enqueue_many` does, with a
+    pipeline which is executed successfully.
+    """
+    job, written = asyncio.run(registry.externalize(pipeline, job))
+    registry.registered(written)
+    return job
+
+
+def test_map_job_layers_keeps_unchanged():
+    job = render(layer("a"), layer("b"))
+    assert map_job_layers(job, lambda item: item) is job
+    renamed = map_job_layers(
+        job, lambda item: QslJobLayer(**{**item.__dict__, "name": "x"})
+    )
+    assert [item.name for item in renamed.layers] == ["x", "x"]
+    assert [item.name for item in job.layers] == ["a", "b"]
+
+
+def test_externalize():
+    registry = DefinitionRegistry()
+    pipeline = DefinitionPipeline()
+    job = render(layer("a"), layer("b"))
+    externalized = externalize(registry, pipeline, job)
+    first = externalized.layers[0]
+    assert first.source == ""
+    assert first.source_ref == source_hash("data.gpkg|layername=roads")
+    assert first.style == Style(name="default", definition="")
+    assert first.style_ref == style_hash(job.layers[0].style)
+    # both layers share their definitions, which are registered once
+    assert pipeline.stored == [
+        (
+            definition_key("source", first.source_ref),
+            "data.gpkg|layername=roads",
+            86400,
+        ),
+        (definition_key("style", first.style_ref), "<qml/>", 86400),
+    ]
+    # the job itself is not modified
+    assert job.layers[0].source == "data.gpkg|layername=roads"
+    assert job.layers[0].source_ref is None
+
+
+def test_externalize_registers_again_after_interval():
+    pipeline = DefinitionPipeline()
+    registry = DefinitionRegistry()
+    externalize(registry, pipeline, render(layer()))
+    externalize(registry, pipeline, render(layer()))
+    assert len(pipeline.stored) == 2
+    registry.refresh_interval = 0
+    externalize(registry, pipeline, render(layer()))
+    assert len(pipeline.stored) == 4
+
+
+def test_externalize_forgets_least_recently_used():
+    pipeline = DefinitionPipeline()
+    registry = DefinitionRegistry(max_entries=2)
+    externalize(registry, pipeline, render(layer(source="a")))
+    externalize(registry, pipeline, render(layer(source="b")))
+    assert list(registry._registered) == [
+        ("style", style_hash(Style(name="default", definition="<qml/>"))),
+        ("source", source_hash("b")),
+    ]
+    # the forgotten source is written again
+    externalize(registry, pipeline, render(layer(source="a")))
+    assert pipeline.stored[-1][0] == definition_key("source", source_hash("a"))
+
+
+def test_externalize_registers_after_execute_only():
+    pipeline = DefinitionPipeline()
+    registry = DefinitionRegistry()
+    # the pipeline of the first job failed
+    asyncio.run(registry.externalize(pipeline, render(layer())))
+    externalize(registry, pipeline, render(layer()))
+    assert len(pipeline.stored) == 4
+    externalize(registry, pipeline, render(layer()))
+    assert len(pipeline.stored) == 4
+
+
+def test_ttl_exceeds_refresh_interval():
+    with pytest.raises(ValueError):
+        DefinitionRegistry(refresh_interval=60, ttl=60)
@@ -0,0 +1,81 @@
+import pickle
+import struct
+
+import pytest
+
+from qgis_server_light.interface.dispatcher import envelope
+from qgis_server_light.interface.dispatcher.common import ResultReference
+from qgis_server_light.interface.dispatcher.envelope import (
+    HEADER,
+    MAGIC,
+    decode_result,
+    encode_reference,
+    encode_result,
+)
+from qgis_server_light.interface.job.common.output import JobResult, PhaseTiming
+
+
+def result(data=b"png") -> JobResult:
+    return JobResult(
+        id="abc",
+        data=data,
+        content_type="image/png",
+        worker_id="w1",
+        worker_host_name="host",
+        status="succeed",
+        timings=[PhaseTiming(name="render", wall=0.5, cpu=0.25)],
+    )
+
+
+class TestEnvelope:
+    def test_round_trip(self):
+        decoded = decode_result(encode_result(result()))
+        assert decoded == result()
+        assert isinstance(decoded.data, memoryview)
+
+    def test_header(self):
+        envelope = encode_result(result())
+        magic, version, flags, id_length, *_, payload_length = HEADER.unpack_from(
+            envelope
+        )
+        assert (magic, version, flags, id_length) == (MAGIC, 1, 0, 3)
+        assert payload_length == 3
+        assert envelope[-3:] == b"png"
+
+    def test_payload_is_not_copied(self):
+        envelope = bytes(encode_result(result(b"x" * 100000)))
+        decoded = decode_result(envelope)
+        assert decoded.data.obj is envelope
+
+    def test_text_payload(self):
+        error = JobResult(id="abc", data="Layer 'ä' failed", content_type="text")
+        decoded = decode_result(encode_result(error))
+        assert decoded.data == "Layer 'ä' failed"
+        assert decoded.worker_id is None
+        assert decoded.timings is None
+
+    def test_bytearray_payload(self):
+        decoded = decode_result(encode_result(result(bytearray(b"jpg"))))
+        assert decoded.data == b"jpg"
+
+    def test_reference(self):
+        reference = ResultReference(
+            id="abc", status="succeed", key="result:abc", size=10, shared=True
+        )
+        assert decode_result(encode_reference(reference)) == reference
+
+    def test_pickled_result(self, monkeypatch):
+        with pytest.raises(ValueError):
+            decode_result(pickle.dumps(result()))
+        monkeypatch.setattr(envelope, "ACCEPT_PICKLED_RESULTS", True)
+        assert decode_result(pickle.dumps(result())) == result()
+
+    def test_unsupported_version(self):
+        envelope = bytearray(encode_result(result()))
+        struct.pack_into("!B", envelope, len(MAGIC), 2)
+        with pytest.raises(ValueError):
+            decode_result(envelope)
+
+    def test_no_envelope(self):
+        with pytest.raises(ValueError):
+            decode_result(b"png")
@@ -0,0 +1,515 @@
+import asyncio
+
+import pytest
+
+from qgis_server_light.interface.common import BBox
+from qgis_server_light.interface.dispatcher.cache import canonical_job_hash
+from qgis_server_light.interface.dispatcher.common import ResultReference, Status
+from qgis_server_light.interface.dispatcher.envelope import (
+    encode_reference,
+    encode_result,
+)
+from qgis_server_light.interface.dispatcher.redis_asio import RedisQueue
+from qgis_server_light.interface.job.codec import FastJobCodec
+from qgis_server_light.interface.job.common.output import JobResult
+from qgis_server_light.interface.job.render.input import QslJobParameterRender
+from qgis_server_light.interface.job.tile.input import QslJobParameterTile
+
+
+class StoredResultClient:
+    def __init__(self, stored: dict):
+        self.stored = stored
+
+    async def getdel(self, key):
+        return self.stored.pop(key, None)
+
+
+class TestRedisQueueLoadResult:
+    def test_inline_result(self):
+        result = JobResult(id="abc", data=b"png", content_type="image/png")
+        queue = RedisQueue(StoredResultClient({}))
+        loaded = asyncio.run(queue.load_result(encode_result(result)))
+        assert loaded.data == b"png"
+
+    def test_referenced_result(self):
+        result = JobResult(id="abc", data=b"png" * 1000, content_type="image/png")
+        stored = {"result:abc": encode_result(result)}
+        queue = RedisQueue(StoredResultClient(stored))
+        reference = ResultReference(
+            id="abc",
+            status="succeed",
+            key="result:abc",
+            size=len(stored["result:abc"]),
+        )
+        loaded = asyncio.run(queue.load_result(encode_reference(reference)))
+        assert loaded.data == b"png" * 1000
+        assert stored == {}
+
+    def test_expired_reference(self):
+        queue = RedisQueue(StoredResultClient({}))
+        reference = ResultReference(
+            id="abc", status="succeed", key="result:abc", size=10
+        )
+        with pytest.raises(LookupError):
+            asyncio.run(queue.load_result(encode_reference(reference)))
+
+    def test_referenced_envelope(self):
+        result = JobResult(id="abc", data=b"png" * 1000, content_type="image/png")
+        stored = {"result:abc": bytes(encode_result(result))}
+        queue = RedisQueue(StoredResultClient(dict(stored)))
+        reference = ResultReference(
+            id="abc",
+            status="succeed",
+            key="result:abc",
+            size=len(stored["result:abc"]),
+        )
+        loaded = asyncio.run(queue.load_result(bytes(encode_reference(reference))))
+        assert loaded.data == b"png" * 1000
+        assert isinstance(loaded.data, memoryview)
+
+
+class PublishingPubSub:
+    def __init__(self, messages: list):
+        self.messages = messages
+        self.channels = []
+        self.published = asyncio.Event()
+
+    def publish(self, message: bytes):
+        self.messages.append(message)
+        self.published.set()
+
+    async def subscribe(self, channel):
+        self.channels.append(channel)
+
+    async def listen(self):
+        yield {"type": "subscribe", "data": 1}
+        # the subscription stays open like a real one, the workers publish
+        # only after the jobs were queued
+        while True:
+            await self.published.wait()
+            while self.messages:
+                yield {"type": "message", "data": self.messages.pop(0)}
+            self.published.clear()
+
+    async def aclose(self):
+        pass
+
+
+class PublishingClient:
+    def __init__(self, messages: list):
+        self.pubsub_instance = PublishingPubSub(messages)
+
+    def pubsub(self):
+        return self.pubsub_instance
+
+
+class TestRedisQueueListener:
+    def test_results_are_delivered_by_job_id(self):
+        results = [
+            JobResult(id=job_id, data=job_id, content_type="text/plain", status="x")
+            for job_id in ("b", "a")
+        ]
+        client = PublishingClient([encode_result(result) for result in results])
+        queue = RedisQueue(client)
+
+        async def run():
+            await queue.expect_result("a")
+            await queue.expect_result("b")
+            client.pubsub_instance.published.set()
+            received = [await queue.wait_for_result(job_id, 1) for job_id in ("a", "b")]
+            await queue.close()
+            return received
+
+        received = asyncio.run(run())
+        assert [result.data for result, _ in received] == ["a", "b"]
+        assert [status for _, status in received] == ["x", "x"]
+        assert client.pubsub_instance.channels == [queue.result_channel]
+
+    def test_failed_futures_are_retrieved(self):
+        queue = RedisQueue(PublishingClient([]))
+
+        async def run():
+            await queue.expect_result("a")
+            future = queue._pending["a"]
+            await queue.close()
+            return future
+
+        future = asyncio.run(run())
+        assert isinstance(future.exception(), RuntimeError)
+        assert not future._log_traceback
+
+    def test_close_fails_pending(self):
+        queue = RedisQueue(PublishingClient([]))
+
+        async def run():
+            await queue.expect_result("a")
+            await queue.close()
+            await queue.wait_for_result("a", 1)
+
+        with pytest.raises(RuntimeError):
+            asyncio.run(run())
+
+
+class WorkerPipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def hset(self, key, field=None, value=None, mapping=None):
+        self.commands.append(("hset", key))
+
+    async def expire(self, key, seconds):
+        self.commands.append(("expire", key))
+
+    async def rpush(self, name, *values):
+        self.commands.append(("rpush", name, *values))
+
+    async def execute(self):
+        self.client.executed.append(self.commands)
+        for command in self.commands:
+            if command[0] == "rpush":
+                for job_id in command[2:]:
+                    self.client.process(job_id)
+        self.commands = []
+
+
+class WorkerClient(PublishingClient):
+    """Answers every pushed job like a worker would, `failing` jobs are never
+    answered.
+    """
+
+    def __init__(self, failing: int = 0):
+        super().__init__([])
+        self.executed = []
+        self.deleted = []
+        self.failing = failing
+        self.processed = 0
+
+    def pipeline(self):
+        return WorkerPipeline(self)
+
+    def process(self, job_id):
+        self.processed += 1
+        if self.processed <= self.failing:
+            return
+        result = JobResult(
+            id=job_id, data=str(self.processed), content_type="text/plain", status="ok"
+        )
+        self.pubsub_instance.publish(encode_result(result))
+
+    async def delete(self, *keys):
+        self.deleted.extend(keys)
+
+
+class TestRedisQueuePostMany:
+    job_parameters = [
+        QslJobParameterRender(
+            layers=[],
+            bbox=BBox(x_min=0.0, x_max=1.0, y_min=0.0, y_max=1.0),
+            crs="EPSG:2056",
+            width=256,
+            height=256,
+        )
+        for _ in range(3)
+    ]
+
+    def test_one_round_trip(self):
+        client = WorkerClient()
+        queue = RedisQueue(client)
+        results = asyncio.run(queue.post_many(self.job_parameters, to=1))
+        assert [status for _, status in results] == ["ok", "ok", "ok"]
+        assert [result.data for result, _ in results] == ["1", "2", "3"]
+        assert len(client.executed) == 1
+        pushes = [c for c in client.executed[0] if c[0] == "rpush"]
+        assert len(pushes) == 1
+        assert len(pushes[0]) == 5
+        assert len(client.deleted) == 3
+
+    def test_partial_failure(self):
+        client = WorkerClient(failing=1)
+        queue = RedisQueue(client)
+        results = asyncio.run(queue.post_many(self.job_parameters, to=0.2))
+        assert [status for _, status in results] == [
+            Status.FAILURE.value,
+            "ok",
+            "ok",
+        ]
+        assert queue._pending == {}
+        # the timed out job is cancelled and left to expire
+        assert client.executed[-1][-1][0] == "expire"
+        assert len(client.deleted) == 2
+
+    def test_unsupported_job(self):
+        client = WorkerClient()
+        queue = RedisQueue(client)
+        results = asyncio.run(queue.post_many([object(), *self.job_parameters[:1]]))
+        assert [status for _, status in results] == [Status.FAILURE.value, "ok"]
+
+    def test_as_completed(self):
+        client = WorkerClient(failing=1)
+        queue = RedisQueue(client)
+
+        async def run():
+            return [
+                (index, status)
+                async for index, _, status in queue.post_many_as_completed(
+                    self.job_parameters, to=0.2
+                )
+            ]
+
+        assert asyncio.run(run()) == [(1, "ok"), (2, "ok"), (0, Status.FAILURE.value)]
+
+
+class TestRedisQueuePost:
+    job_parameter = TestRedisQueuePostMany.job_parameters[0]
+
+    def test_status_is_written_with_the_job(self):
+        client = WorkerClient()
+        queue = RedisQueue(client)
+        result, status = asyncio.run(queue.post(self.job_parameter, to=1))
+        assert status == "ok"
+        (commands,) = client.executed
+        assert [command[0] for command in commands] == ["hset", "hset", "rpush"]
+
+    def test_follower_renders_when_the_leader_is_skipped(self):
+        client = LeaseClient()
+        queue = RedisQueue(client, coalesce=True)
+        lease_key = f"inflight:{canonical_job_hash(self.job_parameter)}"
+        client.leases[lease_key] = "leader"
+        queue._deliver(
+            "leader",
+            JobResult(
+                id="leader",
+                data="skipped",
+                content_type="text",
+                status=Status.EXPIRED.value,
+            ),
+        )
+
+        async def run():
+            received = await queue.post(self.job_parameter, to=1)
+            await queue.close()
+            return received
+
+        result, status = asyncio.run(run())
+        assert status == "ok"
+        assert client.processed == 1
+
+
+class TestRedisQueueJobMapping:
+    job_parameter = TestRedisQueuePostMany.job_parameters[0]
+
+    def test_default_codec(self):
+        queue = RedisQueue(WorkerClient())
+        job_info = queue.create_job_info("a", self.job_parameter)
+        mapping = queue.job_mapping(job_info)
+        assert mapping[queue.job_info_type_key] == "QslJobInfoRender"
+        assert float(mapping[queue.job_enqueued_key]) > 0
+
+    def test_fast_codec(self):
+        queue = RedisQueue(WorkerClient(), codec=FastJobCodec())
+        job_info = queue.create_job_info("a", self.job_parameter)
+        mapping = queue.job_mapping(job_info, deadline=10.0)
+        assert mapping[queue.job_info_type_key] == "QslJobInfoRender;codec=fast"
+        assert FastJobCodec().decode(mapping[queue.job_info_key], type(job_info)) == (
+            job_info
+        )
+        assert mapping[queue.job_deadline_key] == "10.0"
+
+
+class TestRedisQueueSharedResults:
+    def test_waiters_share_one_result(self):
+        result = JobResult(id="a", data=b"png", content_type="image/png", status="x")
+        client = PublishingClient([encode_result(result)])
+        queue = RedisQueue(client)
+
+        async def run():
+            await queue.expect_result("a")
+            await queue.expect_result("a")
+            client.pubsub_instance.published.set()
+            received = await asyncio.gather(
+                queue.wait_for_result("a", 1), queue.wait_for_result("a", 1)
+            )
+            await queue.close()
+            return received
+
+        received = asyncio.run(run())
+        assert [result.data for result, _ in received] == [b"png", b"png"]
+        assert queue._pending == {}
+
+    def test_early_result_is_kept(self):
+        queue = RedisQueue(PublishingClient([]))
+        result = JobResult(id="a", data=b"png", content_type="image/png", status="x")
+        queue._deliver("a", result)
+
+        async def run():
+            await queue.expect_result("a")
+            received = await queue.wait_for_result("a", 1)
+            await queue.close()
+            return received
+
+        assert asyncio.run(run())[0].data == b"png"
+        assert "a" not in queue._unclaimed
+
+    def test_shared_reference_is_kept(self):
+        result = JobResult(id="abc", data=b"png", content_type="image/png")
+        stored = {"result:abc": encode_result(result)}
+        client = StoredResultClient(stored)
+
+        async def get(key):
+            return stored.get(key)
+
+        client.get = get
+        queue = RedisQueue(client)
+        reference = ResultReference(
+            id="abc", status="succeed", key="result:abc", size=10, shared=True
+        )
+        loaded = asyncio.run(queue.load_result(encode_reference(reference)))
+        assert loaded.data == b"png"
+        assert "result:abc" in stored
+
+
+class InvalidatingClient:
+    def __init__(self):
+        self.published = []
+
+    async def publish(self, channel, message):
+        self.published.append((channel, message))
+        return 3
+
+
+class RecordingResultCache:
+    def __init__(self):
+        self.layers = []
+
+    async def invalidate_layer(self, layer_id):
+        self.layers.append(layer_id)
+        return 1
+
+
+class TestRedisQueueInvalidateLayers:
+    def test_publish(self):
+        client = InvalidatingClient()
+        queue = RedisQueue(client, result_cache=RecordingResultCache())
+        receivers = asyncio.run(
+            queue.invalidate_layers(layers=["a"], paths=["project/data.gpkg"])
+        )
+        assert receivers == 3
+        ((channel, message),) = client.published
+        assert channel == "layer_invalidation"
+        assert '"layers":["a"]' in message.replace(" ", "")
+        assert queue.result_cache.layers == ["a"]
+
+
+class DictResultCache:
+    def __init__(self):
+        self.entries = {}
+
+    def job_hash(self, job_parameter):
+        return canonical_job_hash(job_parameter)
+
+    async def get(self, job_hash):
+        return self.entries.get(job_hash)
+
+    async def put(self, job_hash, job_parameter, result):
+        self.entries[job_hash] = result
+
+
+class LeaseClient(WorkerClient):
+    """Takes leases like the join script does."""
+
+    def __init__(self):
+        super().__init__()
+        self.leases = {}
+
+    def register_script(self, script):
+        async def join(keys, args):
+            return self.leases.setdefault(keys[0], args[0])
+
+        return join
+
+
+class MetatileClient(LeaseClient):
+    """Renders metatiles like a worker, which caches all tiles of it before it
+    publishes the result.
+    """
+
+    def __init__(self, cache: DictResultCache, tiles: list):
+        super().__init__()
+        self.cache = cache
+        self.tiles = tiles
+
+    def process(self, job_id):
+        self.processed += 1
+        for tile in self.tiles:
+            self.cache.entries[canonical_job_hash(tile)] = JobResult(
+                id=job_id,
+                data=f"{tile.x},{tile.y}",
+                content_type="image/png",
+                status=Status.SUCCESS.value,
+            )
+        result = JobResult(
+            id=job_id,
+            data=f"{self.tiles[0].x},{self.tiles[0].y}",
+            content_type="image/png",
+            status=Status.SUCCESS.value,
+        )
+        self.pubsub_instance.publish(encode_result(result))
+
+
+class TestRedisQueueCoalesceTiles:
+    tile = QslJobParameterTile(layers=[], z=3, x=4, y=5)
+
+    def test_tiles_of_one_metatile_have_one_leader(self):
+        tiles = [self.tile.sibling(x, y) for x, y in self.tile.tiles()]
+        cache = DictResultCache()
+        client = MetatileClient(cache, tiles)
+        queue = RedisQueue(client, result_cache=cache, coalesce=True)
+
+        async def run():
+            received = await asyncio.gather(
+                queue.post(tiles[0], to=1), queue.post(tiles[5], to=1)
+            )
+            await queue.close()
+            return received
+
+        received = asyncio.run(run())
+        assert client.processed == 1
+        assert len(client.leases) == 1
+        assert [result.data for result, _ in received] == ["4,4", "5,5"]
+        assert [status for _, status in received] == [Status.SUCCESS.value] * 2
+
+    def test_lease_of_the_metatile(self):
+        cache = DictResultCache()
+        queue = RedisQueue(MetatileClient(cache, []), result_cache=cache, coalesce=True)
+
+        async def run():
+            leases = [
+                await queue.join_in_flight(job_id, tile, None, 1)
+                for job_id, tile in (
+                    ("a", self.tile),
+                    ("b", self.tile.sibling(7, 6)),
+                    ("c", self.tile.sibling(3, 5)),
+                )
+            ]
+            await queue.close()
+            return leases
+
+        (leader_a, lease_a), (leader_b, lease_b), (leader_c, lease_c) = asyncio.run(
+            run()
+        )
+        assert (leader_a, leader_b) == ("a", "a")
+        assert lease_a == lease_b
+        # the tile left of it belongs to another metatile
+        assert leader_c == "c"
+        assert lease_c != lease_a
+
+    def test_without_cache_tiles_are_not_joined(self):
+        queue = RedisQueue(MetatileClient(DictResultCache(), []), coalesce=True)
+        assert queue.coalesced_job(self.tile) is self.tile
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from qgis_server_light.interface.dispatcher.envelope import encode_result
+from qgis_server_light.interface.dispatcher.redis_stream_asio import RedisStreamQueue
+from qgis_server_light.interface.job.common.output import JobResult
+
+
+class ResultStreamClient:
+    def __init__(self, entries: list):
+        self.entries = entries
+        self.deleted = []
+
+    async def xread(self, streams, block):
+        if not self.entries:
+            await asyncio.sleep(block / 1000)
+            return []
+        stream = next(iter(streams))
+        entries, self.entries = self.entries, []
+        return [(stream, entries)]
+
+    async def xdel(self, stream, *entry_ids):
+        self.deleted.extend(entry_ids)
+
+    async def delete(self, *keys):
+        pass
+
+
+class ConnectionPool:
+    def __init__(self, **connection_kwargs):
+        self.connection_kwargs = connection_kwargs
+
+
+def result_entry(entry_id: bytes, job_id: str) -> tuple:
+    result = JobResult(id=job_id, data=b"png", content_type="image/png")
+    return (
+        entry_id,
+        {b"id": job_id.encode(), b"status": b"succeed", b"data": encode_result(result)},
+    )
+
+
+class TestRedisStreamQueueListener:
+    def test_read_results_are_deleted(self):
+        client = ResultStreamClient(
+            [result_entry(b"1-0", "a"), result_entry(b"2-0", "b")]
+        )
+        queue = RedisStreamQueue(client)
+
+        async def run():
+            await queue.expect_result("a")
+            await queue.expect_result("b")
+            received = [await queue.wait_for_result(job_id, 1) for job_id in "ab"]
+            await queue.close()
+            return received
+
+        received = asyncio.run(run())
+        assert [status for _, status in received] == ["succeed", "succeed"]
+        assert client.deleted == [b"1-0", b"2-0"]
+
+    def test_decoding_client_is_rejected(self):
+        client = ResultStreamClient([])
+        client.connection_pool = ConnectionPool(decode_responses=True)
+        with pytest.raises(ValueError):
+            RedisStreamQueue(client)
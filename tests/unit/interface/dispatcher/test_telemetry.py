@@ -0,0 +1,132 @@
+import asyncio
+
+from redis.exceptions import ResponseError
+
+from qgis_server_light.interface.dispatcher.telemetry import (
+    QueueTelemetry,
+    percentile,
+)
+
+
+class RecordingPipeline:
+    def __init__(self, client):
+        self.client = client
+
+    def lpush(self, key, value):
+        self.client.lists.setdefault(key, []).insert(0, value)
+
+    def ltrim(self, key, start, end):
+        self.client.lists[key] = self.client.lists[key][start : end + 1]
+
+    def sadd(self, key, value):
+        self.client.sets.setdefault(key, set()).add(value)
+
+
+class TelemetryPipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    async def lrange(self, key, start, end):
+        self.commands.append(self.client.lists.get(key, []))
+
+    async def hget(self, key, field):
+        self.commands.append(self.client.hashes.get(key, {}).get(field))
+
+    async def execute(self):
+        return self.commands
+
+
+class TelemetryClient:
+    def __init__(self):
+        self.lists = {}
+        self.sets = {}
+        self.hashes = {}
+        self.groups = None
+
+    def pipeline(self, transaction=True):
+        return TelemetryPipeline(self)
+
+    async def smembers(self, key):
+        return {value.encode() for value in self.sets.get(key, set())}
+
+    async def llen(self, key):
+        return len(self.lists.get(key, []))
+
+    async def lindex(self, key, index):
+        values = self.lists.get(key, [])
+        return values[index].encode() if values else None
+
+    async def hget(self, key, field):
+        return self.hashes.get(key, {}).get(field)
+
+    async def xinfo_groups(self, key):
+        if self.groups is None:
+            raise ResponseError("no such key")
+        return self.groups
+
+
+def test_percentile():
+    values = [float(value) for value in range(1, 101)]
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 99) == 99.0
+    assert percentile([3.0], 90) == 3.0
+
+
+class TestQueueTelemetry:
+    def test_record_is_capped(self):
+        client = TelemetryClient()
+        pipeline = RecordingPipeline(client)
+        for _ in range(QueueTelemetry.sample_limit + 5):
+            QueueTelemetry.record(pipeline, "QslJobInfoRender", 0.5, 0.2, now=100.0)
+        samples = client.lists["telemetry:wait:QslJobInfoRender"]
+        assert len(samples) == QueueTelemetry.sample_limit
+        assert samples[0] == "100.0 0.5"
+        assert client.lists["telemetry:service:QslJobInfoRender"][0] == "100.0 0.2"
+        assert client.sets["telemetry:types"] == {"QslJobInfoRender"}
+
+    def test_summarize_only_uses_window(self):
+        telemetry = QueueTelemetry(TelemetryClient(), window=10.0)
+        summary = telemetry.summarize(
+            [b"95.0 1.0", b"99.0 3.0", b"98.0 2.0", b"50.0 100.0"], now=100.0
+        )
+        assert summary == {
+            "count": 3,
+            "p50": 2.0,
+            "p90": 3.0,
+            "p99": 3.0,
+            "mean": 2.0,
+            "max": 3.0,
+        }
+        assert telemetry.summarize([], now=100.0) == {"count": 0}
+
+    def test_snapshot(self):
+        client = TelemetryClient()
+        pipeline = RecordingPipeline(client)
+        QueueTelemetry.record(pipeline, "QslJobInfoRender", 0.5, 0.2)
+        client.lists["jobs"] = ["j2", "j3"]
+        client.hashes["job:j2"] = {"enqueued": b"1.0"}
+        client.sets["workers"] = {"w1", "w2", "dead"}
+        client.hashes["worker:w1"] = {"status": b"processing"}
+        client.hashes["worker:w2"] = {"status": b"waiting"}
+        snapshot = asyncio.run(QueueTelemetry(client).snapshot())
+        assert snapshot["queue_depth"] == 2
+        assert snapshot["oldest_wait"] > 0.0
+        assert snapshot["workers"] == {"active": 2, "busy": 1}
+        render = snapshot["job_types"]["QslJobInfoRender"]
+        assert render["wait"]["p50"] == 0.5
+        assert render["service"]["max"] == 0.2
+
+    def test_stream_queue_depth(self):
+        client = TelemetryClient()
+        telemetry = QueueTelemetry(client, queue_backend="stream")
+        assert asyncio.run(telemetry.queue_depth()) == 0
+        client.groups = [{"name": b"workers", "lag": 7}]
+        assert asyncio.run(telemetry.queue_depth()) == 7
+        assert asyncio.run(telemetry.oldest_wait(0.0)) is None
@@ -81,8 +81,15 @@ class TestQslJobLayer(DataclassTest):
         ("driver", str),
         ("style", Style | None),
         ("filter", OgcFilter110 | OgcFilterFES20 | None),
+        ("source_ref", str | None),
+        ("style_ref", str | None),
+    ]
+    field_defaults = [
+        ("style", None),
+        ("filter", None),
+        ("source_ref", None),
+        ("style_ref", None),
     ]
-    field_defaults = [("style", None), ("filter", None)]
     dataclass_to_test = QslJobLayer
 
     def test_instantiation(self):
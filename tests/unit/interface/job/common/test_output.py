@@ -1,7 +1,7 @@
 from typing import Any
 
 from qgis_server_light.interface.common import BaseInterface
-from qgis_server_light.interface.job.common.output import JobResult
+from qgis_server_light.interface.job.common.output import JobResult, PhaseTiming
 from tests.base.dataclass_test import DataclassTest
 
 
@@ -12,10 +12,14 @@ class TestJobResult(DataclassTest):
         ("content_type", str),
         ("worker_id", str | None),
         ("worker_host_name", str | None),
+        ("status", str | None),
+        ("timings", list[PhaseTiming] | None),
     ]
     field_defaults = [
         ("worker_id", None),
         ("worker_host_name", None),
+        ("status", None),
+        ("timings", None),
     ]
     dataclass_to_test = JobResult
 
@@ -38,3 +42,21 @@ class TestJobResult(DataclassTest):
             content_type="application/pdf",
         )
         assert job_result.shortened_fields == {"data"}
+
+
+class TestPhaseTiming(DataclassTest):
+    field_defs = [
+        ("name", str),
+        ("wall", float),
+        ("cpu", float),
+        ("target", str | None),
+        ("cache_hit", bool | None),
+    ]
+    field_defaults = [
+        ("target", None),
+        ("cache_hit", None),
+    ]
+    dataclass_to_test = PhaseTiming
+
+    def test_super(self):
+        assert issubclass(PhaseTiming, BaseInterface)
@@ -0,0 +1,145 @@
+import pytest
+
+from qgis_server_light.interface.common import BBox, Style
+from qgis_server_light.interface.job.codec import (
+    DEFAULT_CODEC,
+    FastJobCodec,
+    XsdataJsonCodec,
+    codec_by_name,
+    codec_info_type,
+    split_info_type,
+)
+from qgis_server_light.interface.job.common.input import (
+    OgcFilter110,
+    OgcFilterFES20,
+    QslJobLayer,
+)
+from qgis_server_light.interface.job.feature.input import (
+    FeatureQuery,
+    QslJobInfoFeature,
+    QslJobParameterFeature,
+)
+from qgis_server_light.interface.job.feature_info.input import (
+    QslJobInfoFeatureInfo,
+    QslJobParameterFeatureInfo,
+)
+from qgis_server_light.interface.job.legend.input import (
+    QslJobInfoLegend,
+    QslJobParameterLegend,
+)
+from qgis_server_light.interface.job.render.input import (
+    QslJobInfoRender,
+    QslJobParameterRender,
+)
+
+
+def layer(layer_id="l1", layer_filter=None):
+    return QslJobLayer(
+        id=layer_id,
+        name=layer_id,
+        source='{"path": "data.gpkg"}',
+        remote=False,
+        folder_name="data",
+        driver="ogr",
+        style=Style(name="default", definition="eJzLSM3JyVcozy_KSQEAGgQEXQ=="),
+        filter=layer_filter,
+    )
+
+
+def job_infos():
+    return [
+        QslJobInfoRender(
+            id="r",
+            type="render",
+            job=QslJobParameterRender(
+                layers=[layer(), layer("l2", OgcFilter110(definition="<Filter/>"))],
+                bbox=BBox(x_min=0.0, x_max=1.5, y_min=-1.0, y_max=1.0),
+                crs="EPSG:2056",
+                width=256,
+                height=128,
+                dpi=96,
+            ),
+        ),
+        QslJobInfoLegend(
+            id="l", type="legend", job=QslJobParameterLegend(layers=[layer()])
+        ),
+        QslJobInfoFeatureInfo(
+            id="fi",
+            type="feature_info",
+            job=QslJobParameterFeatureInfo(
+                INFO_FORMAT="json", QUERY_LAYERS="l1", X="1", Y="2"
+            ),
+        ),
+        QslJobInfoFeature(
+            id="f",
+            type="feature",
+            job=QslJobParameterFeature(
+                queries=[
+                    FeatureQuery(
+                        layers=[layer()],
+                        aliases=["a"],
+                        filter=OgcFilterFES20(definition="<fes:Filter/>"),
+                    )
+                ],
+                count=10,
+            ),
+        ),
+    ]
+
+
+class TestFastJobCodec:
+    @pytest.mark.parametrize("job_info", job_infos())
+    def test_round_trip(self, job_info):
+        codec = FastJobCodec()
+        data = codec.encode(job_info)
+        # workers read job infos as decoded strings
+        assert codec.decode(data.decode(), type(job_info)) == job_info
+        assert codec.decode(data, type(job_info)) == job_info
+
+    def test_union_keeps_class(self):
+        codec = FastJobCodec()
+        job_info = QslJobInfoRender(
+            id="r",
+            type="render",
+            job=QslJobParameterRender(
+                layers=[layer(layer_filter=OgcFilterFES20(definition="<Filter/>"))],
+                bbox=BBox(x_min=0.0, x_max=1.0, y_min=0.0, y_max=1.0),
+                crs="EPSG:2056",
+                width=1,
+                height=1,
+            ),
+        )
+        decoded = codec.decode(codec.encode(job_info), QslJobInfoRender)
+        assert type(decoded.job.layers[0].filter) is OgcFilterFES20
+
+    def test_decode_validates(self):
+        codec = FastJobCodec()
+        job_info = job_infos()[2]
+        data = codec.encode(job_info).replace(b'"1"', b"null", 1)
+        with pytest.raises(TypeError):
+            codec.decode(data, QslJobInfoFeatureInfo)
+
+    def test_compatible_with_xsdata_content(self):
+        job_info = job_infos()[0]
+        assert FastJobCodec().decode(
+            FastJobCodec().encode(job_info), QslJobInfoRender
+        ) == XsdataJsonCodec().decode(
+            XsdataJsonCodec().encode(job_info), QslJobInfoRender
+        )
+
+
+class TestInfoType:
+    def test_default_codec_is_not_named(self):
+        job_info = job_infos()[0]
+        assert codec_info_type(job_info, DEFAULT_CODEC) == "QslJobInfoRender"
+        assert split_info_type("QslJobInfoRender") == ("QslJobInfoRender", "xsdata")
+
+    def test_named_codec(self):
+        info_type = codec_info_type(job_infos()[0], FastJobCodec())
+        assert info_type == "QslJobInfoRender;codec=fast"
+        assert split_info_type(info_type) == ("QslJobInfoRender", "fast")
+        assert isinstance(codec_by_name("fast"), FastJobCodec)
+
+    def test_unknown_codec(self):
+        with pytest.raises(LookupError):
+            codec_by_name("msgpack")
@@ -0,0 +1,108 @@
+import pytest
+
+from qgis_server_light.interface.common import BBox
+from qgis_server_light.interface.job.common.input import (
+    QslJobInfoParameter,
+    QslJobLayer,
+)
+from qgis_server_light.interface.job.tile.input import (
+    TILE_MATRIX_SETS,
+    QslJobInfoTile,
+    QslJobParameterTile,
+)
+from tests.base.dataclass_test import DataclassTest
+
+HALF = 20037508.3427892
+
+
+class TestQslJobParameterTile(DataclassTest):
+    field_defs = [
+        ("layers", list[QslJobLayer]),
+        ("tile_matrix_set", str),
+        ("z", int),
+        ("x", int),
+        ("y", int),
+        ("metatile", int),
+        ("tile_size", int),
+        ("dpi", int | None),
+        ("format", str),
+    ]
+    field_defaults = [
+        ("tile_matrix_set", "WebMercatorQuad"),
+        ("metatile", 4),
+        ("tile_size", 256),
+        ("dpi", None),
+        ("format", "image/png"),
+    ]
+    dataclass_to_test = QslJobParameterTile
+
+    def test_metatile(self):
+        tile = QslJobParameterTile(layers=[], z=3, x=5, y=2)
+        assert tile.metatile_columns == range(4, 8)
+        assert tile.metatile_rows == range(0, 4)
+        assert len(tile.tiles()) == 16
+        assert (tile.width, tile.height) == (1024, 1024)
+        assert tile.crs == "EPSG:3857"
+        assert tile.bbox == BBox(x_min=0.0, x_max=HALF, y_min=0.0, y_max=HALF)
+
+    def test_metatile_cut_at_matrix_edge(self):
+        tile = QslJobParameterTile(layers=[], z=1, x=1, y=0, metatile=8)
+        assert tile.tiles() == [(0, 0), (1, 0), (0, 1), (1, 1)]
+        assert (tile.width, tile.height) == (512, 512)
+        assert tile.bbox == BBox(x_min=-HALF, x_max=HALF, y_min=-HALF, y_max=HALF)
+
+    def test_tile_bbox(self):
+        tile = QslJobParameterTile(
+            layers=[], tile_matrix_set="WorldCRS84Quad", z=0, x=1, y=0, metatile=1
+        )
+        assert TILE_MATRIX_SETS["WorldCRS84Quad"].crs == "CRS:84"
+        assert tile.tiles() == [(1, 0)]
+        assert tile.tile_bbox(1, 0) == BBox(
+            x_min=0.0, x_max=180.0, y_min=-90.0, y_max=90.0
+        )
+
+    def test_tile_range(self):
+        matrix = TILE_MATRIX_SETS["WebMercatorQuad"]
+        bbox = BBox(x_min=1.0, x_max=HALF / 2 + 1, y_min=-1.0, y_max=HALF)
+        assert matrix.tile_range(bbox, 2) == (range(2, 4), range(0, 3))
+        # the range is cut at the edge of the matrix
+        bbox = BBox(x_min=-2 * HALF, x_max=2 * HALF, y_min=-2 * HALF, y_max=2 * HALF)
+        assert matrix.tile_range(bbox, 1) == (range(0, 2), range(0, 2))
+
+    def test_sibling(self):
+        tile = QslJobParameterTile(layers=[], z=3, x=5, y=2)
+        sibling = tile.sibling(4, 3)
+        assert (sibling.x, sibling.y, sibling.z) == (4, 3, 3)
+        assert sibling.bbox == tile.bbox
+
+    def test_metatile_origin(self):
+        tile = QslJobParameterTile(layers=[], z=3, x=5, y=2)
+        origin = tile.metatile_origin()
+        assert (origin.x, origin.y) == (4, 0)
+        assert origin == tile.sibling(6, 3).metatile_origin()
+
+    @pytest.mark.parametrize(
+        "parameters",
+        [
+            dict(z=1, x=2, y=0),
+            dict(z=1, x=0, y=0, metatile=0),
+            dict(z=1, x=0, y=0, tile_matrix_set="unknown"),
+        ],
+    )
+    def test_invalid(self, parameters):
+        with pytest.raises(ValueError):
+            QslJobParameterTile(layers=[], **parameters)
+
+    def test_get_layer_by_name_raises(self):
+        with pytest.raises(LookupError):
+            QslJobParameterTile(layers=[], z=0, x=0, y=0).get_layer_by_name("roads")
+
+
+class TestQslJobInfoTile(DataclassTest):
+    field_defs = [
+        ("job", QslJobParameterTile),
+    ]
+    dataclass_to_test = QslJobInfoTile
+
+    def test_super(self):
+        assert issubclass(QslJobInfoTile, QslJobInfoParameter)
@@ -0,0 +1,56 @@
+import pytest
+
+from qgis_server_light.worker.runner.context import JobCancelledError, JobContext
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Cancellation:
+    """Answers like `RedisEngine.is_cancelled` and counts the calls."""
+
+    def __init__(self):
+        self.cancelled = False
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.cancelled
+
+
+class TestJobContext:
+    def test_deadline(self):
+        clock = Clock()
+        context = JobContext("/io/data", deadline=1010.0, clock=clock)
+        assert not context.is_cancelled()
+        clock.now = 1011.0
+        assert context.is_cancelled()
+        with pytest.raises(JobCancelledError):
+            context.raise_if_cancelled()
+
+    def test_cancellation_is_polled_at_most_every_interval(self):
+        clock = Clock()
+        cancellation = Cancellation()
+        context = JobContext("/io/data", cancelled=cancellation, clock=clock)
+        assert not context.is_cancelled()
+        cancellation.cancelled = True
+        clock.now += 1.0
+        assert not context.is_cancelled()
+        assert cancellation.calls == 1
+        clock.now += 1.0
+        assert context.is_cancelled()
+        assert cancellation.calls == 2
+
+    def test_cancelled_job_stays_cancelled(self):
+        cancellation = Cancellation()
+        cancellation.cancelled = True
+        context = JobContext("/io/data", cancelled=cancellation, clock=Clock())
+        assert context.is_cancelled()
+        cancellation.cancelled = False
+        assert context.is_cancelled()
+        assert cancellation.calls == 1
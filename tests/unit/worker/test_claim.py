@@ -0,0 +1,194 @@
+import time
+
+import fakeredis
+import pytest
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from qgis_server_light.interface.dispatcher.common import Status
+from qgis_server_light.interface.dispatcher.redis_asio import RedisQueue
+from qgis_server_light.worker.claim import RedisJobClaimer, RedisStreamJobClaimer
+
+
+class ExistsPipeline:
+    def __init__(self, client):
+        self.client = client
+        self.keys = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def exists(self, key):
+        self.keys.append(key)
+
+    def execute(self):
+        return [int(key in self.client.keys) for key in self.keys]
+
+
+class PendingStreamClient:
+    """Has pending entries of the workers `alive` and `dead`, only the first
+    one has a heartbeat.
+    """
+
+    def __init__(self):
+        self.keys = {"worker:alive", "worker:me"}
+        self.pending = [
+            {"message_id": "1-0", "consumer": "alive"},
+            {"message_id": "2-0", "consumer": "dead"},
+            {"message_id": "3-0", "consumer": "dead"},
+            {"message_id": "4-0", "consumer": "me"},
+        ]
+        self.claimed = []
+
+    def register_script(self, script):
+        return None
+
+    def xgroup_create(self, *args, **kwargs):
+        pass
+
+    def xpending_range(self, name, groupname, min, max, count, idle=None):
+        return self.pending
+
+    def pipeline(self, transaction=True):
+        return ExistsPipeline(self)
+
+    def xclaim(self, name, groupname, consumername, min_idle_time, message_ids):
+        self.claimed.extend(message_ids)
+        return [
+            (entry_id, {"id": f"job_{entry_id}", "reply_to": "results:x"})
+            if entry_id != "3-0"
+            else (entry_id, None)
+            for entry_id in message_ids
+        ]
+
+
+class TestRedisStreamJobClaimerReap:
+    def test_only_jobs_of_dead_workers_are_reclaimed(self):
+        client = PendingStreamClient()
+        claimer = RedisStreamJobClaimer(client, "me")
+        assert claimer.reap() == 1
+        assert client.claimed == ["2-0", "3-0"]
+        ((entry_id, claimed),) = claimer._buffer
+        assert (entry_id, claimed.id) == ("2-0", "job_2-0")
+
+    def test_nothing_to_reclaim(self):
+        client = PendingStreamClient()
+        client.keys.add("worker:dead")
+        claimer = RedisStreamJobClaimer(client, "me")
+        assert claimer.reap() == 0
+        assert client.claimed == []
+
+
+@pytest.fixture
+def redis_client():
+    # runs the claim scripts with lupa
+    return fakeredis.FakeRedis(decode_responses=True)
+
+
+def queue_job(client, job_id, **fields):
+    client.hset(
+        f"job:{job_id}",
+        mapping={
+            RedisQueue.job_info_key: "{}",
+            RedisQueue.job_info_type_key: "QslJobInfoRender",
+            RedisQueue.job_status_key: Status.QUEUED.value,
+            RedisQueue.job_reply_to_key: "results:d1",
+            **fields,
+        },
+    )
+    client.rpush(RedisQueue.job_queue_name, job_id)
+
+
+class TestRedisJobClaimer:
+    def test_claim(self, redis_client):
+        queue_job(redis_client, "j1")
+        claimer = RedisJobClaimer(redis_client, "w1")
+        claimed = claimer.claim(1)
+        assert (claimed.id, claimed.info, claimed.reply_to) == (
+            "j1",
+            "{}",
+            "results:d1",
+        )
+        assert claimed.status is None
+        assert redis_client.hget("job:j1", RedisQueue.job_status_key) == "running"
+        assert redis_client.lrange("processing:w1", 0, -1) == ["j1"]
+        assert redis_client.llen(RedisQueue.job_queue_name) == 0
+
+    def test_empty_queue(self, redis_client):
+        assert RedisJobClaimer(redis_client, "w1").claim(1) is None
+
+    def test_cancelled_job_is_skipped(self, redis_client):
+        queue_job(redis_client, "j1", status=Status.CANCELLED.value)
+        claimed = RedisJobClaimer(redis_client, "w1").claim(1)
+        assert (claimed.id, claimed.info, claimed.status) == ("j1", None, "cancelled")
+        assert redis_client.llen("processing:w1") == 0
+
+    def test_expired_job_is_skipped(self, redis_client):
+        queue_job(redis_client, "j1", **{RedisQueue.job_deadline_key: time.time() - 1})
+        claimed = RedisJobClaimer(redis_client, "w1").claim(1)
+        assert (claimed.info, claimed.status) == (None, "expired")
+        assert redis_client.hget("job:j1", RedisQueue.job_status_key) == "expired"
+        assert redis_client.llen("processing:w1") == 0
+
+    def test_failed_mark_is_retried(self, redis_client):
+        queue_job(redis_client, "j1")
+        claimer = RedisJobClaimer(redis_client, "w1")
+        claim_script = claimer._claim_script
+
+        def fail(**kwargs):
+            claimer._claim_script = claim_script
+            raise RedisConnectionError()
+
+        claimer._claim_script = fail
+        with pytest.raises(RedisConnectionError):
+            claimer.claim(1)
+        # the job is not stranded in the processing list
+        assert claimer.claim(1).id == "j1"
+        assert redis_client.lrange("processing:w1", 0, -1) == ["j1"]
+
+    def test_reap(self, redis_client):
+        redis_client.sadd(RedisQueue.worker_set_name, "alive", "dead")
+        redis_client.hset("worker:alive", "status", "processing")
+        redis_client.rpush("processing:alive", "a1")
+        redis_client.rpush("processing:dead", "d1", "d2")
+        redis_client.rpush(RedisQueue.job_queue_name, "q1")
+        assert RedisJobClaimer(redis_client, "me").reap() == 2
+        assert redis_client.lrange(RedisQueue.job_queue_name, 0, -1) == [
+            "d1",
+            "d2",
+            "q1",
+        ]
+        assert redis_client.smembers(RedisQueue.worker_set_name) == {"alive"}
+        assert redis_client.lrange("processing:alive", 0, -1) == ["a1"]
+
+
+class TestRedisStreamJobClaimer:
+    def test_failed_mark_is_retried(self, redis_client):
+        redis_client.hset(
+            "job:j1",
+            mapping={
+                RedisQueue.job_info_key: "{}",
+                RedisQueue.job_info_type_key: "QslJobInfoRender",
+            },
+        )
+        claimer = RedisStreamJobClaimer(redis_client, "w1")
+        claimer._buffer_entries([("1-0", {"id": "j1", "reply_to": "results:d1"})])
+        mark_running_script = claimer._mark_running_script
+
+        def fail(**kwargs):
+            claimer._mark_running_script = mark_running_script
+            raise RedisConnectionError()
+
+        claimer._mark_running_script = fail
+        with pytest.raises(RedisConnectionError):
+            claimer.claim(1)
+        claimed = claimer.claim(1)
+        assert (claimed.id, claimed.info, claimed.reply_to) == (
+            "j1",
+            "{}",
+            "results:d1",
+        )
+        assert claimer._entry_ids == {"j1": "1-0"}
+        assert not claimer._buffer
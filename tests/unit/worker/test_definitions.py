@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+from qgis_server_light.interface.common import BBox, Style
+from qgis_server_light.interface.dispatcher.definitions import DefinitionRegistry
+from qgis_server_light.interface.job.common.input import QslJobLayer
+from qgis_server_light.interface.job.render.input import QslJobParameterRender
+from qgis_server_light.worker.definitions import DefinitionResolver
+
+
+def render(source="data.gpkg|layername=roads"):
+    return QslJobParameterRender(
+        layers=[
+            QslJobLayer(
+                id="roads",
+                name="roads",
+                source=source,
+                remote=False,
+                folder_name="data",
+                driver="ogr",
+                style=Style(name="default", definition="<qml/>"),
+            )
+        ],
+        bbox=BBox(x_min=0.0, x_max=1.0, y_min=0.0, y_max=1.0),
+        crs="EPSG:2056",
+        width=256,
+        height=256,
+    )
+
+
+class DefinitionClient:
+    """Stores what the registry writes, like redis would."""
+
+    def __init__(self):
+        self.values = {}
+        self.round_trips = 0
+
+    async def set(self, key, value, ex=None):
+        self.values[key] = value
+
+    def pipeline(self, transaction=True):
+        return DefinitionPipeline(self)
+
+
+class DefinitionPipeline:
+    def __init__(self, client):
+        self.client = client
+        self.queued = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def get(self, key):
+        self.queued.append(key)
+
+    def execute(self):
+        self.client.round_trips += 1
+        return [self.client.values.get(key) for key in self.queued]
+
+
+def externalize(client, job):
+    return asyncio.run(DefinitionRegistry().externalize(client, job))[0]
+
+
+def test_resolve():
+    client = DefinitionClient()
+    resolver = DefinitionResolver(client)
+    job = render()
+    resolved = resolver.resolve(externalize(client, job))
+    assert resolved == job
+    resolver.resolve(externalize(client, job))
+    assert client.round_trips == 1
+    assert (resolver.hits, resolver.misses) == (2, 2)
+
+
+def test_resolve_inline():
+    job = render()
+    assert DefinitionResolver(DefinitionClient()).resolve(job) is job
+
+
+def test_resolve_unknown():
+    client = DefinitionClient()
+    job = externalize(client, render())
+    with pytest.raises(LookupError):
+        DefinitionResolver(DefinitionClient()).resolve(job)
+
+
+def test_max_entries():
+    client = DefinitionClient()
+    resolver = DefinitionResolver(client, max_entries=1)
+    job = render()
+    # a job needs its definitions, even if they do not fit into memory
+    assert resolver.resolve(externalize(client, job)) == job
+    assert len(resolver._definitions) == 1
+    resolver.resolve(externalize(client, job))
+    assert client.round_trips == 2
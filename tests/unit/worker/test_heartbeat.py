@@ -0,0 +1,116 @@
+from qgis_server_light.interface.worker.info import EngineInfo, QgisInfo, Status
+from qgis_server_light.worker.heartbeat import Heartbeat
+
+
+class RecordingPipeline:
+    def __init__(self, client):
+        self.client = client
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def hset(self, key, mapping):
+        self.client.hashes.setdefault(key, {}).update(mapping)
+        self.client.writes.append(mapping)
+
+    def expire(self, key, seconds):
+        self.client.expires[key] = seconds
+
+    def sadd(self, key, value):
+        self.client.sets.setdefault(key, set()).add(value)
+
+    def execute(self):
+        self.client.round_trips += 1
+
+
+class RecordingClient:
+    def __init__(self):
+        self.hashes = {}
+        self.writes = []
+        self.expires = {}
+        self.sets = {}
+        self.round_trips = 0
+
+    def pipeline(self, transaction=True):
+        return RecordingPipeline(self)
+
+    def expire(self, key, seconds):
+        self.round_trips += 1
+        if key not in self.hashes:
+            return False
+        self.expires[key] = seconds
+        return True
+
+
+class EngineStub:
+    def __init__(self):
+        self.info = EngineInfo(
+            id="w1",
+            qgis_info=QgisInfo(version=34400, version_name="4.0.0", path="/usr"),
+            status=Status.WAITING,
+            started=0.0,
+        )
+        self.info_expire = 300
+        self.current_job_id = None
+        self.worker_details = {"pid": "42"}
+
+    @property
+    def status(self):
+        return self.info.status.value
+
+
+class TestHeartbeat:
+    def test_beat(self):
+        client = RecordingClient()
+        engine = EngineStub()
+        heartbeat = Heartbeat(engine, client, 10)
+        heartbeat.beat()
+        worker = client.hashes["worker:w1"]
+        assert worker["status"] == "waiting"
+        assert worker["job"] == ""
+        assert worker["pid"] == "42"
+        assert "info" in worker
+        assert client.expires["worker:w1"] == 300
+        assert client.sets["workers"] == {"w1"}
+        assert client.round_trips == 1
+
+    def test_info_is_written_on_change_only(self):
+        client = RecordingClient()
+        engine = EngineStub()
+        heartbeat = Heartbeat(engine, client, 10)
+        heartbeat.beat()
+        client.expires.clear()
+        heartbeat.beat()
+        # an unchanged status only renews the expiry
+        assert len(client.writes) == 1
+        assert client.expires["worker:w1"] == 300
+        assert client.round_trips == 2
+        engine.info.status = Status.PROCESSING
+        engine.current_job_id = "job1"
+        heartbeat.beat()
+        assert len(client.writes) == 2
+        assert "info" in client.writes[-1]
+        assert client.writes[-1]["job"] == "job1"
+        assert client.writes[-1]["status"] == "processing"
+
+    def test_expired_hash_is_written_again(self):
+        client = RecordingClient()
+        heartbeat = Heartbeat(EngineStub(), client, 10)
+        heartbeat.beat()
+        del client.hashes["worker:w1"]
+        client.sets.clear()
+        heartbeat.beat()
+        assert len(client.writes) == 2
+        assert client.hashes["worker:w1"]["pid"] == "42"
+        assert client.sets["workers"] == {"w1"}
+
+    def test_thread_stops(self):
+        client = RecordingClient()
+        heartbeat = Heartbeat(EngineStub(), client, 0.01)
+        heartbeat.start()
+        heartbeat.stop()
+        assert not heartbeat.is_alive()
+        assert client.round_trips >= 1
@@ -0,0 +1,126 @@
+import pytest
+from PyQt5.QtGui import QColor, QImage
+
+from qgis_server_light.worker.image_utils import (
+    ENCODERS,
+    encode_image,
+    encode_jpeg,
+    encode_png,
+    encode_webp,
+    parse_format,
+    render_format,
+)
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+JPEG_SIGNATURE = b"\xff\xd8\xff"
+
+
+def image(fmt: str = "image/png") -> QImage:
+    rendered = QImage(16, 16, render_format(fmt))
+    rendered.fill(QColor(255, 0, 0, 128))
+    return rendered
+
+
+class RecordingEncoder:
+    def __init__(self):
+        self.parameters = []
+
+    def __call__(self, image, parameters):
+        self.parameters.append(parameters)
+        return b"encoded"
+
+
+class TestParseFormat:
+    @pytest.mark.parametrize(
+        "fmt, parsed",
+        [
+            ("image/png", ("image/png", {})),
+            ("image/png; mode=8bit", ("image/png", {"mode": "8bit"})),
+            (
+                "image/png;mode=8bit;compression=smallest",
+                ("image/png", {"mode": "8bit", "compression": "smallest"}),
+            ),
+            (" IMAGE/JPEG ; Quality = 85 ", ("image/jpeg", {"quality": "85"})),
+            ("image/webp;", ("image/webp", {})),
+            ("image/png; =8bit", ("image/png", {})),
+        ],
+    )
+    def test_parse(self, fmt, parsed):
+        assert parse_format(fmt) == parsed
+
+
+class TestRenderFormat:
+    @pytest.mark.parametrize(
+        "fmt, pixel_format",
+        [
+            ("image/png", QImage.Format_RGBA8888_Premultiplied),
+            ("image/png; compression=slower", QImage.Format_RGBA8888_Premultiplied),
+            ("image/png; compression=smallest", QImage.Format_ARGB32_Premultiplied),
+            ("image/png; mode=8bit", QImage.Format_ARGB32_Premultiplied),
+            ("image/jpeg; quality=85", QImage.Format_ARGB32_Premultiplied),
+            ("image/webp", QImage.Format_ARGB32_Premultiplied),
+            ("image/gif", QImage.Format_ARGB32_Premultiplied),
+        ],
+    )
+    def test_render_format(self, fmt, pixel_format):
+        assert render_format(fmt) == pixel_format
+
+
+class TestEncodeImage:
+    def test_registered_encoders(self):
+        assert ENCODERS["image/png"] is encode_png
+        assert ENCODERS["image/jpeg"] is encode_jpeg
+        assert ENCODERS["image/webp"] is encode_webp
+
+    @pytest.mark.parametrize("mime_type", ["image/png", "image/jpeg", "image/webp"])
+    def test_dispatch_by_mime_type(self, monkeypatch, mime_type):
+        encoder = RecordingEncoder()
+        monkeypatch.setitem(ENCODERS, mime_type, encoder)
+        encoded = encode_image(image(), f"{mime_type.upper()}; quality=90")
+        assert encoded == (mime_type, b"encoded")
+        assert encoder.parameters == [{"quality": "90"}]
+
+    def test_unknown_format(self):
+        with pytest.raises(RuntimeError):
+            encode_image(image(), "image/gif")
+
+    @pytest.mark.parametrize(
+        "fmt",
+        [
+            "image/png",
+            "image/png; compression=slower",
+            "image/png; compression=smallest",
+            "image/png; mode=8bit",
+        ],
+    )
+    def test_png(self, fmt):
+        mime_type, data = encode_image(image(fmt), fmt)
+        assert mime_type == "image/png"
+        assert bytes(data).startswith(PNG_SIGNATURE)
+
+    def test_png_8bit_is_palette_image(self):
+        _, data = encode_image(image("image/png; mode=8bit"), "image/png; mode=8bit")
+        assert QImage.fromData(bytes(data)).format() == QImage.Format_Indexed8
+
+    def test_unknown_png_compression(self):
+        with pytest.raises(ValueError):
+            encode_image(image(), "image/png; compression=best")
+
+    @pytest.mark.parametrize(
+        "pixel_format",
+        [
+            QImage.Format_ARGB32_Premultiplied,
+            QImage.Format_RGBA8888,
+            QImage.Format_RGB888,
+        ],
+    )
+    def test_jpeg(self, pixel_format):
+        jpeg = image("image/jpeg").convertToFormat(pixel_format)
+        mime_type, data = encode_image(jpeg, "image/jpeg; quality=85")
+        assert mime_type == "image/jpeg"
+        assert bytes(data).startswith(JPEG_SIGNATURE)
+
+    @pytest.mark.parametrize("quality", ["0", "101"])
+    def test_invalid_quality(self, quality):
+        with pytest.raises(ValueError):
+            encode_image(image(), f"image/jpeg; quality={quality}")
@@ -0,0 +1,39 @@
+from qgis_server_light.interface.dispatcher.common import LayerInvalidation
+from qgis_server_light.worker.invalidation import LayerInvalidationListener
+
+
+class RecordingCache:
+    def __init__(self):
+        self.invalidations = []
+
+    def invalidate(self, layers=(), paths=()):
+        self.invalidations.append((list(layers), list(paths)))
+
+
+class TestLayerInvalidationListener:
+    def test_handle(self):
+        cache = RecordingCache()
+        listener = LayerInvalidationListener(cache, None, "/io/data")
+        invalidation = listener.handle(
+            b'{"layers": ["a"], "paths": ["project/data.gpkg", "/mnt/data.tif"]}'
+        )
+        assert invalidation == LayerInvalidation(
+            layers=["a"], paths=["project/data.gpkg", "/mnt/data.tif"]
+        )
+        assert cache.invalidations == [
+            (["a"], ["/io/data/project/data.gpkg", "/mnt/data.tif"])
+        ]
+
+    def test_resubscribes_after_any_error(self):
+        class FailingListener(LayerInvalidationListener):
+            calls = 0
+
+            def listen(self):
+                self.calls += 1
+                if self.calls == 1:
+                    raise ValueError("unexpected")
+                self._stopped.set()
+
+        listener = FailingListener(RecordingCache(), None, "/io/data", 0)
+        listener.run()
+        assert listener.calls == 2
@@ -0,0 +1,194 @@
+import os
+
+import pytest
+
+from qgis_server_light.worker.layer_cache import LayerCache, file_identity
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class Memory:
+    def __init__(self):
+        self.resident = 1000
+
+    def __call__(self):
+        return self.resident
+
+
+def load(cache: LayerCache, key: str, value=None, grow: int = 0, memory=None):
+    """Looks the layer up like `MapRunner._handle_layer_cache` does."""
+    if key in cache:
+        return cache[key]
+    if memory is not None:
+        memory.resident += grow
+    cache[key] = value or key
+    return cache[key]
+
+
+class TestLayerCache:
+    def test_hit_and_miss(self):
+        cache = LayerCache()
+        load(cache, "a")
+        assert load(cache, "a") == "a"
+        assert (cache.hits, cache.misses) == (2, 1)
+        assert len(cache) == 1
+
+    def test_max_entries_lru(self):
+        disposed = []
+        cache = LayerCache(max_entries=2, dispose=disposed.append)
+        load(cache, "a")
+        load(cache, "b")
+        load(cache, "a")
+        load(cache, "c")
+        assert list(cache) == ["a", "c"]
+        assert cache.evictions == 1
+        # evicted layers are only disposed after the job
+        assert disposed == []
+        assert cache.release() == 1
+        assert disposed == ["b"]
+        assert cache.release() == 0
+
+    def test_max_entries_lfu(self):
+        cache = LayerCache(max_entries=2, policy="lfu")
+        load(cache, "a")
+        load(cache, "a")
+        load(cache, "b")
+        load(cache, "b")
+        load(cache, "a")
+        load(cache, "c")
+        assert list(cache) == ["a", "c"]
+
+    def test_max_memory(self):
+        memory = Memory()
+        cache = LayerCache(max_memory=250, memory=memory)
+        load(cache, "a", grow=100, memory=memory)
+        load(cache, "b", grow=100, memory=memory)
+        assert cache.weight == 200
+        load(cache, "c", grow=100, memory=memory)
+        assert list(cache) == ["b", "c"]
+        assert cache.weight == 200
+
+    def test_nested_layers_are_weighed_apart(self):
+        memory = Memory()
+        cache = LayerCache(memory=memory)
+        # a filtered variant derived from the unfiltered layer, which is
+        # loaded into the cache in between
+        assert "a#filter" not in cache
+        memory.resident += 30
+        load(cache, "a", grow=100, memory=memory)
+        memory.resident += 20
+        cache["a#filter"] = "variant"
+        assert cache._entries["a"].weight == 100
+        assert cache._entries["a#filter"].weight == 50
+        assert cache.weight == 150
+
+    def test_oversized_layer_is_kept(self):
+        memory = Memory()
+        cache = LayerCache(max_memory=50, memory=memory)
+        load(cache, "a", grow=100, memory=memory)
+        assert list(cache) == ["a"]
+
+    def test_ttl(self):
+        clock = Clock()
+        cache = LayerCache(ttl=10, clock=clock)
+        load(cache, "a", value="first")
+        clock.now = 11
+        assert load(cache, "a", value="second") == "second"
+        assert cache.evictions == 1
+
+    def test_evict(self):
+        evicted = []
+        cache = LayerCache(on_evict=evicted.append)
+        load(cache, "a")
+        assert cache.evict("a")
+        assert not cache.evict("a")
+        assert evicted == ["a"]
+        with pytest.raises(KeyError):
+            del cache["a"]
+
+    def test_clear(self):
+        cache = LayerCache()
+        load(cache, "a")
+        load(cache, "b")
+        cache.clear()
+        assert len(cache) == 0
+        assert cache.stats()["evictions"] == 2
+
+    def test_unknown_policy(self):
+        with pytest.raises(ValueError):
+            LayerCache(policy="fifo")
+
+
+class TestLayerCacheRevalidation:
+    def cache(self, clock: Clock) -> LayerCache:
+        # the cached values are the paths of the layers
+        return LayerCache(source_path=lambda path: path, clock=clock)
+
+    def test_replaced_file(self, tmp_path):
+        path = str(tmp_path / "data.gpkg")
+        with open(path, "w") as f:
+            f.write("v1")
+        clock = Clock()
+        cache = self.cache(clock)
+        load(cache, "a", value=path)
+        os.replace(self.write(tmp_path, "v2 bigger"), path)
+        # not checked again before the interval passed
+        assert "a" in cache
+        clock.now = 11
+        assert "a" not in cache
+        assert cache.evictions == 1
+
+    def test_unchanged_file(self, tmp_path):
+        path = self.write(tmp_path, "v1")
+        clock = Clock()
+        cache = self.cache(clock)
+        load(cache, "a", value=path)
+        clock.now = 11
+        assert "a" in cache
+
+    def test_no_file(self):
+        clock = Clock()
+        cache = self.cache(clock)
+        load(cache, "a", value="dbname=gis table=roads")
+        clock.now = 11
+        assert "a" in cache
+
+    def test_invalidate(self, tmp_path):
+        cache = self.cache(Clock())
+        data = self.write(tmp_path, "v1", "project/data.gpkg")
+        other = self.write(tmp_path, "v1", "other/data.gpkg")
+        load(cache, "a", value=data)
+        load(cache, "b", value=other)
+        load(cache, "c", value="dbname=gis")
+        cache.invalidate(layers=["c"], paths=[str(tmp_path / "project")])
+        assert list(cache) == ["a", "b", "c"]
+        # invalidations are applied by the thread owning the cache
+        assert cache.release() == 2
+        assert list(cache) == ["b"]
+
+    def test_invalidate_variants(self):
+        cache = LayerCache()
+        load(cache, "a")
+        load(cache, "a#filter:123")
+        load(cache, "ab")
+        cache.invalidate(layers=["a"])
+        cache.release()
+        assert list(cache) == ["ab"]
+
+    def test_file_identity(self, tmp_path):
+        path = self.write(tmp_path, "v1")
+        assert file_identity(path) == file_identity(path)
+        assert file_identity(str(tmp_path / "missing")) is None
+
+    @staticmethod
+    def write(tmp_path, content: str, name: str = "new.gpkg") -> str:
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+        return str(path)
@@ -0,0 +1,122 @@
+import urllib.error
+import urllib.request
+
+import pytest
+
+from qgis_server_light.worker.metrics import (
+    Counter,
+    Histogram,
+    MetricsServer,
+    WorkerMetrics,
+)
+from qgis_server_light.worker.timing import JobTimings
+
+
+def job_timings():
+    timings = JobTimings()
+    with timings.measure("layer", "l1") as timing:
+        timing.cache_hit = True
+    with timings.measure("layer", "l2") as timing:
+        timing.cache_hit = False
+    with timings.measure("style", "l1") as timing:
+        timing.cache_hit = True
+    with timings.measure("encode"):
+        pass
+    return timings
+
+
+class TestCounter:
+    def test_samples(self):
+        counter = Counter("jobs_total", "Jobs.", ("status",))
+        counter.inc("succeed")
+        counter.inc("succeed", amount=2)
+        assert counter.samples((("worker", "w1"),)) == [
+            'jobs_total{worker="w1",status="succeed"} 3.0'
+        ]
+
+    def test_without_labels_starts_at_zero(self):
+        assert Counter("retries_total", "Retries.").samples(()) == ["retries_total 0.0"]
+
+    def test_escaping(self):
+        counter = Counter("jobs_total", "Jobs.", ("runner",))
+        counter.inc('a"b\\c')
+        assert counter.samples(()) == ['jobs_total{runner="a\\"b\\\\c"} 1.0']
+
+
+class TestHistogram:
+    def test_samples(self):
+        histogram = Histogram("duration", "Duration.", buckets=(1.0, 2.0))
+        histogram.observe(0.5)
+        histogram.observe(1.5)
+        histogram.observe(3.0)
+        assert histogram.samples(()) == [
+            'duration_bucket{le="1.0"} 1',
+            'duration_bucket{le="2.0"} 2',
+            'duration_bucket{le="+Inf"} 3',
+            "duration_sum 5.0",
+            "duration_count 3",
+        ]
+
+
+class TestWorkerMetrics:
+    def test_observe_job(self):
+        metrics = WorkerMetrics(layer_cache_size=lambda: 7)
+        metrics.observe_job(
+            "RenderRunner",
+            "image/png",
+            "succeed",
+            0.2,
+            job_timings(),
+            result_size=2000,
+        )
+        metrics.observe_job(
+            "RenderRunner",
+            "text",
+            "failed",
+            0.1,
+            JobTimings(),
+            provider_failure=True,
+        )
+        text = metrics.render()
+        assert (
+            'qsl_worker_jobs_total{runner="RenderRunner",content_type="image/png",'
+            'status="succeed"} 1.0' in text
+        )
+        assert 'qsl_worker_layer_cache_requests_total{result="hit"} 1.0' in text
+        assert 'qsl_worker_layer_cache_requests_total{result="miss"} 1.0' in text
+        assert 'qsl_worker_style_cache_requests_total{result="hit"} 1.0' in text
+        assert 'qsl_worker_encode_seconds_count{format="image/png"} 1' in text
+        assert 'qsl_worker_result_bytes_bucket{format="image/png",le="4096.0"} 1' in (
+            text
+        )
+        assert "qsl_worker_provider_open_failures_total 1.0" in text
+        assert "qsl_worker_layer_cache_size 7.0" in text
+        assert "# TYPE qsl_worker_job_duration_seconds histogram" in text
+
+    def test_count(self):
+        metrics = WorkerMetrics(const_labels={"worker": "w1"})
+        metrics.count(metrics.redis_retries)
+        assert 'qsl_worker_redis_retries_total{worker="w1"} 1.0' in metrics.render()
+
+    def test_write_textfile(self, tmp_path):
+        metrics = WorkerMetrics()
+        path = tmp_path / "worker.prom"
+        metrics.write_textfile(str(path))
+        assert path.read_text() == metrics.render()
+        assert [p.name for p in tmp_path.iterdir()] == ["worker.prom"]
+
+
+class TestMetricsServer:
+    def test_serves_metrics(self):
+        metrics = WorkerMetrics()
+        server = MetricsServer(metrics, 0, "127.0.0.1")
+        server.start()
+        try:
+            url = f"http://127.0.0.1:{server.server.server_address[1]}"
+            with urllib.request.urlopen(f"{url}/metrics") as response:
+                assert response.headers["Content-Type"].startswith("text/plain")
+                assert b"qsl_worker_jobs_total" in response.read()
+            with pytest.raises(urllib.error.HTTPError):
+                urllib.request.urlopen(f"{url}/other")
+        finally:
+            server.stop()
@@ -0,0 +1,122 @@
+import os
+
+import pytest
+
+from qgis_server_light.worker import prefork
+from qgis_server_light.worker.prefork import PreforkSupervisor, exit_code
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class FakeProcesses:
+    """Forks children which exit with `code` after `lifetime` seconds."""
+
+    def __init__(self, clock: FakeClock, code: int = 1, lifetime: float = 0.0):
+        self.clock = clock
+        self.code = code
+        self.lifetime = lifetime
+        self.next_pid = 100
+        self.running: dict[int, float] = {}
+
+    def fork(self):
+        self.next_pid += 1
+        self.running[self.next_pid] = self.clock.now + self.lifetime
+        return self.next_pid
+
+    def waitpid(self, pid, options):
+        if not self.running:
+            raise ChildProcessError()
+        child, end = min(self.running.items(), key=lambda item: item[1])
+        if end > self.clock.now:
+            if options & os.WNOHANG:
+                return 0, 0
+            self.clock.now = end
+        del self.running[child]
+        return child, self.code << 8
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(prefork.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(prefork.time, "sleep", clock.sleep)
+    monkeypatch.setattr(prefork.signal, "signal", lambda *args: None)
+    monkeypatch.setattr(prefork.gc, "freeze", lambda: None)
+    return clock
+
+
+def patch_processes(monkeypatch, processes: FakeProcesses):
+    monkeypatch.setattr(prefork.os, "fork", processes.fork)
+    monkeypatch.setattr(prefork.os, "waitpid", processes.waitpid)
+
+
+@pytest.mark.parametrize(
+    "code,expected", [(None, 0), (0, 0), (3, 3), (404, 1), (-1, 1), ("error", 1)]
+)
+def test_exit_code(code, expected):
+    assert exit_code(code) == expected
+
+
+def test_spawn(clock, monkeypatch):
+    processes = FakeProcesses(clock)
+    patch_processes(monkeypatch, processes)
+    supervisor = PreforkSupervisor(None, "redis://", 2)
+    supervisor._spawn(0)
+    supervisor._spawn(1)
+    assert supervisor.children == {101: 0, 102: 1}
+
+
+def test_restart_delay_backoff():
+    supervisor = PreforkSupervisor(None, "redis://", 1, max_restart_delay=5.0)
+    delays = []
+    for failures in range(1, 6):
+        supervisor.failures[0] = failures
+        delays.append(supervisor.restart_delay_of(0))
+    assert delays == [1.0, 2.0, 4.0, 5.0, 5.0]
+
+
+def test_crash_loop_is_given_up(clock, monkeypatch):
+    processes = FakeProcesses(clock)
+    patch_processes(monkeypatch, processes)
+    supervisor = PreforkSupervisor(None, "redis://", 1, max_failures=3)
+    assert supervisor.run() == 1
+    assert supervisor.given_up == {0}
+    assert supervisor.restarts[0] == 3
+    # the first start and three restarts
+    assert processes.next_pid == 104
+    assert sum(clock.slept) == pytest.approx(1.0 + 2.0 + 4.0)
+
+
+def test_stable_child_resets_backoff(clock, monkeypatch):
+    processes = FakeProcesses(clock, lifetime=120.0)
+    patch_processes(monkeypatch, processes)
+    supervisor = PreforkSupervisor(None, "redis://", 1)
+    supervisor.failures[0] = 4
+    supervisor._spawn(0)
+    supervisor._reap(*processes.waitpid(-1, 0))
+    assert supervisor.failures[0] == 1
+    assert supervisor.scheduled == {0: clock.now + 1.0}
+
+
+def test_shutdown_does_not_restart(clock, monkeypatch):
+    processes = FakeProcesses(clock)
+    patch_processes(monkeypatch, processes)
+    monkeypatch.setattr(prefork.os, "kill", lambda pid, signum: None)
+    supervisor = PreforkSupervisor(None, "redis://", 2)
+    supervisor._spawn(0)
+    supervisor._spawn(1)
+    supervisor.exit_gracefully(15, None)
+    supervisor._reap(*processes.waitpid(-1, 0))
+    assert supervisor.scheduled == {}
+    assert supervisor.children == {102: 1}
@@ -0,0 +1,113 @@
+import json
+
+import pytest
+
+from qgis_server_light.interface.common import BBox, Style
+from qgis_server_light.interface.exporter.extract import (
+    Config,
+    DataSource,
+    Datasets,
+    MetaData,
+    OgrSource,
+    PostgresSource,
+    Project,
+    Service,
+    Tree,
+    Vector,
+)
+from qgis_server_light.worker.seed import (
+    Seeder,
+    SeedStats,
+    find_datasets,
+    job_layer,
+    plan_metatiles,
+)
+from qgis_server_light.worker.tile_store import DirectoryTileStore
+
+HALF = 20037508.3427892
+
+
+def vector(name, source, is_checked=True):
+    return Vector(
+        id=f"{name}_id",
+        name=name,
+        title=name,
+        is_checked=is_checked,
+        source=source,
+        driver="ogr",
+        styles=[Style(name="default", definition="<qml/>")],
+    )
+
+
+def config():
+    return Config(
+        project=Project(version="3.40", name="project"),
+        meta_data=MetaData(
+            service=Service(contact_organization=None, contact_mail=None)
+        ),
+        tree=Tree(),
+        datasets=Datasets(
+            vector=[
+                vector("roads", DataSource(ogr=OgrSource(path="data.gpkg"))),
+                vector(
+                    "parcels",
+                    DataSource(postgres=PostgresSource(key="id", table="parcels")),
+                    is_checked=False,
+                ),
+            ]
+        ),
+    )
+
+
+def test_find_datasets():
+    assert [d.name for d in find_datasets(config())] == ["roads"]
+    assert [d.name for d in find_datasets(config(), ["parcels", "roads"])] == [
+        "parcels",
+        "roads",
+    ]
+    with pytest.raises(LookupError):
+        find_datasets(config(), ["rivers"])
+
+
+def test_job_layer():
+    roads, parcels = config().datasets.vector
+    layer = job_layer(roads, "project")
+    assert json.loads(layer.source) == {"path": "data.gpkg"}
+    assert not layer.remote
+    assert layer.folder_name == "project"
+    assert layer.style == Style(name="default", definition="<qml/>")
+    assert job_layer(parcels, "project").remote
+
+
+def test_plan_metatiles():
+    bbox = BBox(x_min=1.0, x_max=HALF / 2 + 1, y_min=-1.0, y_max=HALF)
+    assert list(plan_metatiles("WebMercatorQuad", bbox, range(0, 4), 2)) == [
+        (0, 0, 0),
+        (1, 0, 0),
+        (2, 2, 0),
+        (2, 2, 2),
+        (3, 4, 0),
+        (3, 6, 0),
+        (3, 4, 2),
+        (3, 6, 2),
+        (3, 4, 4),
+        (3, 6, 4),
+    ]
+
+
+def test_jobs_skip_stored(tmp_path):
+    bbox = BBox(x_min=1.0, x_max=HALF, y_min=1.0, y_max=HALF)
+    seeder = Seeder([], bbox, range(2, 3), metatile=2)
+    store = DirectoryTileStore(str(tmp_path), "WebMercatorQuad", "image/png")
+    for x, y in [(2, 0), (3, 0), (2, 1)]:
+        store.put(2, x, y, b"png")
+    stats = SeedStats()
+    assert [(job.x, job.y) for job in seeder.jobs(store, stats)] == [(2, 0)]
+    store.put(2, 3, 1, b"png")
+    assert list(seeder.jobs(store, stats)) == []
+    assert stats.skipped == 1
+
+
+def test_stats_summary():
+    stats = SeedStats(total=4, rendered=2, skipped=1, tiles=32)
+    assert stats.summary().startswith("3/4 metatiles (2 rendered, 1 skipped, 0 failed)")
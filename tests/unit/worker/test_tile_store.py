@@ -0,0 +1,85 @@
+import sqlite3
+
+import pytest
+
+from qgis_server_light.worker.tile_store import (
+    DirectoryTileStore,
+    GeoPackageTileStore,
+    MBTilesStore,
+    open_tile_store,
+)
+
+
+@pytest.mark.parametrize(
+    "name, store_class",
+    [
+        ("tiles", DirectoryTileStore),
+        ("tiles.mbtiles", MBTilesStore),
+        ("tiles.gpkg", GeoPackageTileStore),
+    ],
+)
+def test_put_and_resume(tmp_path, name, store_class):
+    path = str(tmp_path / name)
+    with open_tile_store(path, "WebMercatorQuad", "image/png") as store:
+        assert isinstance(store, store_class)
+        store.put(3, 1, 2, b"png")
+        assert store.has(3, 1, 2)
+        assert not store.has(3, 2, 1)
+    with open_tile_store(path, "WebMercatorQuad", "image/png") as store:
+        assert store.has(3, 1, 2)
+
+
+def test_directory_layout(tmp_path):
+    with DirectoryTileStore(str(tmp_path), "WebMercatorQuad", "image/jpeg") as store:
+        store.put(3, 1, 2, b"jpg")
+    assert (tmp_path / "3" / "1" / "2.jpg").read_bytes() == b"jpg"
+
+
+def test_mbtiles(tmp_path):
+    path = str(tmp_path / "tiles.mbtiles")
+    with MBTilesStore(path, "WebMercatorQuad", "image/png") as store:
+        store.put(3, 1, 2, b"png")
+        store.put(5, 0, 0, b"png")
+    connection = sqlite3.connect(path)
+    # rows are counted from the bottom
+    assert connection.execute(
+        "SELECT tile_row FROM tiles WHERE zoom_level = 3"
+    ).fetchone() == (5,)
+    metadata = dict(connection.execute("SELECT name, value FROM metadata"))
+    assert metadata == {
+        "name": "tiles",
+        "format": "png",
+        "minzoom": "3",
+        "maxzoom": "5",
+    }
+
+
+def test_mbtiles_web_mercator_only(tmp_path):
+    with pytest.raises(ValueError):
+        MBTilesStore(str(tmp_path / "tiles.mbtiles"), "WorldCRS84Quad", "image/png")
+
+
+def test_geopackage(tmp_path):
+    path = str(tmp_path / "tiles.gpkg")
+    with GeoPackageTileStore(path, "WorldCRS84Quad", "image/png") as store:
+        store.put(1, 3, 1, b"png")
+        store.put(1, 2, 1, b"png")
+    connection = sqlite3.connect(path)
+    assert connection.execute("PRAGMA application_id").fetchone() == (0x47504B47,)
+    assert connection.execute("SELECT srs_id FROM gpkg_contents").fetchone() == (4326,)
+    assert connection.execute(
+        "SELECT matrix_width, matrix_height, pixel_x_size FROM gpkg_tile_matrix"
+    ).fetchall() == [(4, 2, 90 / 256)]
+
+
+def test_unknown_format(tmp_path):
+    with pytest.raises(ValueError):
+        DirectoryTileStore(str(tmp_path), "WebMercatorQuad", "image/tiff")
+
+
+def test_format_parameters(tmp_path):
+    with DirectoryTileStore(
+        str(tmp_path), "WebMercatorQuad", "image/png; mode=8bit"
+    ) as store:
+        store.put(3, 1, 2, b"png")
+    assert (tmp_path / "3" / "1" / "2.png").read_bytes() == b"png"
@@ -0,0 +1,62 @@
+import pytest
+
+from qgis_server_light.worker.timing import JobTimings, measure
+
+
+def test_measure():
+    with measure("render", "l1") as timing:
+        sum(range(10000))
+    assert timing.name == "render"
+    assert timing.target == "l1"
+    assert timing.wall > 0.0
+    assert timing.cpu >= 0.0
+
+
+def test_measure_on_error():
+    with pytest.raises(RuntimeError):
+        with measure("render") as timing:
+            raise RuntimeError()
+    assert timing.wall > 0.0
+
+
+class TestJobTimings:
+    def test_phases_are_recorded_in_order(self):
+        timings = JobTimings()
+        with timings.measure("decode"):
+            pass
+        with timings.measure("layer", "l1") as layer:
+            layer.cache_hit = True
+        assert [timing.name for timing in timings.phases] == ["decode", "layer"]
+        assert "layer[l1]=" in timings.summary()
+
+    def test_job_hash_mapping(self):
+        timings = JobTimings()
+        with timings.measure("decode"):
+            pass
+        with timings.measure("layer", "l1") as layer:
+            layer.cache_hit = False
+        with timings.measure("style", "l1"):
+            pass
+        with timings.measure("fetch"):
+            pass
+        with timings.measure("fetch"):
+            pass
+        mapping = timings.job_hash_mapping()
+        assert set(mapping) == {
+            "timing.decode.wall",
+            "timing.decode.cpu",
+            "timing.layer.l1.wall",
+            "timing.layer.l1.cpu",
+            "timing.layer.l1.cache",
+            "timing.style.l1.wall",
+            "timing.style.l1.cpu",
+            "timing.fetch.wall",
+            "timing.fetch.cpu",
+        }
+        assert mapping["timing.layer.l1.cache"] == "miss"
+        assert float(mapping["timing.fetch.wall"]) == pytest.approx(
+            sum(t.wall for t in timings.phases if t.name == "fetch")
+        )
+
+    def test_empty(self):
+        assert JobTimings().job_hash_mapping() == {}